@@ -9,14 +9,48 @@ Runs the first available formatter by extension:
   .go  → gofmt
   .rs  → rustfmt
 
+Warm backends are tried before the command line for the same tool:
+  black    → blackd over HTTP (AI_TOOLKIT_BLACKD_URL, e.g. http://localhost:45484),
+             then black's Python API when running under hookd.py
+  prettier → prettierd, if installed (a persistent prettier process)
+They are used only when they can honour the project's config; otherwise the
+FORMATTERS command runs as before. ruff and gofmt start fast and have no
+warm mode. Under hookd.py, warm state is dropped after AI_TOOLKIT_FORMAT_IDLE
+seconds unused (default 300).
+
+Formatters are resolved once and remembered in ~/.claude/formatter-discovery.json
+(keyed on PATH and its directories' mtimes), along with their versions.
+Project-local installs win: node_modules/.bin/prettier, .venv/bin/black, …
+
+Files already in formatted form are skipped without running anything: a cache
+in ~/.claude/format-cache.json remembers hashes of (content, formatter,
+formatter version, config files) known to be formatted. LRU-evicted above
+AI_TOOLKIT_FORMAT_CACHE_MAX entries (default 2000; 0 disables the cache).
+
+AI_TOOLKIT_FORMAT_ASYNC=1 (POSIX): enqueue the path and return at once. A
+background worker waits for AI_TOOLKIT_FORMAT_QUIET seconds without new
+edits (default 0.5), de-duplicates the queue and formats it with one
+invocation per formatter (`black a.py b.py`). `auto-format.py --flush`
+formats the queue synchronously; pre-commit.py calls it before `git commit`.
+
 Best-effort: silently skips if no formatter is installed. Always exits 0.
 """
 
+import hashlib
 import json
 import os
 import shutil
 import subprocess
 import sys
+import time
+from pathlib import Path
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows — async mode falls back to formatting inline
+    fcntl = None
 
 
 FORMATTERS = {
@@ -35,35 +69,610 @@ FORMATTERS = {
 }
 
 
-def main():
-    """Run the first available formatter on the file written/edited by Claude."""
-    tool = os.environ.get("CLAUDE_TOOL_NAME", "")
-    if tool not in ("Write", "Edit"):
+# ---------------------------------------------------------------------------
+# Warm backend pool — entries live only in a long-lived process (hookd.py)
+# ---------------------------------------------------------------------------
+
+_POOL = {}  # key -> [value, last_used]
+
+
+def _long_lived() -> bool:
+    hooklib = sys.modules.get("hooklib")
+    return bool(hooklib and getattr(hooklib, "LONG_LIVED", False))
+
+
+def _pool_get(key, factory):
+    """Return a pooled value, creating it on first use; evict entries idle too long."""
+    now = time.monotonic()
+    idle = float(os.environ.get("AI_TOOLKIT_FORMAT_IDLE", "300"))
+    for k in [k for k, (_, used) in _POOL.items() if now - used > idle]:
+        del _POOL[k]
+    if key not in _POOL:
+        _POOL[key] = [factory(), now]
+    _POOL[key][1] = now
+    return _POOL[key][0]
+
+
+# ---------------------------------------------------------------------------
+# black config — warm backends only handle options they can pass through
+# ---------------------------------------------------------------------------
+
+# [tool.black] keys that don't change how one explicitly named file is formatted
+_BLACK_IGNORED = {"include", "exclude", "extend_exclude", "required_version", "quiet", "verbose", "color"}
+_BLACK_SUPPORTED = {"line_length", "skip_string_normalization", "skip_magic_trailing_comma",
+                    "preview", "target_version"}
+
+
+def _find_pyproject(file_path: str) -> "Path | None":
+    """Black's project root rule: the nearest dir with .git, .hg or pyproject.toml."""
+    for d in Path(file_path).resolve().parents:
+        if (d / "pyproject.toml").is_file():
+            return d / "pyproject.toml"
+        if (d / ".git").exists() or (d / ".hg").is_dir():
+            return None
+    return None
+
+
+def _load_black_config(pyproject: "Path | None") -> "dict | None":
+    """Return normalized [tool.black] options, or None if a warm backend can't honour them."""
+    if pyproject is None:
+        return {}
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            return None
+    try:
+        with open(pyproject, "rb") as f:
+            cfg = tomllib.load(f).get("tool", {}).get("black", {})
+    except (OSError, ValueError):
+        return None
+    cfg = {k.replace("-", "_"): v for k, v in cfg.items() if k.replace("-", "_") not in _BLACK_IGNORED}
+    return cfg if set(cfg) <= _BLACK_SUPPORTED else None
+
+
+def _black_config(file_path: str) -> "dict | None":
+    pyproject = _find_pyproject(file_path)
+    if pyproject is None or not _long_lived():
+        return _load_black_config(pyproject)
+    key = ("black-config", str(pyproject), pyproject.stat().st_mtime_ns)
+    return _pool_get(key, lambda: _load_black_config(pyproject))
+
+
+# ---------------------------------------------------------------------------
+# Warm backends — each returns True if it handled the file, False to fall back
+# ---------------------------------------------------------------------------
+
+def _blackd(file_path: str) -> bool:
+    url = os.environ.get("AI_TOOLKIT_BLACKD_URL", "")
+    cfg = _black_config(file_path) if url else None
+    if cfg is None or "target_version" in cfg:
+        return False
+    import urllib.error  # ~20ms; only blackd users pay for it
+    import urllib.request
+    headers = {"X-Line-Length": str(cfg.get("line_length", 88))}
+    for key, header in (("skip_string_normalization", "X-Skip-String-Normalization"),
+                        ("skip_magic_trailing_comma", "X-Skip-Magic-Trailing-Comma"),
+                        ("preview", "X-Preview")):
+        if cfg.get(key):
+            headers[header] = "1"
+    try:
+        src = Path(file_path).read_bytes()
+        req = urllib.request.Request(url, data=src, headers=headers, method="POST")
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            if resp.status == 200:
+                Path(file_path).write_bytes(resp.read())
+            return resp.status in (200, 204)  # 204: already formatted
+    except (urllib.error.URLError, OSError, ValueError):
+        return False
+
+
+def _import_black():
+    try:
+        import black
+        return black
+    except ImportError:
+        return None
+
+
+def _black_api(file_path: str) -> bool:
+    if not _long_lived():
+        return False  # importing black costs as much as running it once
+    black = _pool_get("black-module", _import_black)
+    cfg = _black_config(file_path) if black else None
+    if cfg is None:
+        return False
+    try:
+        mode = black.Mode(
+            target_versions={black.TargetVersion[v.upper()] for v in cfg.get("target_version", [])},
+            line_length=cfg.get("line_length", 88),
+            string_normalization=not cfg.get("skip_string_normalization", False),
+            magic_trailing_comma=not cfg.get("skip_magic_trailing_comma", False),
+            preview=cfg.get("preview", False),
+        )
+        path = Path(file_path)
+        src = path.read_text(encoding="utf-8")
+        try:
+            path.write_text(black.format_file_contents(src, fast=False, mode=mode), encoding="utf-8")
+        except black.NothingChanged:
+            pass
+        return True
+    except Exception:
+        return False  # syntax error, unknown option value, … — let the CLI report it
+
+
+def _prettierd(file_path: str) -> bool:
+    exe = _which("prettierd", file_path)
+    if not exe:
+        return False
+    try:
+        src = Path(file_path).read_text(encoding="utf-8")
+        r = subprocess.run([exe, file_path], input=src, capture_output=True,
+                           text=True, encoding="utf-8", timeout=30)
+        if r.returncode != 0 or not r.stdout:
+            return False
+        if r.stdout != src:
+            Path(file_path).write_text(r.stdout, encoding="utf-8")
+        return True
+    except (subprocess.TimeoutExpired, OSError, UnicodeError):
+        return False
+
+
+# Tried in order before the FORMATTERS command of the same name
+WARM_BACKENDS = {
+    "black": [_blackd, _black_api],
+    "prettier": [_prettierd],
+}
+
+
+# ---------------------------------------------------------------------------
+# Formatter discovery — cached paths and versions instead of shutil.which per call
+# ---------------------------------------------------------------------------
+
+# Project-local install dirs, searched from the file's dir up to the repo root
+PROJECT_BINS = {
+    "prettier": ["node_modules/.bin"],
+    "black": [".venv/bin", "venv/bin", ".venv/Scripts", "venv/Scripts"],
+    "ruff": [".venv/bin", "venv/bin", ".venv/Scripts", "venv/Scripts"],
+}
+
+# How to ask for a version; None = no flag (identified by path + mtime instead)
+VERSION_ARGS = {"gofmt": None}
+
+_DISCOVERY = {"mtime": None, "data": None}
+
+
+def _discovery_file() -> Path:
+    return Path.home() / ".claude" / "formatter-discovery.json"
+
+
+def _path_key() -> str:
+    """Fingerprint of PATH and its directories' mtimes (changes when tools are (un)installed)."""
+    path_env = os.environ.get("PATH", "")
+    h = hashlib.sha256(path_env.encode())
+    for d in path_env.split(os.pathsep):
+        try:
+            h.update(b"%d" % os.stat(d).st_mtime_ns)
+        except OSError:
+            h.update(b"-")
+    return h.hexdigest()
+
+
+def _discovery() -> dict:
+    """Load {"key", "tools": {name: path|None}, "versions": {path: [mtime, version]}}."""
+    path = _discovery_file()
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        mtime = None
+    if mtime is None or _DISCOVERY["mtime"] != mtime:
+        try:
+            data = json.loads(path.read_text()) if mtime else {}
+        except (OSError, ValueError):
+            data = {}
+        _DISCOVERY.update(mtime=mtime, data=data if isinstance(data, dict) else {})
+    data = _DISCOVERY["data"]
+    key = _path_key()
+    if data.get("key") != key:
+        # PATH changed — resolved tools are stale, versions (keyed by binary mtime) are not
+        data.update(key=key, tools={})
+    data.setdefault("tools", {})
+    data.setdefault("versions", {})
+    return data
+
+
+def _discovery_save(data: dict):
+    path = _discovery_file()
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, path)
+        _DISCOVERY.update(mtime=path.stat().st_mtime_ns, data=data)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+
+
+def _project_local(name: str, file_path: str) -> "str | None":
+    for d in Path(file_path).resolve().parents:
+        for rel in PROJECT_BINS.get(name, []):
+            if (d / rel).is_dir():
+                found = shutil.which(name, path=str(d / rel))
+                if found:
+                    return found
+        if (d / ".git").exists():
+            break
+    return None
+
+
+def _which(name: str, file_path: str) -> "str | None":
+    """Resolve a formatter: project-local binary first, then the cached PATH lookup."""
+    local = _project_local(name, file_path) if name in PROJECT_BINS else None
+    if local:
+        return local
+    data = _discovery()
+    if name not in data["tools"]:
+        data["tools"][name] = shutil.which(name)
+        _discovery_save(data)
+    return data["tools"][name]
+
+
+def _formatter_version(name: str, found: "str | None") -> str:
+    """Version string for a resolved binary, probed once per binary mtime."""
+    if not found:
+        return "-"
+    try:
+        mtime = os.stat(found).st_mtime_ns
+    except OSError:
+        return found
+    data = _discovery()
+    cached = data["versions"].get(found)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    version = f"{found}@{mtime}"
+    args = VERSION_ARGS.get(name, ["--version"])
+    if args is not None:
+        try:
+            r = subprocess.run([found, *args], capture_output=True, text=True, timeout=10)
+            out = (r.stdout or r.stderr).strip().splitlines()
+            if r.returncode == 0 and out:
+                version = out[0]
+        except (subprocess.TimeoutExpired, OSError):
+            pass
+    data["versions"][found] = [mtime, version]
+    _discovery_save(data)
+    return version
+
+
+# ---------------------------------------------------------------------------
+# "Already formatted" cache
+# ---------------------------------------------------------------------------
+
+# Config files that change a formatter's output, looked up from the file's dir upward
+CONFIG_FILES = {
+    "black": ["pyproject.toml"],
+    "ruff": ["ruff.toml", ".ruff.toml", "pyproject.toml"],
+    "prettier": [".prettierrc", ".prettierrc.json", ".prettierrc.yaml", ".prettierrc.yml",
+                 ".prettierrc.json5", ".prettierrc.toml", ".prettierrc.js", ".prettierrc.cjs",
+                 ".prettierrc.mjs", "prettier.config.js", "prettier.config.cjs",
+                 "prettier.config.mjs", "package.json", ".editorconfig"],
+    "rustfmt": ["rustfmt.toml", ".rustfmt.toml"],
+}
+
+# Refresh an entry's last-used time on a hit only when it is this stale, so
+# hot entries don't cost a cache write per edit
+_TOUCH_AFTER = 3600
+
+_CACHE = {"mtime": None, "entries": {}}
+
+
+def _cache_file() -> Path:
+    return Path.home() / ".claude" / "format-cache.json"
+
+
+def _cache_max() -> int:
+    try:
+        return int(os.environ.get("AI_TOOLKIT_FORMAT_CACHE_MAX", "2000"))
+    except ValueError:
+        return 2000
+
+
+def _cache_entries() -> dict:
+    """Load {key: last_used} — reused in a long-lived process until the file changes."""
+    path = _cache_file()
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        return {}
+    if _CACHE["mtime"] != mtime:
+        try:
+            entries = json.loads(path.read_text())
+        except (OSError, ValueError):
+            entries = {}
+        _CACHE.update(mtime=mtime, entries=entries if isinstance(entries, dict) else {})
+    return _CACHE["entries"]
+
+
+def _cache_store(entries: dict):
+    """Write entries atomically, keeping only the most recently used."""
+    limit = _cache_max()
+    if len(entries) > limit:
+        entries = dict(sorted(entries.items(), key=lambda kv: kv[1])[-limit:])
+    path = _cache_file()
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_text(json.dumps(entries))
+        os.replace(tmp, path)
+        _CACHE.update(mtime=path.stat().st_mtime_ns, entries=entries)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+
+
+def _config_hash(file_path: str, name: str) -> str:
+    """Hash the nearest config files for this formatter (stops at the repo root)."""
+    names = CONFIG_FILES.get(name, [])
+    h = hashlib.sha256()
+    for d in Path(file_path).resolve().parents:
+        found = [d / n for n in names if (d / n).is_file()]
+        for cfg in found:
+            try:
+                h.update(str(cfg).encode() + b"\0" + cfg.read_bytes())
+            except OSError:
+                pass
+        if found or (d / ".git").exists():
+            break
+    return h.hexdigest()
+
+
+def _cache_key(file_path: str, name: str, found: "str | None") -> "str | None":
+    try:
+        content = hashlib.sha256(Path(file_path).read_bytes()).hexdigest()
+    except OSError:
+        return None
+    ident = "\0".join((content, name, _formatter_version(name, found), _config_hash(file_path, name)))
+    return hashlib.sha256(ident.encode()).hexdigest()[:32]
+
+
+def _cache_hit(file_path: str, name: str, found: "str | None") -> bool:
+    with metrics.span("auto-format", "cache", name):
+        key = _cache_key(file_path, name, found)
+        entries = _cache_entries()
+        last_used = entries.get(key) if key else None
+    if last_used is None:
+        return False
+    if time.time() - last_used > _TOUCH_AFTER:
+        _cache_store(dict(entries, **{key: time.time()}))
+    return True
+
+
+def _cache_mark(file_path: str, name: str, found: "str | None"):
+    """Record the file's current (formatted) content, so the next unchanged edit hits."""
+    key = _cache_key(file_path, name, found)
+    if key:
+        _cache_store(dict(_cache_entries(), **{key: time.time()}))
+
+
+def _run_formatter(cmd_prefix: list, found: str, paths: list) -> bool:
+    with metrics.span("auto-format", "formatter", cmd_prefix[0]):
+        try:
+            r = subprocess.run([found, *cmd_prefix[1:], *paths], capture_output=True, timeout=30)
+            return r.returncode == 0
+        except (subprocess.TimeoutExpired, OSError):
+            return False
+
+
+def _format_file(file_path: str, batch: "dict | None" = None):
+    """Format one file with the first available formatter for its extension.
+
+    With `batch`, command-line runs are deferred: the path is added to
+    batch[(cmd_prefix, found)] so one invocation can format many files.
+    """
+    ext = file_path.rsplit(".", 1)[-1] if "." in file_path else ""
+    use_cache = _cache_max() > 0
+    for cmd_prefix in FORMATTERS.get(ext, []):
+        name = cmd_prefix[0]
+        with metrics.span("auto-format", "lookup", name):
+            found = _which(name, file_path)
+        if not found and name not in WARM_BACKENDS:
+            continue
+        if use_cache and _cache_hit(file_path, name, found):
+            return
+        for backend in WARM_BACKENDS.get(name, []):
+            with metrics.span("auto-format", "formatter", backend.__name__.lstrip("_")):
+                handled = backend(file_path)
+            if handled:
+                if use_cache:
+                    _cache_mark(file_path, name, found)
+                return
+        if not found:
+            continue
+        if batch is not None:
+            batch.setdefault((tuple(cmd_prefix), found), []).append(file_path)
+        elif _run_formatter(cmd_prefix, found, [file_path]) and use_cache:
+            _cache_mark(file_path, name, found)
+        return
+
+
+def _format_batch(paths: list):
+    """Format many files with one formatter invocation per command."""
+    batch = {}
+    for path in paths:
+        if os.path.isfile(path):
+            _format_file(path, batch)
+    for (cmd_prefix, found), group in batch.items():
+        if _run_formatter(list(cmd_prefix), found, group) and _cache_max() > 0:
+            for path in group:
+                _cache_mark(path, cmd_prefix[0], found)
+
+
+# ---------------------------------------------------------------------------
+# Async mode — enqueue and return; a background worker formats in batches
+# ---------------------------------------------------------------------------
+
+def _queue_dir() -> Path:
+    return Path.home() / ".claude" / "format-queue"
+
+
+def _quiet_window() -> float:
+    try:
+        return float(os.environ.get("AI_TOOLKIT_FORMAT_QUIET", "0.5"))
+    except ValueError:
+        return 0.5
+
+
+def _locked(path: Path, blocking: bool = True, timeout: float = 60):
+    """Open and flock `path`; return the open file.
+
+    Non-blocking, returns None if the lock is held; blocking, raises
+    TimeoutError after `timeout` seconds.
+    """
+    f = open(path, "a")
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return f
+        except OSError:
+            if not blocking or time.monotonic() > deadline:
+                f.close()
+                if blocking:
+                    raise TimeoutError(f"could not lock {path}") from None
+                return None
+            time.sleep(0.05)
+
+
+def _batch_lock(qdir: Path):
+    """The lock serializing batches with flushes, or None if it's stuck (format anyway)."""
+    try:
+        return _locked(qdir / "batch.lock")
+    except TimeoutError:
+        return None
+
+
+def _enqueue(file_path: str):
+    qdir = _queue_dir()
+    qdir.mkdir(parents=True, exist_ok=True)
+    with _locked(qdir / "queue.lock"):
+        with open(qdir / "pending", "a") as f:
+            f.write(os.path.abspath(file_path) + "\n")
+
+
+def _take_queue() -> list:
+    """Atomically claim all pending paths, de-duplicated in first-seen order."""
+    qdir = _queue_dir()
+    try:
+        with _locked(qdir / "queue.lock"):
+            text = (qdir / "pending").read_text()
+            (qdir / "pending").unlink()
+    except OSError:
+        return []
+    return list(dict.fromkeys(p for p in text.splitlines() if p))
+
+
+def _start_worker():
+    """Spawn the worker unless one already holds its lock."""
+    probe = _locked(_queue_dir() / "worker.lock", blocking=False)
+    if probe is None:
+        return  # running
+    probe.close()
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker"],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+def worker(idle_exit: float = 30):
+    """Wait for a quiet window after the last enqueue, then format the batch."""
+    qdir = _queue_dir()
+    qdir.mkdir(parents=True, exist_ok=True)
+    lock = _locked(qdir / "worker.lock", blocking=False)
+    if lock is None:
         return 0
+    quiet, last_work = _quiet_window(), time.monotonic()
+    with lock:
+        while True:
+            try:
+                age = time.time() - (qdir / "pending").stat().st_mtime
+            except FileNotFoundError:
+                if time.monotonic() - last_work > idle_exit or not qdir.is_dir():
+                    return 0  # idle, or the queue was removed under us
+                time.sleep(min(quiet, 1.0))
+                continue
+            if age < quiet:
+                time.sleep(min(quiet - age, 1.0))
+                continue
+            paths = _take_queue()
+            batch_lock = _batch_lock(qdir)
+            try:
+                _format_batch(paths)
+            finally:
+                if batch_lock:
+                    batch_lock.close()
+            last_work = time.monotonic()
 
+
+def flush_queue():
+    """Format everything queued now, after any batch the worker has in flight."""
+    qdir = _queue_dir()
+    if not fcntl or not qdir.is_dir():
+        return
+    paths = _take_queue()
+    batch_lock = _batch_lock(qdir)
     try:
-        data = json.load(sys.stdin)
-    except (json.JSONDecodeError, ValueError):
+        _format_batch(paths)
+    finally:
+        if batch_lock:
+            batch_lock.close()
+
+
+def run(tool: str, data: dict) -> int:
+    """Run the first available formatter on the file written/edited by Claude."""
+    if tool not in ("Write", "Edit"):
         return 0
 
     file_path = data.get("file_path", "")
     if not file_path or not os.path.isfile(file_path):
         return 0
 
-    ext = file_path.rsplit(".", 1)[-1] if "." in file_path else ""
-    candidates = FORMATTERS.get(ext, [])
-
-    for cmd_prefix in candidates:
-        if shutil.which(cmd_prefix[0]):
-            try:
-                subprocess.run(cmd_prefix + [file_path],
-                               capture_output=True, timeout=30)
-            except (subprocess.TimeoutExpired, OSError):
-                pass
-            break
+    if os.environ.get("AI_TOOLKIT_FORMAT_ASYNC") == "1" and fcntl:
+        ext = file_path.rsplit(".", 1)[-1] if "." in file_path else ""
+        if ext not in FORMATTERS:
+            return 0
+        try:
+            with metrics.span("auto-format", "enqueue"):
+                _enqueue(file_path)
+                _start_worker()
+            return 0
+        except TimeoutError:
+            pass  # queue lock stuck — format inline instead
 
+    _format_file(file_path)
     return 0
 
 
+def main():
+    """Read the tool call from env + stdin and format the file.
+
+    Also `auto-format.py --flush` (drain the async queue now) and `--worker`.
+    """
+    if sys.argv[1:] == ["--flush"]:
+        flush_queue()
+        return 0
+    if sys.argv[1:] == ["--worker"]:
+        return worker()
+
+    tool = os.environ.get("CLAUDE_TOOL_NAME", "")
+    if tool not in ("Write", "Edit"):
+        return 0
+
+    with metrics.span("auto-format", "parse"):
+        try:
+            data = json.load(sys.stdin)
+        except (json.JSONDecodeError, ValueError):
+            return 0
+    with metrics.span("auto-format", "total"):
+        return run(tool, data)
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Run every toolkit hook registered for one event in a single process.
+
+Hook type: PreToolUse / PostToolUse (all tools) — usage: dispatch.py <Event>
+
+Reads stdin once, picks the hooks for <Event> from the environment.md Hooks
+table whose matcher fits CLAUDE_TOOL_NAME, and calls each hook's run() in
+table order. Stops at the first block (exit 2). Other failures are reported
+but don't stop the remaining hooks.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import traceback
+from pathlib import Path
+
+import hooklib
+import metrics
+
+MANIFEST = hooklib.HOOKS_DIR.parent / "environment.md"
+SETUP_PY = hooklib.HOOKS_DIR.parent / "setup.py"
+
+# Must match setup.py's _MANIFEST_CACHE_VERSION; any other version is a miss
+_CACHE_VERSION = 2
+
+# cache file -> ((size, mtime_ns), stats, hook rows): the cache JSON parsed
+# once per process, so hookd only stats the sources on each call
+_CACHED = {}
+_CACHE_FILES = {}  # (manifest, home) -> cache file; resolve() costs more than the lookup
+_SETUP = []  # the toolkit's setup.py as a module, imported on the first miss
+
+
+def _cache_file(manifest: Path) -> Path:
+    """setup.py's cache file for this manifest (see its _manifest_cache)."""
+    home = os.path.expanduser("~")
+    path = _CACHE_FILES.get((manifest, home))
+    if path is None:
+        key = hashlib.sha256(str(manifest.resolve()).encode()).hexdigest()
+        path = _CACHE_FILES[manifest, home] = Path(home, ".claude", ".ai-toolkit-manifest-cache", f"{key}.json")
+    return path
+
+
+def _cached_rows(manifest: Path) -> "list | None":
+    """Hooks rows from setup.py's manifest cache if no source's size or mtime moved."""
+    cache = _cache_file(manifest)
+    try:
+        st = cache.stat()
+        stamp = (st.st_size, st.st_mtime_ns)
+        entry = _CACHED.get(cache)
+        if entry is None or entry[0] != stamp:
+            blob = json.loads(cache.read_bytes())
+            if blob.get("version") != _CACHE_VERSION:
+                return None
+            data = blob["manifest"]
+            entry = _CACHED[cache] = (stamp, data["stats"], data["hooks"])
+        for path, (size, mtime) in entry[1].items():
+            st = os.stat(path)
+            if st.st_size != size or st.st_mtime_ns != mtime:
+                return None
+        return entry[2]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _load_setup():
+    """Import the toolkit's setup.py (about 40 ms) — only needed to rebuild the cache."""
+    if not _SETUP:
+        import importlib.util
+        spec = importlib.util.spec_from_file_location("ai_toolkit_setup", SETUP_PY)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _SETUP.append(module)
+    return _SETUP[0]
+
+
+def hook_table(manifest: Path = MANIFEST) -> list:
+    """Return [(file, event, matcher_or_None), ...] for installed hooks, in table order.
+
+    Rows come from the cache setup.py keeps under ~/.claude; when it is
+    missing or stale, setup.load_manifest reparses and rewrites it.
+    """
+    rows = _cached_rows(manifest)
+    if rows is None:
+        rows = _load_setup().load_manifest(manifest).to_json()["hooks"]
+    return [(name, event, matcher) for name, install, event, matcher in rows if install]
+
+
+def hooks_for(event: str, tool: str, manifest: Path = MANIFEST) -> list:
+    """Return hook file names to run for this event and tool."""
+    return [name for name, ev, matcher in hook_table(manifest)
+            if ev == event and (matcher is None or re.fullmatch(matcher, tool))]
+
+
+def dispatch(event: str, tool: str, data: dict) -> int:
+    """Run matching hooks in order; return 2 on the first block, else the first error code."""
+    result = 0
+    for name in hooks_for(event, tool):
+        try:
+            with metrics.span("dispatch", "hook", name):
+                code = hooklib.load_hook(name).run(tool, data)
+        except Exception:
+            print(f"dispatch: {name} failed", file=sys.stderr)
+            traceback.print_exc()
+            code = 1
+        if code == 2:
+            return 2
+        if code and not result:
+            result = code
+    return result
+
+
+def main():
+    """Entry point: `dispatch.py <Event>` with the tool call on stdin."""
+    if len(sys.argv) != 2:
+        print("usage: dispatch.py <PreToolUse|PostToolUse>", file=sys.stderr)
+        return 1
+    for path in (MANIFEST, SETUP_PY):
+        if not path.is_file():
+            print(f"dispatch: not found: {path}", file=sys.stderr)
+            return 1
+
+    with metrics.span("dispatch", "parse"):
+        try:
+            data = json.load(sys.stdin)
+        except (json.JSONDecodeError, ValueError):
+            data = {}
+    if not isinstance(data, dict):
+        data = {}
+    return dispatch(sys.argv[1], os.environ.get("CLAUDE_TOOL_NAME", ""), data)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
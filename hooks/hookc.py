@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Client shim — forward a hook call to hookd.py instead of running it cold.
+
+Usage (as a settings.json command): python3 ~/.claude/hooks/hookc.py protect-files.py
+
+Relays the daemon's exit code, stdout and stderr unchanged. If the daemon is
+not reachable, starts it in the background for next time and runs the hook
+as a normal subprocess, exactly as a direct registration would. Once the
+request has been sent the hook may already have run, so a missing reply is
+reported as an error instead of running it a second time.
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+
+HOOKS_DIR = os.path.dirname(os.path.realpath(__file__))
+SOCKET_PATH = os.path.join(os.path.expanduser("~"), ".claude", "hookd.sock")
+
+
+def _via_daemon(hook: str, args: list, stdin_text: str):
+    """Return the daemon's response dict, or None if the request never reached it."""
+    if not hasattr(socket, "AF_UNIX") or sys.platform == "win32":
+        return None
+    try:
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    except OSError:
+        return None
+    with s:
+        try:
+            s.settimeout(60)
+            s.connect(SOCKET_PATH)
+            s.sendall(json.dumps({
+                "hook": hook, "argv": args, "stdin": stdin_text,
+                "env": dict(os.environ), "cwd": os.getcwd(),
+            }).encode())
+            s.shutdown(socket.SHUT_WR)
+        except OSError:
+            return None
+        try:
+            chunks = []
+            while True:
+                chunk = s.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            return json.loads(b"".join(chunks))
+        except (OSError, ValueError) as e:
+            return {"code": 1, "stdout": "", "stderr": f"hookc: no reply from hookd.py for {hook}: {e}\n"}
+
+
+def _start_daemon():
+    """Launch hookd.py detached; it exits on its own when idle."""
+    try:
+        subprocess.Popen(
+            [sys.executable, os.path.join(HOOKS_DIR, "hookd.py"), "serve"],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL, start_new_session=True,
+        )
+    except OSError:
+        pass
+
+
+def main():
+    """Forward to the daemon, falling back to a direct subprocess run."""
+    if len(sys.argv) < 2:
+        print("usage: hookc.py <hook.py> [args...]", file=sys.stderr)
+        return 1
+    hook, args = sys.argv[1], sys.argv[2:]
+    stdin_text = sys.stdin.read()
+
+    resp = None
+    if os.environ.get("AI_TOOLKIT_HOOKD", "1") != "0":
+        resp = _via_daemon(hook, args, stdin_text)
+        if resp is None and sys.platform != "win32":
+            _start_daemon()
+    if resp is None:
+        r = subprocess.run([sys.executable, os.path.join(HOOKS_DIR, hook), *args],
+                           input=stdin_text, capture_output=True, text=True)
+        resp = {"code": r.returncode, "stdout": r.stdout, "stderr": r.stderr}
+
+    sys.stdout.write(resp.get("stdout", ""))
+    sys.stderr.write(resp.get("stderr", ""))
+    return resp.get("code", 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
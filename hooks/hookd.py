@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Hook daemon — serve hook calls from warm interpreters over a Unix socket.
+
+Not a hook itself. Started lazily by hookc.py, exits after IDLE_TIMEOUT
+seconds without requests (or when any hooks/*.py changes on disk).
+
+Protocol: the client sends one JSON object and shuts down its write side:
+  {"hook": "protect-files.py", "argv": [], "stdin": "...", "env": {...}, "cwd": "..."}
+The daemon replies with one JSON object and closes:
+  {"code": 0, "stdout": "...", "stderr": "..."}
+
+Hooks swap process-wide state (environ, cwd, stdio), so each request runs
+in one of WORKERS forked processes, which accept on the shared socket and
+serve one request at a time — a slow formatter run holds up one worker,
+not every other session's PreToolUse checks.
+"""
+
+import fcntl
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+
+import hooklib
+
+STATE_DIR = Path.home() / ".claude"
+SOCKET_PATH = STATE_DIR / "hookd.sock"
+LOCK_PATH = STATE_DIR / "hookd.lock"
+IDLE_TIMEOUT = float(os.environ.get("AI_TOOLKIT_HOOKD_IDLE", "600"))
+WORKERS = max(1, int(os.environ.get("AI_TOOLKIT_HOOKD_WORKERS", "4")))
+MAX_REQUEST = 64 * 1024 * 1024
+RESTART = 3  # worker exit code: hooks/*.py changed
+
+# Set by SIGUSR1 in a worker: exit once the current request is answered
+_stopping = False
+
+
+def _recv_all(conn: socket.socket) -> bytes:
+    chunks, size = [], 0
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > MAX_REQUEST:
+            raise ValueError("request too large")
+    return b"".join(chunks)
+
+
+def handle(raw: bytes) -> dict:
+    """Run one request and return the response dict."""
+    try:
+        req = json.loads(raw)
+        code, out, err = hooklib.run_inline(
+            req["hook"], req.get("stdin", ""), req.get("env", {}),
+            req.get("cwd", ""), req.get("argv", []))
+    except Exception as e:
+        return {"code": 1, "stdout": "", "stderr": f"hookd: {e}\n"}
+    return {"code": code, "stdout": out, "stderr": err}
+
+
+def _code_stamp() -> dict:
+    """mtime of every hooks/*.py — the daemon must not outlive a `git pull`."""
+    return {p.name: p.stat().st_mtime_ns for p in hooklib.HOOKS_DIR.glob("*.py")}
+
+
+def _stop(*_):
+    """SIGUSR1: finish the current request (if any), then exit."""
+    global _stopping
+    _stopping = True
+
+
+def _worker(srv: socket.socket, stamp: dict) -> int:
+    """Serve requests one at a time. Returns 0 when idle or stopped, RESTART when the code changed."""
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    signal.signal(signal.SIGUSR1, _stop)
+    while not _stopping:
+        try:
+            conn, _ = srv.accept()
+        except socket.timeout:
+            # Exit only once no worker has served anything for IDLE_TIMEOUT
+            if time.time() - LOCK_PATH.stat().st_mtime >= IDLE_TIMEOUT:
+                return 0
+            continue
+        with conn:
+            conn.settimeout(30)
+            try:
+                resp = handle(_recv_all(conn))
+                conn.sendall(json.dumps(resp).encode())
+            except (OSError, ValueError):
+                pass
+        os.utime(LOCK_PATH)  # shared "last request" time for the idle check
+        if _code_stamp() != stamp:
+            return RESTART
+    return 0
+
+
+def serve():
+    """Bind the socket, fork the workers and wait for them. Returns immediately if another daemon holds the lock."""
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    hooklib.LONG_LIVED = True
+    lock = open(LOCK_PATH, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return 0  # another daemon is running (or starting)
+
+    SOCKET_PATH.unlink(missing_ok=True)
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        srv.bind(str(SOCKET_PATH))
+    finally:
+        os.umask(old_umask)
+    srv.listen(16)
+    srv.settimeout(min(IDLE_TIMEOUT, 1.0))  # how often idle workers look at _stopping
+
+    owner, workers, stamp = os.getpid(), set(), _code_stamp()
+    try:
+        for _ in range(WORKERS):
+            pid = os.fork()
+            if pid == 0:
+                workers.clear()
+                return _worker(srv, stamp)  # exits through main(), so atexit flushes run
+            workers.add(pid)
+
+        def forward(*_):
+            for pid in list(workers):
+                os.kill(pid, signal.SIGTERM)
+        signal.signal(signal.SIGTERM, forward)
+
+        while workers:
+            pid, status = os.wait()
+            workers.discard(pid)
+            if os.waitstatus_to_exitcode(status) == RESTART:
+                # Toolkit updated — new clients start a fresh daemon; the
+                # other workers finish what they are running, then exit
+                SOCKET_PATH.unlink(missing_ok=True)
+                for other in workers:
+                    os.kill(other, signal.SIGUSR1)
+    finally:
+        if os.getpid() == owner:
+            srv.close()
+            SOCKET_PATH.unlink(missing_ok=True)
+            lock.close()
+    return 0
+
+
+def main():
+    """Entry point: `hookd.py serve`."""
+    if sys.argv[1:2] != ["serve"]:
+        print("usage: hookd.py serve", file=sys.stderr)
+        return 1
+    return serve()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Shared helpers for running toolkit hooks in-process.
+
+Not a hook itself — imported by hookd.py (and friends) to load hook scripts
+as modules and call their main() without spawning a new interpreter.
+"""
+
+import contextlib
+import importlib.util
+import io
+import os
+import sys
+import traceback
+from pathlib import Path
+
+HOOKS_DIR = Path(__file__).resolve().parent
+
+# Set by hookd.py. Hooks may keep state between calls (buffers, warm
+# backends) only when this is True — a one-shot run exits right away.
+LONG_LIVED = False
+
+# name -> (mtime_ns, module). Reloaded when the script changes on disk,
+# so a long-lived process picks up `git pull` without a restart.
+_MODULES = {}
+
+
+def load_hook(name: str):
+    """Import hooks/<name> (e.g. "protect-files.py") as a module, cached by mtime."""
+    path = HOOKS_DIR / name
+    if path.parent != HOOKS_DIR or path.suffix != ".py":
+        raise ValueError(f"not a hook script: {name}")
+    mtime = path.stat().st_mtime_ns
+    cached = _MODULES.get(name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    mod_name = "hook_" + path.stem.replace("-", "_")
+    spec = importlib.util.spec_from_file_location(mod_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _MODULES[name] = (mtime, module)
+    return module
+
+
+@contextlib.contextmanager
+def _swapped_process_state(env: dict, cwd: str):
+    """Temporarily replace os.environ and the working directory."""
+    saved_env = dict(os.environ)
+    saved_cwd = os.getcwd()
+    os.environ.clear()
+    os.environ.update(env)
+    try:
+        if cwd:
+            os.chdir(cwd)
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(saved_env)
+        os.chdir(saved_cwd)
+
+
+def run_inline(name: str, stdin_text: str, env: dict, cwd: str = "",
+               argv: "list | None" = None) -> tuple[int, str, str]:
+    """Run a hook's main() as if it were `python3 hooks/<name>`.
+
+    Returns (exit_code, stdout, stderr). Not thread-safe — swaps process-wide
+    state (environ, cwd, stdio), so callers must serialize.
+    """
+    module = load_hook(name)
+    out, err = io.StringIO(), io.StringIO()
+    saved = sys.stdin, sys.stdout, sys.stderr, sys.argv
+    sys.stdin, sys.stdout, sys.stderr = io.StringIO(stdin_text), out, err
+    sys.argv = [str(HOOKS_DIR / name)] + list(argv or [])
+    try:
+        with _swapped_process_state(env, cwd):
+            try:
+                code = module.main()
+            except SystemExit as e:
+                code = e.code
+            except Exception:
+                # Same contract as an uncaught exception in a subprocess
+                traceback.print_exc(file=err)
+                code = 1
+    finally:
+        sys.stdin, sys.stdout, sys.stderr, sys.argv = saved
+    if code is None:
+        code = 0
+    elif not isinstance(code, int):
+        err.write(f"{code}\n")
+        code = 1
+    return code, out.getvalue(), err.getvalue()
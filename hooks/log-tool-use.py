@@ -2,28 +2,209 @@
 """Log every Claude Code tool call to a file.
 
 Hook type: PostToolUse (all tools)
+
+One "timestamp | session | tool" line per call. The log is rotated by size:
+closed segments are gzipped to tool-use.log.1.gz (newest) … .N.gz.
+
+Environment:
+  AI_TOOLKIT_LOG_MAX_BYTES   rotate above this size (default 10 MiB, 0 = never)
+  AI_TOOLKIT_LOG_SEGMENTS    gzipped segments to keep (default 5)
+  AI_TOOLKIT_LOG_BATCH=1     buffer lines and flush them in groups with fsync —
+                             only batches in a long-lived process (hookd.py);
+                             a one-shot hook run still writes through
+  AI_TOOLKIT_LOG_FLUSH_SECS  batch flush interval (default 1.0)
+  AI_TOOLKIT_LOG_DB          also write a structured row (tool, session, time,
+                             duration, file_path) to a SQLite store — "1" for
+                             ~/.claude/tool-use.db or a path; see toollog.py
 """
 
+import atexit
+import gzip
+import json
 import os
+import shutil
 import sys
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 
+import metrics
 
-def main():
+try:
+    import fcntl
+except ImportError:  # Windows — rotation runs unlocked
+    fcntl = None
+
+
+def _env_num(name: str, default, cast=int):
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        return cast(default)
+
+
+# ---------------------------------------------------------------------------
+# Rotation
+# ---------------------------------------------------------------------------
+
+def _segment(log_file: Path, i: int) -> Path:
+    return log_file.with_name(f"{log_file.name}.{i}.gz")
+
+
+def _rotate(log_file: Path, segments: int):
+    """Shift .N.gz segments up by one and gzip the current log into .1.gz."""
+    if segments < 1:
+        log_file.unlink(missing_ok=True)
+        return
+    for i in range(segments - 1, 0, -1):
+        if _segment(log_file, i).exists():
+            os.replace(_segment(log_file, i), _segment(log_file, i + 1))
+    # Rename first so concurrent appenders start a fresh file right away
+    closed = log_file.with_name(log_file.name + ".rotating")
+    os.replace(log_file, closed)
+    with open(closed, "rb") as src, gzip.open(_segment(log_file, 1), "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    closed.unlink()
+
+
+def _maybe_rotate(log_file: Path, incoming: int):
+    max_bytes = _env_num("AI_TOOLKIT_LOG_MAX_BYTES", 10 * 1024 * 1024)
+    if max_bytes <= 0:
+        return
+    try:
+        if log_file.stat().st_size + incoming <= max_bytes:
+            return
+    except FileNotFoundError:
+        return
+    segments = _env_num("AI_TOOLKIT_LOG_SEGMENTS", 5)
+    with open(log_file.with_name(log_file.name + ".lock"), "a") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        # Re-check under the lock: another process may have rotated already
+        try:
+            if log_file.stat().st_size + incoming > max_bytes:
+                _rotate(log_file, segments)
+        except FileNotFoundError:
+            pass
+
+
+def _append(log_file: Path, text: str, sync: bool = False):
+    """Append text to the log, rotating first if it would grow past the limit."""
+    try:
+        _maybe_rotate(log_file, len(text))
+        with open(log_file, "a") as f:
+            f.write(text)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+    except OSError:
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Batched writer — used only inside a long-lived process
+# ---------------------------------------------------------------------------
+
+class _BatchWriter:
+    """Buffer lines per log file; a daemon thread flushes them with fsync."""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def add(self, log_file: Path, line: str):
+        with self._lock:
+            self._pending.setdefault(log_file, []).append(line)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(_env_num("AI_TOOLKIT_LOG_FLUSH_SECS", 1.0, float))
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for log_file, lines in pending.items():
+            _append(log_file, "".join(lines), sync=True)
+
+
+_batch = None
+
+
+def _long_lived() -> bool:
+    hooklib = sys.modules.get("hooklib")
+    return bool(hooklib and getattr(hooklib, "LONG_LIVED", False))
+
+
+def run(tool: str, data: dict) -> int:
     """Append a timestamped line to ~/.claude/tool-use.log for each tool call."""
+    global _batch
     log_file = Path.home() / ".claude" / "tool-use.log"
-    tool = os.environ.get("CLAUDE_TOOL_NAME", "unknown")
+    tool = tool or "unknown"
     session = os.environ.get("CLAUDE_SESSION_ID", "no-session")
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    line = f"{timestamp} | {session} | {tool}\n"
+
+    with metrics.span("log-tool-use", "write"):
+        if os.environ.get("AI_TOOLKIT_LOG_BATCH") == "1" and _long_lived():
+            if _batch is None:
+                _batch = _BatchWriter()
+            _batch.add(log_file, line)
+        else:
+            _append(log_file, line)
+
+    db = _store_path()
+    if db is not None:
+        with metrics.span("log-tool-use", "store"):
+            _record_structured(db, timestamp, session, tool, data)
 
+    return 0
+
+
+def _store_path():
+    """toollog.db_path() — None when the store is off — without importing toollog
+    (and sqlite3) when AI_TOOLKIT_LOG_DB isn't set at all."""
+    if not os.environ.get("AI_TOOLKIT_LOG_DB"):
+        return None
     try:
-        with open(log_file, "a") as f:
-            f.write(f"{timestamp} | {session} | {tool}\n")
-    except OSError:
+        import toollog
+    except ImportError:
+        return None
+    return toollog.db_path()
+
+
+def _record_structured(db, timestamp: str, session: str, tool: str, data: dict):
+    """Write the call to the SQLite store (best-effort, like the text log)."""
+    import toollog
+    tool_input = data.get("tool_input") if isinstance(data.get("tool_input"), dict) else {}
+    file_path = data.get("file_path") or tool_input.get("file_path")
+    duration = data.get("duration_ms")
+    try:
+        toollog.record(db, timestamp, session, tool,
+                       float(duration) if isinstance(duration, (int, float)) else None,
+                       file_path if isinstance(file_path, str) else None)
+    except (OSError, toollog.sqlite3.Error):
         pass
 
-    return 0
+
+def main():
+    """Log the tool named in CLAUDE_TOOL_NAME (stdin only read for the structured store)."""
+    data = {}
+    if _store_path() is not None:
+        with metrics.span("log-tool-use", "parse"):
+            try:
+                data = json.load(sys.stdin)
+            except (json.JSONDecodeError, ValueError):
+                pass
+        if not isinstance(data, dict):
+            data = {}
+    return run(os.environ.get("CLAUDE_TOOL_NAME", "unknown"), data)
 
 
 if __name__ == "__main__":
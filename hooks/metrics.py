@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Opt-in hook timing spans, plus a summary command.
+
+Not a hook itself. Enabled with AI_TOOLKIT_METRICS ("1" for
+~/.claude/hook-metrics.jsonl, or a path). Each span appends one JSON line:
+  {"ts": 1760000000.0, "hook": "auto-format", "span": "formatter", "label": "black", "ms": 312.4}
+
+Usage:
+  metrics.py summary [--file PATH] [--hook NAME]   p50/p95/p99 per hook, span and label
+"""
+
+import contextlib
+import json
+import math
+import os
+import sys
+import time
+from pathlib import Path
+
+
+def sink() -> "Path | None":
+    """Return the metrics file, or None when metrics are off."""
+    value = os.environ.get("AI_TOOLKIT_METRICS", "")
+    if not value or value == "0":
+        return None
+    if value == "1":
+        return Path.home() / ".claude" / "hook-metrics.jsonl"
+    return Path(os.path.expanduser(value))
+
+
+def emit(hook: str, span_name: str, ms: float, label: str = ""):
+    """Append one timing record. Best-effort — never fails the hook."""
+    path = sink()
+    if path is None:
+        return
+    rec = {"ts": round(time.time(), 3), "hook": hook, "span": span_name, "ms": round(ms, 3)}
+    if label:
+        rec["label"] = label
+    try:
+        with open(path, "a") as f:
+            f.write(json.dumps(rec) + "\n")
+    except OSError:
+        pass
+
+
+@contextlib.contextmanager
+def span(hook: str, span_name: str, label: str = ""):
+    """Time the enclosed block and emit it (a no-op when metrics are off)."""
+    if sink() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        emit(hook, span_name, (time.perf_counter() - start) * 1000, label)
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+def summarize(path: Path, hook: str = "") -> list:
+    """Return [(hook, span, label, n, p50, p95, p99, max), ...] sorted by p95 descending."""
+    groups = {}
+    with open(path) as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+                key = (rec["hook"], rec["span"], rec.get("label", ""))
+                ms = float(rec["ms"])
+            except (ValueError, KeyError, TypeError):
+                continue
+            if hook and key[0] != hook:
+                continue
+            groups.setdefault(key, []).append(ms)
+    rows = []
+    for key, values in groups.items():
+        values.sort()
+        rows.append(key + (len(values), percentile(values, 50), percentile(values, 95),
+                           percentile(values, 99), values[-1]))
+    rows.sort(key=lambda r: r[5], reverse=True)
+    return rows
+
+
+def main():
+    """Entry point: `metrics.py summary`."""
+    import argparse
+    parser = argparse.ArgumentParser(prog="metrics.py", description="Summarize hook timing spans")
+    sub = parser.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("summary", help="Print p50/p95/p99 per hook, span and label")
+    s.add_argument("--file", help="Metrics file (default: AI_TOOLKIT_METRICS or ~/.claude/hook-metrics.jsonl)")
+    s.add_argument("--hook", default="", help="Only this hook")
+    args = parser.parse_args()
+
+    path = Path(os.path.expanduser(args.file)) if args.file else (sink() or Path.home() / ".claude" / "hook-metrics.jsonl")
+    if not path.exists():
+        print(f"No metrics at {path} (enable with AI_TOOLKIT_METRICS=1)", file=sys.stderr)
+        return 1
+
+    header = ("hook", "span", "label", "n", "p50 ms", "p95 ms", "p99 ms", "max ms")
+    print(f"{header[0]:<16} {header[1]:<12} {header[2]:<14} {header[3]:>6} "
+          + " ".join(f"{h:>9}" for h in header[4:]))
+    for hook, span_name, label, n, *stats in summarize(path, args.hook):
+        print(f"{hook:<16} {span_name:<12} {label or '-':<14} {n:>6} "
+              + " ".join(f"{v:>9.1f}" for v in stats))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
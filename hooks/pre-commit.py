@@ -2,43 +2,149 @@
 """Block unsafe git operations: push without /preflight, --no-verify, staged secrets.
 
 Hook type: PreToolUse (Bash)
+
+The command line is parsed (see shellcmd.py) rather than searched, so
+`echo "git push"` passes while `git -C repo push`, `cd x && git push`,
+`git commit -n` and aliases of push are caught.
+
+A push is allowed once /preflight has recorded a PASS or WARN result for
+the repository's current HEAD (see preflight.py); otherwise it is blocked
+with the reason.
+
+A commit is checked for staged secrets: only the lines it adds are read,
+streamed from `git diff --cached` — plus the working-tree diff of
+`commit -a`, of commit pathspecs, and of a `git add` earlier in the same
+command line, whose untracked files are scanned too — and matched against
+secretscan.py's patterns; staged .env files are refused too. The scan
+stops after AI_TOOLKIT_SECRET_BUDGET seconds (default 2.0); whatever was
+found by then still blocks, and the rest of the diff is let through with
+a note on stderr.
 """
 
 import json
 import os
 import sys
+import time
+from pathlib import Path
 
+import metrics
+import shellcmd
 
-def main():
-    """Block git push (without /preflight) and git commit --no-verify."""
-    tool = os.environ.get("CLAUDE_TOOL_NAME", "")
-    if tool != "Bash":
-        return 0
+SHOWN_FINDINGS = 5
 
+
+def _flush_format_queue():
+    """Finish auto-format.py's async queue so the commit sees formatted files."""
+    if not (Path.home() / ".claude" / "format-queue").is_dir():
+        return  # async formatting never used
+    try:
+        import hooklib
+        with metrics.span("pre-commit", "format-flush"):
+            hooklib.load_hook("auto-format.py").flush_queue()
+    except Exception:
+        pass  # best-effort, like auto-format itself
+
+
+def _staged_secrets(calls: list, commits: list) -> "str | None":
+    """Scan what each commit would add; return a block reason, or None."""
+    import secretscan  # compiles the patterns; only commits pay for that
     try:
-        data = json.load(sys.stdin)
-    except (json.JSONDecodeError, ValueError):
+        budget = float(os.environ.get("AI_TOOLKIT_SECRET_BUDGET", "2.0"))
+    except ValueError:
+        budget = 2.0
+    deadline = time.monotonic() + budget
+
+    # (kind, dir, args): the index, plus the working-tree changes the commit
+    # takes along (-a, pathspecs) and whatever a `git add` before it stages
+    scans = []
+    for c in commits:
+        scans.append(("diff", c.dir, ("--cached",)))
+        paths = shellcmd.commit_pathspecs(c.args)
+        if shellcmd.commit_stages_all(c.args):
+            scans.append(("diff", c.dir, ()))
+        elif paths:
+            scans.append(("diff", c.dir, ("--", *paths)))
+    for a in calls[:calls.index(commits[-1])]:
+        if a.subcommand != "add":
+            continue
+        paths, tracked_only = shellcmd.add_pathspecs(a.args)
+        scans.append(("diff", a.dir, ("--", *paths)))
+        if not tracked_only:
+            scans.append(("untracked", a.dir, tuple(paths)))
+
+    problems, timed_out = [], False
+    for kind, directory, args in dict.fromkeys(scans):
+        scan = secretscan.scan_diff if kind == "diff" else secretscan.scan_untracked
+        with metrics.span("pre-commit", "secret-scan"):
+            found = scan(directory, args, deadline - time.monotonic())
+        timed_out = timed_out or (not found["complete"] and time.monotonic() >= deadline)
+        problems += [f"{f['path']}:{f['line']} ({f['pattern']})" for f in found["findings"]]
+        problems += [f"{p} (environment file)" for p in found["env_files"]]
+    if timed_out:
+        print("pre-commit: staged-secrets scan ran out of time; the rest of the diff was not checked",
+              file=sys.stderr)
+    if not problems:
+        return None
+    problems = list(dict.fromkeys(problems))
+    shown = ", ".join(problems[:SHOWN_FINDINGS])
+    if len(problems) > SHOWN_FINDINGS:
+        shown += f" and {len(problems) - SHOWN_FINDINGS} more"
+    return f"Staged secrets found: {shown}. Unstage or remove them, then retry."
+
+
+def run(tool: str, data: dict) -> int:
+    """Block git push (without /preflight), git commit --no-verify and commits that add secrets."""
+    if tool != "Bash":
         return 0
 
     command = data.get("command", "")
-    if not command:
+    if not command or not isinstance(command, str) or "git" not in command:
         return 0
 
-    if "git push" in command:
-        print('{"decision":"block","reason":"Have you run /preflight? Run it before pushing, then retry."}',
-              file=sys.stderr)
-        return 2
+    calls = shellcmd.git_calls(command)
+    for c in calls:
+        if c.subcommand != "push":
+            continue
+        import preflight  # only a push needs it
+        with metrics.span("pre-commit", "preflight-record"):
+            why = preflight.check(c.dir)
+        if why:
+            reason = f"Have you run /preflight? Push blocked: {why}. Run /preflight, then retry."
+            print(json.dumps({"decision": "block", "reason": reason}), file=sys.stderr)
+            return 2
 
-    if "git commit" not in command:
+    commits = [c for c in calls if c.subcommand == "commit"]
+    if not commits:
         return 0
 
-    if "--no-verify" in command:
+    if any(shellcmd.commit_skips_hooks(c.args) for c in commits):
         print('{"decision":"block","reason":"--no-verify is not allowed. Run hooks properly."}',
               file=sys.stderr)
         return 2
 
+    why = _staged_secrets(calls, commits)
+    if why:
+        print(json.dumps({"decision": "block", "reason": why}), file=sys.stderr)
+        return 2
+
+    _flush_format_queue()
     return 0
 
 
+def main():
+    """Read the tool call from env + stdin and check it."""
+    tool = os.environ.get("CLAUDE_TOOL_NAME", "")
+    if tool != "Bash":
+        return 0
+
+    with metrics.span("pre-commit", "parse"):
+        try:
+            data = json.load(sys.stdin)
+        except (json.JSONDecodeError, ValueError):
+            return 0
+    with metrics.span("pre-commit", "rules"):
+        return run(tool, data)
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""Signed /preflight result records, checked by pre-commit.py before a push.
+
+Not a hook itself. The /preflight skill finishes with
+
+  preflight.py record --result PASS|WARN|FAIL [--checks JSON] [-C DIR]
+
+which writes <git dir>/ai-toolkit-preflight.json holding the HEAD commit
+(whose hash already covers its tree), the overall result and the per-check
+results, signed with HMAC-SHA256 under a per-user key
+(~/.claude/.preflight-key, created on first use, mode 0600). pre-commit.py then allows `git push` when the
+record's signature is valid, its HEAD is the repository's current HEAD and
+the result isn't FAIL. That check reads HEAD straight from the git
+directory — no git subprocess — so it costs a few small file reads.
+
+Usage:
+  preflight.py record --result R [--checks JSON] [-C DIR]
+  preflight.py check [-C DIR]     exit 0 if a push would be allowed, else print why and exit 1
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import sys
+from pathlib import Path
+
+# argparse, subprocess, secrets and time are imported where they're used:
+# pre-commit.py only calls check(), and pays for nothing else
+
+RECORD_NAME = "ai-toolkit-preflight.json"
+RESULTS = ("PASS", "WARN", "FAIL")
+
+
+def _key_file() -> Path:
+    return Path.home() / ".claude" / ".preflight-key"
+
+
+def _key(create: bool = False) -> "bytes | None":
+    path = _key_file()
+    try:
+        return bytes.fromhex(path.read_text().strip())
+    except (OSError, ValueError):
+        if not create:
+            return None
+    import secrets
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32) + "\n")
+    except FileExistsError:
+        pass  # created concurrently — use theirs
+    return bytes.fromhex(path.read_text().strip())
+
+
+def _sign(key: bytes, record: dict) -> str:
+    body = json.dumps({k: v for k, v in record.items() if k != "sig"}, sort_keys=True, separators=(",", ":"))
+    return hmac.new(key, body.encode(), hashlib.sha256).hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Reading HEAD without running git
+# ---------------------------------------------------------------------------
+
+def git_dir(start: str) -> "Path | None":
+    """The .git directory for start (following `gitdir:` files of worktrees and submodules)."""
+    d = Path(os.path.abspath(start))
+    for candidate in (d, *d.parents):
+        dot_git = candidate / ".git"
+        if dot_git.is_dir():
+            return dot_git
+        if dot_git.is_file():
+            try:
+                line = dot_git.read_text().strip()
+            except OSError:
+                return None
+            if line.startswith("gitdir:"):
+                return (candidate / line[len("gitdir:"):].strip()).resolve()
+            return None
+    return None
+
+
+def _common_dir(gdir: Path) -> Path:
+    """Where shared refs live (a linked worktree's git dir points there via `commondir`)."""
+    try:
+        return (gdir / (gdir / "commondir").read_text().strip()).resolve()
+    except OSError:
+        return gdir
+
+
+def read_head(gdir: Path) -> "str | None":
+    """The commit HEAD points to, resolving symbolic refs through loose and packed refs."""
+    try:
+        head = (gdir / "HEAD").read_text().strip()
+    except OSError:
+        return None
+    for _ in range(5):  # symbolic refs may chain
+        if not head.startswith("ref:"):
+            return head or None
+        ref = head[len("ref:"):].strip()
+        for base in (gdir, _common_dir(gdir)):
+            try:
+                head = (base / ref).read_text().strip()
+                break
+            except OSError:
+                continue
+        else:
+            return _packed_ref(_common_dir(gdir), ref)
+    return None
+
+
+def _packed_ref(common: Path, ref: str) -> "str | None":
+    try:
+        with open(common / "packed-refs") as f:
+            for line in f:
+                if line.rstrip("\n").endswith(f" {ref}"):
+                    return line.split(" ", 1)[0]
+    except OSError:
+        pass
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Record and check
+# ---------------------------------------------------------------------------
+
+def record(directory: str, result: str, checks: "dict | None" = None) -> Path:
+    """Write a signed record for the current HEAD; returns its path."""
+    import subprocess
+    import time
+    r = subprocess.run(["git", "rev-parse", "--absolute-git-dir", "HEAD"],
+                       cwd=directory or None, capture_output=True, text=True)
+    if r.returncode != 0:
+        raise RuntimeError(r.stderr.strip() or "not a git repository with commits")
+    gdir, head = r.stdout.split()
+    rec = {"head": head, "result": result, "checks": checks or {},
+           "time": round(time.time())}
+    rec["sig"] = _sign(_key(create=True), rec)
+    path = Path(gdir) / RECORD_NAME
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_text(json.dumps(rec, indent=2) + "\n")
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return path
+
+
+def check(directory: str) -> "str | None":
+    """None if a push from directory is covered by a passing preflight, else the reason it isn't."""
+    gdir = git_dir(directory or ".")
+    if gdir is None:
+        return "not a git repository"
+    try:
+        rec = json.loads((gdir / RECORD_NAME).read_text())
+    except (OSError, ValueError):
+        return "no /preflight result recorded for this repository"
+    key = _key()
+    if not isinstance(rec, dict) or key is None or not hmac.compare_digest(str(rec.get("sig", "")), _sign(key, rec)):
+        return "the recorded /preflight result is not valid"
+    if rec.get("head") != read_head(gdir):
+        return "HEAD has changed since the last /preflight"
+    if rec.get("result") not in ("PASS", "WARN"):
+        return "the last /preflight result was FAIL"
+    return None
+
+
+def main():
+    """Entry point: `preflight.py record|check`."""
+    import argparse
+    parser = argparse.ArgumentParser(prog="preflight.py", description="Signed /preflight result records")
+    sub = parser.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("record", help="Record the result for the current HEAD")
+    r.add_argument("--result", required=True, type=str.upper, choices=RESULTS)
+    r.add_argument("--checks", default="{}", help='Per-check results as JSON, e.g. {"Secrets": "PASS"}')
+    r.add_argument("-C", dest="directory", default="", help="Repository directory (default: cwd)")
+    c = sub.add_parser("check", help="Would a push be allowed?")
+    c.add_argument("-C", dest="directory", default="", help="Repository directory (default: cwd)")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        try:
+            checks = json.loads(args.checks)
+        except ValueError as e:
+            print(f"preflight: --checks is not JSON: {e}", file=sys.stderr)
+            return 1
+        try:
+            path = record(args.directory, args.result, checks if isinstance(checks, dict) else {})
+        except (RuntimeError, OSError) as e:
+            print(f"preflight: {e}", file=sys.stderr)
+            return 1
+        print(f"Recorded {args.result} in {path}")
+        return 0
+
+    reason = check(args.directory)
+    if reason:
+        print(f"Push blocked: {reason}")
+        return 1
+    print("Push allowed: /preflight passed for the current HEAD")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
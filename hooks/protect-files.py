@@ -2,42 +2,293 @@
 """Block writes to sensitive files (secrets, keys, credentials).
 
 Hook type: PreToolUse (Write|Edit)
+
+What is protected comes from rule files, one rule per line:
+
+  # kind   pattern            label (shown as "Cannot write to <label>: <name>")
+  name     .env               environment file
+  name     *.pem              key/certificate file
+  path     */deploy/*.tfvars  terraform variables
+  prefix   ~/.ssh/            SSH file
+  dir      .aws               AWS config
+
+  name    fnmatch glob against the file name
+  path    fnmatch glob against the full path (`*` also matches "/")
+  prefix  the path is under this directory (~ expanded)
+  dir     a directory of this name appears anywhere in the path
+
+The built-in DEFAULT_RULES always apply. Teams add their own in
+~/.claude/protect-files.rules, plus any files listed in
+AI_TOOLKIT_PROTECT_RULES (separated by os.pathsep).
+
+Rules are compiled once into lookup tables — exact names, prefix/suffix
+tries for `x*` and `*x` name globs, a path-component trie for prefixes, a
+set of directory names — and one combined regex each for the remaining
+name and path globs, so a check costs about the same for 5 rules or 500.
+The compiled form is cached in ~/.claude/protect-files.cache.json, keyed
+by a hash of the rule files, and kept in memory under hookd.py (where rule
+file edits are noticed within RECHECK_SECS).
 """
 
+import fnmatch
+import hashlib
 import json
 import os
+import re
 import sys
+import time
+from pathlib import Path
 
+import metrics
+
+DEFAULT_RULES = """\
+name    .env                environment file
+name    .env.*              environment file
+name    *.pem               key/certificate file
+name    *.key               key/certificate file
+name    credentials*        credentials file
+name    *credentials.json   credentials file
+"""
+
+KINDS = ("name", "path", "prefix", "dir")
+DEFAULT_LABEL = "protected file"
+_CACHE_VERSION = 1
+RECHECK_SECS = 1.0  # a long-lived process re-stats the rule files at most this often
+
+
+def _rule_files() -> list:
+    """Rule file paths as strings (this runs on every call, so no pathlib)."""
+    files = [os.path.join(os.path.expanduser("~"), ".claude", "protect-files.rules")]
+    extra = os.environ.get("AI_TOOLKIT_PROTECT_RULES", "")
+    files += [os.path.expanduser(p) for p in extra.split(os.pathsep) if p]
+    return files
+
+
+def _cache_file() -> Path:
+    return Path.home() / ".claude" / "protect-files.cache.json"
+
+
+# ---------------------------------------------------------------------------
+# Compile — rule text → JSON-able tables
+# ---------------------------------------------------------------------------
+
+def parse_rules(text: str, origin: str = "rules") -> list:
+    """Return [(kind, pattern, label), ...]; malformed lines are reported and skipped."""
+    rules = []
+    for lineno, line in enumerate(text.splitlines(), 1):
+        parts = line.split("#", 1)[0].split(None, 2)
+        if not parts:
+            continue
+        if len(parts) < 2 or parts[0] not in KINDS:
+            print(f"protect-files: {origin}:{lineno}: ignored rule: {line.strip()}", file=sys.stderr)
+            continue
+        rules.append((parts[0], parts[1], parts[2].strip() if len(parts) > 2 else DEFAULT_LABEL))
+    return rules
+
+
+def _trie_add(trie: dict, keys, label: str):
+    node = trie
+    for k in keys:
+        node = node.setdefault(k, {})
+    node.setdefault("", label)  # "" never collides with a character or path component
+
+
+def _wildcard(s: str) -> bool:
+    return any(c in s for c in "*?[")
+
+
+_POSIX = os.sep == "/"
+
+
+def _norm(path: str) -> str:
+    if _POSIX and path.startswith("/") and "/." not in path and "//" not in path:
+        return path  # already normal — the common case, and the hot path
+    return os.path.abspath(os.path.expanduser(path)).replace(os.sep, "/")
+
+
+def compile_rules(rules: list) -> dict:
+    """Sort rules into the cheapest structure that can answer each one."""
+    tables = {"names": {}, "name_prefix": {}, "name_suffix": {}, "dirs": {}, "prefixes": {},
+              "name_globs": [], "path_globs": []}
+    for kind, pattern, label in rules:
+        if kind == "name":
+            if not _wildcard(pattern):
+                tables["names"].setdefault(pattern, label)
+            elif pattern.endswith("*") and not _wildcard(pattern[:-1]):
+                _trie_add(tables["name_prefix"], pattern[:-1], label)
+            elif pattern.startswith("*") and not _wildcard(pattern[1:]):
+                _trie_add(tables["name_suffix"], reversed(pattern[1:]), label)
+            else:
+                tables["name_globs"].append([fnmatch.translate(pattern), label])
+        elif kind == "path":
+            tables["path_globs"].append([fnmatch.translate(_norm(pattern) if pattern.startswith("~") else pattern), label])
+        elif kind == "prefix":
+            _trie_add(tables["prefixes"], [c for c in _norm(pattern).split("/") if c], label)
+        else:
+            tables["dirs"].setdefault(pattern.strip("/"), label)
+    return tables
 
-def main():
-    """Block Write/Edit to .env, .pem, .key, and credentials files."""
-    tool = os.environ.get("CLAUDE_TOOL_NAME", "")
-    if tool not in ("Write", "Edit"):
-        return 0
 
+def _combined(globs: list):
+    """One regex for many globs; the matching alternative's group name gives its label."""
+    if not globs:
+        return None, []
+    source = "|".join(f"(?P<r{i}>{rx})" for i, (rx, _) in enumerate(globs))
+    return re.compile(source), [label for _, label in globs]
+
+
+class Matcher:
+    """Compiled rule tables; match(path) returns the label of a rule that applies, or None."""
+
+    def __init__(self, tables: dict):
+        self.names = tables["names"]
+        self.name_prefix = tables["name_prefix"]
+        self.name_suffix = tables["name_suffix"]
+        self.dirs = tables["dirs"]
+        self.prefixes = tables["prefixes"]
+        self.name_rx, self.name_labels = _combined(tables["name_globs"])
+        self.path_rx, self.path_labels = _combined(tables["path_globs"])
+
+    @staticmethod
+    def _walk(trie: dict, keys) -> "str | None":
+        """Label of the first terminal node on the way down (the root included), if any."""
+        node = trie
+        if "" in node:
+            return node[""]  # `name *`, `prefix /`
+        for k in keys:
+            node = node.get(k)
+            if node is None:
+                return None
+            if "" in node:
+                return node[""]
+        return None
+
+    def match(self, file_path: str) -> "str | None":
+        # The name rules only need the basename; normalize and split the whole
+        # path only when directory, prefix or path rules exist
+        name = file_path.rpartition("/")[2] if _POSIX else ""
+        if name in ("", ".", ".."):
+            file_path = _norm(file_path)
+            name = file_path.rpartition("/")[2]
+        label = (self.names.get(name)
+                 or self._walk(self.name_prefix, name)
+                 or self._walk(self.name_suffix, reversed(name)))
+        if label:
+            return label
+        if self.name_rx is not None:
+            m = self.name_rx.match(name)
+            if m:
+                return self.name_labels[int(m.lastgroup[1:])]
+        if not (self.dirs or self.prefixes or self.path_rx is not None):
+            return None
+        path = _norm(file_path)
+        parts = path.split("/")
+        if self.dirs:
+            for d in parts[1:-1]:
+                if d in self.dirs:
+                    return self.dirs[d]
+        if self.prefixes:
+            label = self._walk(self.prefixes, [p for p in parts[:-1] if p])
+            if label:
+                return label
+        if self.path_rx is not None:
+            m = self.path_rx.match(path)
+            if m:
+                return self.path_labels[int(m.lastgroup[1:])]
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Loading — in memory while the rule files are unchanged, else from the disk
+# cache while their hash is unchanged, else compiled from scratch
+# ---------------------------------------------------------------------------
+
+_LOADED = {"checked": -RECHECK_SECS, "stamp": None, "matcher": None}
+
+
+def _stamp(files: list) -> tuple:
+    stamp = [os.environ.get("HOME", "")]
+    for f in files:
+        try:
+            st = os.stat(f)
+            stamp.append((f, st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamp.append((f, None))
+    return tuple(stamp)
+
+
+def load_matcher() -> Matcher:
+    """Return the compiled matcher for DEFAULT_RULES plus the rule files."""
+    now = time.monotonic()
+    if now - _LOADED["checked"] < RECHECK_SECS:
+        return _LOADED["matcher"]
+    files = _rule_files()
+    stamp = _stamp(files)
+    _LOADED["checked"] = now
+    if _LOADED["stamp"] == stamp:
+        return _LOADED["matcher"]
+
+    sources = [("default", DEFAULT_RULES)]
+    for f in files:
+        try:
+            sources.append((f, Path(f).read_text()))
+        except OSError:
+            pass
+    h = hashlib.sha256(f"{_CACHE_VERSION}\0{Path.home()}".encode())
+    for origin, text in sources:
+        h.update(f"\0{origin}\0{text}".encode())
+    key = h.hexdigest()
+
+    cache = _cache_file()
     try:
-        data = json.load(sys.stdin)
-    except (json.JSONDecodeError, ValueError):
+        data = json.loads(cache.read_text())
+        tables = data["tables"] if data.get("key") == key else None
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        tables = None
+    if tables is None:
+        tables = compile_rules([r for origin, text in sources for r in parse_rules(text, origin)])
+        tmp = cache.with_name(f"{cache.name}.{os.getpid()}.tmp")
+        try:
+            tmp.write_text(json.dumps({"key": key, "tables": tables}))
+            os.replace(tmp, cache)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+
+    matcher = Matcher(tables)
+    _LOADED.update(stamp=stamp, matcher=matcher)
+    return matcher
+
+
+def run(tool: str, data: dict) -> int:
+    """Block Write/Edit to any path a protection rule matches."""
+    if tool not in ("Write", "Edit"):
         return 0
 
     file_path = data.get("file_path", "")
-    if not file_path:
+    if not file_path or not isinstance(file_path, str):
         return 0
 
-    basename = os.path.basename(file_path)
-
-    if basename == ".env" or basename.startswith(".env."):
-        print(f"BLOCKED: Cannot write to environment file: {basename}")
+    label = load_matcher().match(file_path)
+    if label:
+        print(f"BLOCKED: Cannot write to {label}: {os.path.basename(file_path)}")
         return 2
-    if basename.endswith((".pem", ".key")):
-        print(f"BLOCKED: Cannot write to key/certificate file: {basename}")
-        return 2
-    if basename.startswith("credentials") or basename.endswith("credentials.json"):
-        print(f"BLOCKED: Cannot write to credentials file: {basename}")
-        return 2
-
     return 0
 
 
+def main():
+    """Read the tool call from env + stdin and check it."""
+    tool = os.environ.get("CLAUDE_TOOL_NAME", "")
+    if tool not in ("Write", "Edit"):
+        return 0
+
+    with metrics.span("protect-files", "parse"):
+        try:
+            data = json.load(sys.stdin)
+        except (json.JSONDecodeError, ValueError):
+            return 0
+    with metrics.span("protect-files", "rules"):
+        return run(tool, data)
+
+
 if __name__ == "__main__":
     sys.exit(main())
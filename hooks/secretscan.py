@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""Incremental secrets scanner behind the /preflight secrets check.
+
+Not a hook itself. Scans a project for hardcoded secrets and prints one
+JSON result:
+
+  {"result": "FAIL", "files": 812, "scanned": 3, "cached": 809, "skipped": 12,
+   "findings": [{"path": "app/settings.py", "line": 14, "pattern": "api-key", "match": "API_KEY = \\""}],
+   "staged_env": [".env.local"]}
+
+All PATTERNS are combined into one compiled regex, run over each file
+through mmap so a file is read by the OS once and never copied into
+Python strings. A file holding none of the patterns' leading literals is
+ruled out by plain substring search, without running the regex at all.
+Inside a git repository the file list comes from
+`git ls-files` (tracked plus untracked-but-not-ignored), so ignored paths
+are never opened; elsewhere common build and vendor directories are
+skipped. Binary files (a NUL byte in the first 8 KiB) and files over
+--max-bytes are skipped.
+
+scan_diff() and scan_untracked() are the other entry points: pre-commit.py
+uses them to check just what a commit adds, streaming `git diff --cached`
+(and the untracked files a preceding `git add` would stage) under a time
+budget.
+
+Results are cached per file content: the cache maps each file's git blob
+hash to its findings, and each path's (size, mtime) to its last blob hash,
+so a re-run only reads files that changed, and only scans content it has
+never seen. The cache lives in the repository's git directory
+(ai-toolkit-secretscan.json), or under ~/.claude outside a repository.
+
+Usage:
+  secretscan.py [DIR] [--max-bytes N] [--exclude GLOB ...] [--no-cache]
+Exit status: 0 for PASS, 1 for FAIL.
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import mmap
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+# name -> regex (bytes). A match is a finding; the matched text is reported,
+# which for the assignment patterns stops at the opening quote (no value).
+PATTERNS = {
+    "api-key": rb"""API_KEY\s*=\s*["']""",
+    "secret": rb"""SECRET\s*=\s*["']""",
+    "token": rb"""TOKEN\s*=\s*["']""",
+    "password": rb"""PASSWORD\s*=\s*["']""",
+    "private-key": rb"-----BEGIN [A-Z0-9 ]*KEY-----",
+}
+
+# One alternation without groups: named groups make every search several
+# times slower, so which pattern matched is worked out only for a match.
+SECRET_RE = re.compile(b"|".join(b"(?:%s)" % rx for rx in PATTERNS.values()))
+_SINGLE = {name: re.compile(rx) for name, rx in PATTERNS.items()}
+
+# The literal each pattern starts with; text containing none of them can't
+# match, and bytes.find is far cheaper than running the regex
+_LITERALS = tuple(re.match(rb"[\w -]*", rx).group() for rx in PATTERNS.values())
+
+# Outside git, these directories are never descended into
+SKIP_DIRS = {".git", ".hg", ".svn", "node_modules", "vendor", "dist", "build", "target",
+             "__pycache__", ".venv", "venv", ".tox", ".mypy_cache", ".pytest_cache"}
+
+MAX_BYTES = 5 * 1024 * 1024
+SNIFF_BYTES = 8192
+CACHE_NAME = "ai-toolkit-secretscan.json"
+_CACHE_VERSION = hashlib.sha256(b"1\0" + SECRET_RE.pattern).hexdigest()[:16]
+
+
+def pattern_name(m: "re.Match") -> str:
+    """The PATTERNS name of the pattern a SECRET_RE match came from."""
+    for name, rx in _SINGLE.items():
+        if rx.match(m.string, m.start()):
+            return name
+    return ""
+
+
+def may_match(buf) -> bool:
+    """False if SECRET_RE cannot match anywhere in buf (bytes or mmap)."""
+    return not all(_LITERALS) or any(buf.find(lit) >= 0 for lit in _LITERALS)
+
+
+# ---------------------------------------------------------------------------
+# File list
+# ---------------------------------------------------------------------------
+
+def _git(root: Path, *args) -> "subprocess.CompletedProcess | None":
+    try:
+        r = subprocess.run(["git", "-C", str(root), *args], capture_output=True)
+    except OSError:
+        return None
+    return r if r.returncode == 0 else None
+
+
+def list_files(root: Path) -> tuple:
+    """Return (relative paths to scan, git dir or None)."""
+    r = _git(root, "rev-parse", "--absolute-git-dir")
+    if r is not None:
+        files = _git(root, "ls-files", "-z", "--cached", "--others", "--exclude-standard")
+        if files is not None:
+            names = [os.fsdecode(p) for p in files.stdout.split(b"\0") if p]
+            return sorted(set(names)), Path(os.fsdecode(r.stdout.strip()))
+    names = []
+    for d, dirs, filenames in os.walk(root):
+        dirs[:] = sorted(x for x in dirs if x not in SKIP_DIRS)
+        rel = os.path.relpath(d, root)
+        names += [n if rel == "." else f"{rel}/{n}".replace(os.sep, "/") for n in sorted(filenames)]
+    return names, None
+
+
+def staged_env_files(root: Path) -> list:
+    """Staged files named .env or .env.* (empty outside git)."""
+    r = _git(root, "diff", "--cached", "--name-only", "-z")
+    if r is None:
+        return []
+    names = [os.fsdecode(p) for p in r.stdout.split(b"\0") if p]
+    return [n for n in names if is_env_file(n)]
+
+
+def is_env_file(name: str) -> bool:
+    """True for files named .env or .env.*"""
+    base = os.path.basename(name)
+    return base == ".env" or base.startswith(".env.")
+
+
+# ---------------------------------------------------------------------------
+# Scanning one file
+# ---------------------------------------------------------------------------
+
+def _blob_hash(data) -> str:
+    """git's object id for this content, so results can be keyed like the index."""
+    h = hashlib.sha1(b"blob %d\0" % len(data))
+    h.update(data)
+    return h.hexdigest()
+
+
+def scan_file(path: Path, max_bytes: int, seen: dict) -> tuple:
+    """Return (blob hash, findings) — findings None if skipped (binary, too large, unreadable).
+
+    `seen` maps blob hashes to findings already known; such content isn't scanned again.
+    """
+    try:
+        size = path.stat().st_size
+        if size > max_bytes:
+            return None, None
+        if size == 0:
+            return _blob_hash(b""), []
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if b"\0" in mm[:SNIFF_BYTES]:
+                return None, None
+            blob = _blob_hash(mm)
+            if blob in seen:
+                return blob, seen[blob]
+            findings, line, pos = [], 1, 0
+            for m in SECRET_RE.finditer(mm) if may_match(mm) else ():
+                # Count lines on from the previous match, without copying the file
+                nl = mm.find(b"\n", pos, m.start())
+                while nl >= 0:
+                    line += 1
+                    nl = mm.find(b"\n", nl + 1, m.start())
+                pos = m.start()
+                findings.append([line, pattern_name(m), m.group().decode("utf-8", "replace")])
+            return blob, findings
+    except (OSError, ValueError):
+        return None, None
+
+
+# ---------------------------------------------------------------------------
+# Scanning a diff (pre-commit.py)
+# ---------------------------------------------------------------------------
+
+DIFF_BLOCK = 1 << 16
+_HUNK_RE = re.compile(rb"@@ -\d+(?:,\d+)? \+(\d+)")
+
+
+def _diff_path(header: bytes) -> "str | None":
+    """The new-side path from a `+++ b/path` line (None for /dev/null)."""
+    target = header[4:].rstrip(b"\r\n")
+    if target.startswith(b'"') and target.endswith(b'"'):
+        target = target[1:-1]  # core.quotePath=false leaves only odd characters quoted
+    if not target.startswith(b"b/"):
+        return None
+    return os.fsdecode(target[2:])
+
+
+def scan_diff(directory: str, diff_args: tuple = ("--cached",), budget: float = 2.0) -> dict:
+    """Scan only the added lines of `git diff <diff_args>`, streamed as it is produced.
+
+    Returns {"findings": [...], "env_files": [...], "complete": bool}. git is killed
+    once budget seconds have passed, so the cost follows the diff, never the
+    repository, and is capped either way; complete is False if the diff wasn't
+    read to the end (time ran out, or git failed).
+    """
+    result = {"findings": [], "env_files": [], "complete": False}
+    cmd = ["git", "-c", "core.quotePath=false", "diff", "--no-color", "--no-ext-diff", "--no-textconv",
+           "--unified=0", "--src-prefix=a/", "--dst-prefix=b/", *diff_args]
+    try:
+        proc = subprocess.Popen(cmd, cwd=directory or None, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return result
+    timer = threading.Timer(max(budget, 0), proc.kill)
+    timer.start()
+    path, line, in_hunk = None, 0, False
+    findings = result["findings"]
+    try:
+        while True:
+            # A block of whole lines at a time; the regex runs only on lines of a
+            # block that contains one of the patterns' literals
+            block = proc.stdout.read(DIFF_BLOCK)
+            if not block:
+                break
+            if not block.endswith(b"\n"):
+                block += proc.stdout.readline()
+            search = SECRET_RE.search if may_match(block) else None
+            for raw in block.split(b"\n"):
+                first = raw[:1]
+                if in_hunk and first == b"+":
+                    m = search and search(raw, 1)
+                    if m and path is not None:
+                        findings.append({"path": path, "line": line, "pattern": pattern_name(m)})
+                    line += 1
+                elif in_hunk and first in (b"-", b"\\", b""):
+                    pass  # removed line / "no newline at end of file" / end of block
+                elif raw.startswith(b"@@ "):
+                    m = _HUNK_RE.match(raw)
+                    line, in_hunk = (int(m.group(1)), True) if m else (0, False)
+                elif raw.startswith(b"diff "):
+                    path, in_hunk = None, False
+                elif not in_hunk and raw.startswith(b"+++ "):
+                    path = _diff_path(raw)
+                    if path is not None and is_env_file(path):
+                        result["env_files"].append(path)
+                elif raw:
+                    in_hunk = False
+    finally:
+        proc.stdout.close()
+        returncode = proc.wait()
+        timer.cancel()
+    result["complete"] = returncode == 0
+    return result
+
+
+def scan_untracked(directory: str, pathspecs: tuple = (), budget: float = 2.0) -> dict:
+    """Scan the untracked, not ignored files under pathspecs (what `git add` would stage).
+
+    Same result shape as scan_diff(); paths are relative to directory. Files
+    aren't read once budget seconds have passed.
+    """
+    result = {"findings": [], "env_files": [], "complete": False}
+    deadline = time.monotonic() + budget
+    try:
+        r = subprocess.run(["git", "ls-files", "-z", "--others", "--exclude-standard", "--", *pathspecs],
+                           cwd=directory or None, capture_output=True, timeout=max(budget, 0))
+    except (OSError, subprocess.SubprocessError):
+        return result
+    if r.returncode != 0:
+        return result
+    root = Path(directory or ".")
+    for name in (os.fsdecode(p) for p in r.stdout.split(b"\0") if p):
+        if time.monotonic() >= deadline:
+            return result
+        if is_env_file(name):
+            result["env_files"].append(name)
+        _, findings = scan_file(root / name, MAX_BYTES, {})
+        for line, pattern, _ in findings or ():
+            result["findings"].append({"path": name, "line": line, "pattern": pattern})
+    result["complete"] = True
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Cache and driver
+# ---------------------------------------------------------------------------
+
+def _cache_path(root: Path, git_dir: "Path | None") -> Path:
+    if git_dir is not None:
+        return git_dir / CACHE_NAME
+    digest = hashlib.sha256(str(root).encode()).hexdigest()[:16]
+    return Path.home() / ".claude" / f"secretscan-{digest}.json"
+
+
+def _load_cache(path: Path) -> dict:
+    try:
+        data = json.loads(path.read_text())
+        if data.get("version") == _CACHE_VERSION:
+            return data
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {"version": _CACHE_VERSION, "paths": {}, "blobs": {}}
+
+
+def _save_cache(path: Path, cache: dict):
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(json.dumps(cache, separators=(",", ":")))
+        os.replace(tmp, path)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+
+
+def scan(root: Path, max_bytes: int = MAX_BYTES, exclude: tuple = (), use_cache: bool = True) -> dict:
+    """Scan root and return the JSON-able result."""
+    root = root.resolve()
+    names, git_dir = list_files(root)
+    cache_file = _cache_path(root, git_dir)
+    cache = _load_cache(cache_file) if use_cache else {"version": _CACHE_VERSION, "paths": {}, "blobs": {}}
+    old_paths, blobs = cache["paths"], cache["blobs"]
+    paths, used_blobs = {}, {}
+    result = {"result": "PASS", "files": 0, "scanned": 0, "cached": 0, "skipped": 0, "findings": []}
+
+    for name in names:
+        if any(fnmatch.fnmatch(name, g) for g in exclude):
+            continue
+        path = root / name
+        try:
+            st = path.stat()
+        except OSError:
+            continue  # deleted but still in the index
+        result["files"] += 1
+        prev = old_paths.get(name)
+        unchanged = prev and prev[:2] == [st.st_size, st.st_mtime_ns]
+        if unchanged and prev[2] is None and st.st_size <= max_bytes:
+            paths[name] = prev  # binary last time, and not touched since
+            result["skipped"] += 1
+            continue
+        if unchanged and prev[2] in blobs:
+            blob, findings = prev[2], blobs[prev[2]]
+            result["cached"] += 1
+        else:
+            blob, findings = scan_file(path, max_bytes, blobs)
+            if findings is None:
+                if blob is None and st.st_size <= max_bytes:
+                    paths[name] = [st.st_size, st.st_mtime_ns, None]
+                result["skipped"] += 1
+                continue
+            result["scanned"] += 1
+        paths[name] = [st.st_size, st.st_mtime_ns, blob]
+        used_blobs[blob] = findings
+        for line, pattern, text in findings:
+            result["findings"].append({"path": name, "line": line, "pattern": pattern, "match": text})
+
+    result["staged_env"] = staged_env_files(root)
+    if result["findings"] or result["staged_env"]:
+        result["result"] = "FAIL"
+    if use_cache and (paths != old_paths or used_blobs.keys() != blobs.keys()):
+        _save_cache(cache_file, {"version": _CACHE_VERSION, "paths": paths, "blobs": used_blobs})
+    return result
+
+
+def main():
+    """Entry point: scan a directory and print the JSON result."""
+    parser = argparse.ArgumentParser(prog="secretscan.py", description="Scan a project for hardcoded secrets")
+    parser.add_argument("root", nargs="?", default=".", help="Directory to scan (default: cwd)")
+    parser.add_argument("--max-bytes", type=int, default=MAX_BYTES, help=f"Skip larger files (default {MAX_BYTES})")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                        help="Skip matching relative paths; repeatable")
+    parser.add_argument("--no-cache", action="store_true", help="Scan every file and leave the cache alone")
+    args = parser.parse_args()
+
+    result = scan(Path(args.root), args.max_bytes, tuple(args.exclude), not args.no_cache)
+    print(json.dumps(result, indent=2))
+    return 0 if result["result"] == "PASS" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""Find the git commands inside a Bash tool command line.
+
+Not a hook itself — imported by pre-commit.py. Tokenizes the command the
+way a POSIX shell would for the parts that matter: quotes, `&&`, `||`,
+`;`, `&`, pipes, newlines, `( … )` subshells, `$( … )` and backtick
+substitutions (also inside double quotes), comments and here-documents
+(whose bodies are not commands). Quoted text is never mistaken for a
+command, so `echo "git push"` is just an echo.
+
+Each simple command is then unwrapped (`VAR=x`, sudo, env, nohup, time,
+timeout, `bash -c '…'`, eval) and, if it runs git, git's own options are
+skipped (`-C dir`, `-c k=v`, `--git-dir=…`) to find the subcommand. Git
+aliases are expanded from `-c alias.x=…` and from `git config`.
+
+Parsing is memoized per command string, so a very large payload is only
+tokenized once per process.
+"""
+
+import functools
+import os
+import re
+from collections import namedtuple
+
+# dir: the -C directory ("" = cwd); args: everything after the subcommand
+GitCall = namedtuple("GitCall", "dir subcommand args")
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>[ \t\r]+|\\\n)
+  | (?P<op>&&|\|\||;;|\|&|\$\(|[;&|()\n`])
+  | (?P<sq>'[^']*(?:'|\Z))
+  | (?P<dq>"[^"\\]*(?:\\.[^"\\]*)*(?:"|\Z))
+  | (?P<word>(?:[<>]&|\\.|[^\s'"\\;&|()`])+)
+  | (?P<bs>\\)
+""", re.VERBOSE | re.DOTALL)
+
+# Substitutions inside double quotes run as commands too
+_DQ_SUBST_RE = re.compile(r"\$\(((?:[^()]|\([^()]*\))*)\)|`([^`]*)`")
+
+# Words that may start a command without being the command
+_KEYWORDS = {"!", "{", "}", "if", "then", "elif", "else", "fi", "while", "until", "do", "done",
+             "time", "exec", "command", "builtin", "nohup", "case", "esac"}
+_ASSIGNMENT_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+_SHELLS = {"sh", "bash", "zsh", "dash", "ksh"}
+_FIND_EXEC = {"-exec", "-execdir", "-ok", "-okdir"}
+
+# git's global options, and which of them take the next word as their value
+_GIT_VALUE_OPTS = {"-C", "-c", "--git-dir", "--work-tree", "--namespace", "--super-prefix",
+                   "--config-env", "--exec-path"}
+
+# Aliases can't shadow these, so there's no need to ask git about them
+GIT_BUILTINS = frozenset("""
+    add am annotate apply archive bisect blame branch bundle cat-file check-attr check-ignore
+    checkout cherry cherry-pick clean clone commit commit-tree config count-objects credential
+    describe diff diff-files diff-index diff-tree difftool fetch for-each-ref format-patch fsck
+    gc grep hash-object help init log ls-files ls-remote ls-tree maintenance merge merge-base
+    mergetool mv name-rev notes prune pull push range-diff read-tree rebase reflog remote
+    repack replace reset restore rev-list rev-parse revert rm send-pack shortlog show
+    show-branch show-ref sparse-checkout stash status submodule switch symbolic-ref tag
+    update-index update-ref var verify-commit version whatchanged worktree write-tree
+""".split())
+
+_ALIAS_DEPTH = 5
+
+
+# ---------------------------------------------------------------------------
+# Tokenizer
+# ---------------------------------------------------------------------------
+
+def _unquote_dq(body: str) -> str:
+    return re.sub(r'\\([\\"$`\n])', r"\1", body)
+
+
+def _commands(text: str, out: list):
+    """Append each simple command in text to out as a list of words."""
+    words, word, pos, pending_heredocs = [], None, 0, []
+    n = len(text)
+
+    def end_word():
+        nonlocal word
+        if word is not None:
+            words.append(word)
+            word = None
+
+    def end_command():
+        end_word()
+        if words:
+            out.append(words[:])
+            words.clear()
+
+    while pos < n:
+        m = _TOKEN_RE.match(text, pos)
+        kind, value = m.lastgroup, m.group()
+        pos = m.end()
+        if kind == "ws":
+            end_word()
+        elif kind == "op":
+            end_command()
+            if value == "\n" and pending_heredocs:
+                # Skip each here-document body up to its delimiter line
+                for delim in pending_heredocs:
+                    m = re.compile(r"^[ \t]*" + re.escape(delim) + r"[ \t]*$", re.M).search(text, pos)
+                    pos = m.end() if m else n
+                pending_heredocs.clear()
+        elif kind == "word" and word is None and value.startswith("#"):
+            nl = text.find("\n", pos)
+            pos = n if nl < 0 else nl
+        elif kind == "word" and word is None and value.startswith("<<") and not value.startswith("<<<"):
+            delim = value.lstrip("<-")
+            if not delim:  # "<< EOF": the delimiter is the next word
+                m = re.compile(r"[ \t]*(\S+)").match(text, pos)
+                delim, pos = (m.group(1), m.end()) if m else ("", pos)
+            delim = delim.replace("'", "").replace('"', "").replace("\\", "")
+            if delim:
+                pending_heredocs.append(delim)
+        else:
+            if kind == "sq":
+                piece = value[1:-1] if value.endswith("'") and len(value) > 1 else value[1:]
+            elif kind == "dq":
+                body = value[1:-1] if value.endswith('"') and len(value) > 1 else value[1:]
+                if "$(" in body or "`" in body:
+                    for sub in _DQ_SUBST_RE.finditer(body):
+                        _commands(sub.group(1) if sub.group(1) is not None else sub.group(2), out)
+                piece = _unquote_dq(body) if "\\" in body else body
+            elif kind == "word":
+                piece = re.sub(r"\\(.)", r"\1", value, flags=re.S) if "\\" in value else value
+            else:
+                piece = ""
+            word = piece if word is None else word + piece
+    end_command()
+
+
+def _unwrap(words: list) -> list:
+    """Drop assignments, keywords and wrappers (sudo, env, timeout, xargs …) in front of the command."""
+    i = 0
+    while i < len(words):
+        w = words[i]
+        name = os.path.basename(w)
+        if w in _KEYWORDS or _ASSIGNMENT_RE.match(w):
+            i += 1
+        elif name == "sudo":
+            i += 1
+            while i < len(words) and words[i].startswith("-"):
+                i += 2 if words[i] in ("-u", "-g", "-h", "-p", "-C", "-D", "-r", "-t") else 1
+        elif name == "env":
+            i += 1
+            while i < len(words) and (words[i].startswith("-") or _ASSIGNMENT_RE.match(words[i])):
+                i += 2 if words[i] in ("-u", "-C", "-S") else 1
+        elif name == "nice":
+            i += 1
+            while i < len(words) and words[i].startswith("-"):
+                i += 2 if words[i] == "-n" else 1
+        elif name == "timeout":
+            i += 1
+            while i < len(words) and words[i].startswith("-"):
+                i += 2 if words[i] in ("-s", "-k") else 1
+            i += 1  # the duration
+        elif name == "xargs":
+            i += 1
+            while i < len(words) and words[i].startswith("-"):
+                i += 2 if words[i] in ("-a", "-d", "-E", "-I", "-L", "-n", "-P", "-s") else 1
+        else:
+            break
+    return words[i:]
+
+
+def _git_argv(words: list, out: list, depth: int = 0):
+    """Append (dir, inline_aliases, argv after git's options) for each git run by words."""
+    words = _unwrap(words)
+    if not words or depth > _ALIAS_DEPTH:
+        return
+    name = os.path.basename(words[0])
+    if name in _SHELLS and "-c" in words[1:-1]:
+        for cmd in parse_commands(words[words.index("-c", 1) + 1]):
+            _git_argv(cmd, out, depth + 1)
+        return
+    if name in ("eval", "watch"):  # both join their arguments into one shell command
+        i = 1
+        while name == "watch" and i < len(words) and words[i].startswith("-"):
+            i += 2 if words[i] in ("-n", "--interval", "-q", "--equexit") else 1
+        for cmd in parse_commands(" ".join(words[i:])):
+            _git_argv(cmd, out, depth + 1)
+        return
+    if name == "find":  # each -exec … ; (or +) runs its own command
+        i = 1
+        while i < len(words):
+            if words[i] in _FIND_EXEC:
+                end = i + 1
+                while end < len(words) and words[end] not in (";", "+"):
+                    end += 1
+                _git_argv(words[i + 1:end], out, depth + 1)
+                i = end
+            i += 1
+        return
+    if name not in ("git", "git.exe"):
+        return
+    directory, aliases, i = "", {}, 1
+    while i < len(words) and words[i].startswith("-"):
+        opt = words[i]
+        if opt == "--":
+            i += 1
+            break
+        value = None
+        if opt in _GIT_VALUE_OPTS and i + 1 < len(words):
+            value = words[i + 1]
+            i += 2
+        else:
+            if "=" in opt and opt.split("=", 1)[0] in _GIT_VALUE_OPTS:
+                opt, value = opt.split("=", 1)
+            i += 1
+        if opt == "-C" and value is not None:
+            directory = os.path.join(directory, value) if directory else value
+        elif opt == "-c" and value and value.startswith("alias.") and "=" in value:
+            key, expansion = value[len("alias."):].split("=", 1)
+            aliases[key] = expansion
+    out.append((directory, tuple(aliases.items()), tuple(words[i:])))
+
+
+@functools.lru_cache(maxsize=256)
+def parse_commands(command: str) -> tuple:
+    """Every simple command in a shell command line, as a tuple of word tuples."""
+    out = []
+    _commands(command, out)
+    return tuple(tuple(words) for words in out)
+
+
+@functools.lru_cache(maxsize=256)
+def _git_invocations(command: str) -> tuple:
+    out = []
+    for words in parse_commands(command):
+        _git_argv(list(words), out)
+    return tuple(out)
+
+
+# ---------------------------------------------------------------------------
+# Aliases
+# ---------------------------------------------------------------------------
+
+@functools.lru_cache(maxsize=64)
+def _config_aliases(directory: str) -> dict:
+    """alias.* entries from `git config` as seen from directory ({} if git isn't usable)."""
+    import subprocess  # only alias lookups need it (~3 ms to import)
+    try:
+        r = subprocess.run(["git", "config", "--get-regexp", r"^alias\."], cwd=directory or None,
+                           capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return {}
+    aliases = {}
+    for line in r.stdout.splitlines():
+        key, _, value = line.partition(" ")
+        aliases.setdefault(key[len("alias."):], value)
+    return aliases
+
+
+def _resolve(directory: str, aliases: dict, argv: tuple, out: list, depth: int = 0):
+    if not argv:
+        return
+    sub, args = argv[0], argv[1:]
+    if sub not in GIT_BUILTINS and depth < _ALIAS_DEPTH:
+        expansion = aliases.get(sub)
+        if expansion is None:
+            expansion = _config_aliases(os.path.abspath(directory) if directory else os.getcwd()).get(sub)
+        if expansion is not None:
+            if expansion.startswith("!"):  # shell alias: its own command line, then the args
+                for d, inline, a in _git_invocations(expansion[1:]):
+                    _resolve(d or directory, {**aliases, **dict(inline)}, a, out, depth + 1)
+                return
+            words = [w for cmd in parse_commands(expansion) for w in cmd]
+            _resolve(directory, aliases, tuple(words) + args, out, depth + 1)
+            return
+    out.append(GitCall(directory, sub, args))
+
+
+def git_calls(command: str) -> list:
+    """Return a GitCall for every git subcommand the command line would run, aliases expanded."""
+    out = []
+    for directory, inline, argv in _git_invocations(command):
+        _resolve(directory, dict(inline), argv, out)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Options of particular subcommands
+# ---------------------------------------------------------------------------
+
+# git commit options whose value may be the next word, short ones that
+# take the rest of their cluster (`-mfix`) as the value, and short ones whose
+# optional value can only be attached (`-uno`, `-Skeyid`)
+_COMMIT_VALUE_LONG = {"--message", "--file", "--reuse-message", "--reedit-message", "--template",
+                      "--author", "--date", "--cleanup", "--fixup", "--squash", "--trailer",
+                      "--pathspec-from-file"}
+_COMMIT_VALUE_SHORT = "mFCct"
+_COMMIT_INLINE_SHORT = "uS"
+
+
+def _commit_words(args: tuple):
+    """Yield (is_flag, word) for `git commit <args>`: flags — long ones whole, short
+    clusters one letter at a time — and pathspecs, skipping option values."""
+    i = 0
+    while i < len(args):
+        a = args[i]
+        i += 1
+        if a == "--":
+            for path in args[i:]:
+                yield False, path
+            return
+        if a.startswith("--"):
+            yield True, a
+            if a in _COMMIT_VALUE_LONG:
+                i += 1
+        elif a.startswith("-") and len(a) > 1:
+            for j, c in enumerate(a[1:], 1):
+                if c in _COMMIT_VALUE_SHORT:
+                    if j == len(a) - 1:
+                        i += 1  # value is the next word
+                    break
+                yield True, "-" + c
+                if c in _COMMIT_INLINE_SHORT:
+                    break  # the rest of the cluster is its value
+        else:
+            yield False, a
+
+
+def _commit_flags(args: tuple):
+    return (word for is_flag, word in _commit_words(args) if is_flag)
+
+
+def commit_skips_hooks(args: tuple) -> bool:
+    """True if `git commit <args>` bypasses hooks (--no-verify / -n, last one wins)."""
+    skip = False
+    for flag in _commit_flags(args):
+        if flag == "-n" or (len(flag) >= len("--no-v") and "--no-verify".startswith(flag)):  # git accepts unique prefixes
+            skip = True
+        elif flag == "--verify":
+            skip = False
+    return skip
+
+
+def commit_stages_all(args: tuple) -> bool:
+    """True if `git commit <args>` also commits unstaged changes to tracked files (-a / --all)."""
+    return any(flag in ("-a", "--all") for flag in _commit_flags(args))
+
+
+def commit_pathspecs(args: tuple) -> list:
+    """The pathspecs of `git commit <args>`, whose working-tree contents are committed too."""
+    return [word for is_flag, word in _commit_words(args) if not is_flag]
+
+
+_ADD_VALUE_LONG = {"--chmod", "--pathspec-from-file"}
+
+
+def add_pathspecs(args: tuple) -> tuple:
+    """Return (pathspecs, tracked_only) for `git add <args>`; tracked_only for -u / --update."""
+    paths, tracked_only, i = [], False, 0
+    while i < len(args):
+        a = args[i]
+        i += 1
+        if a == "--":
+            paths += args[i:]
+            break
+        if a.startswith("--"):
+            tracked_only = tracked_only or a == "--update"
+            if a in _ADD_VALUE_LONG:
+                i += 1
+        elif a.startswith("-") and len(a) > 1:
+            tracked_only = tracked_only or "u" in a[1:]
+        else:
+            paths.append(a)
+    return paths, tracked_only
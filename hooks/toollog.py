@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Structured tool-use log — SQLite store written by log-tool-use.py, plus a query CLI.
+
+Not a hook itself. log-tool-use.py writes here when AI_TOOLKIT_LOG_DB is set
+("1" for ~/.claude/tool-use.db, or a path). WAL mode keeps concurrent hook
+writes cheap; indexes on (session, ts) and (tool, ts) keep queries fast.
+
+Usage:
+  toollog.py query [--session S] [--tool T] [--since TS] [--until TS]
+                   [--group-by tool|session|hour] [--list] [--limit N] [--db PATH]
+
+Timestamps are local "YYYY-MM-DD HH:MM:SS"; prefixes work ("2026-10-17 10").
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    ts TEXT NOT NULL,
+    session TEXT NOT NULL,
+    tool TEXT NOT NULL,
+    duration_ms REAL,
+    file_path TEXT
+);
+CREATE INDEX IF NOT EXISTS calls_session_ts ON calls (session, ts);
+CREATE INDEX IF NOT EXISTS calls_tool_ts ON calls (tool, ts);
+CREATE INDEX IF NOT EXISTS calls_ts ON calls (ts);
+"""
+
+GROUP_KEYS = {"tool": "tool", "session": "session", "hour": "substr(ts, 1, 13)"}
+
+# path -> open connection, reused for the life of the process (hookd.py)
+_CONNECTIONS = {}
+
+
+def db_path() -> "Path | None":
+    """Return the configured store path, or None when structured logging is off."""
+    value = os.environ.get("AI_TOOLKIT_LOG_DB", "")
+    if not value or value == "0":
+        return None
+    if value == "1":
+        return Path.home() / ".claude" / "tool-use.db"
+    return Path(os.path.expanduser(value))
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    """Open (and create if needed) the store in WAL mode."""
+    conn = _CONNECTIONS.get(path)
+    if conn is None:
+        conn = sqlite3.connect(str(path), timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _CONNECTIONS[path] = conn
+    return conn
+
+
+def record(path: Path, ts: str, session: str, tool: str,
+           duration_ms: "float | None" = None, file_path: "str | None" = None):
+    """Append one call to the store."""
+    connect(path).execute(
+        "INSERT INTO calls (ts, session, tool, duration_ms, file_path) VALUES (?, ?, ?, ?, ?)",
+        (ts, session, tool, duration_ms, file_path),
+    )
+
+
+def _where(args) -> tuple[str, list]:
+    clauses, params = [], []
+    if args.session:
+        clauses.append("session = ?")
+        params.append(args.session)
+    if args.tool:
+        clauses.append("tool = ?")
+        params.append(args.tool)
+    if args.since:
+        clauses.append("ts >= ?")
+        params.append(args.since.replace("T", " "))
+    if args.until:
+        # Inclusive of the whole prefix: "--until 11:00" still counts 11:00:59
+        clauses.append("ts < ?")
+        params.append(args.until.replace("T", " ") + "\uffff")
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def query(args) -> int:
+    """Print a count, a grouped summary, or matching rows."""
+    path = Path(os.path.expanduser(args.db)) if args.db else (db_path() or Path.home() / ".claude" / "tool-use.db")
+    if not path.exists():
+        print(f"No tool-use store at {path} (enable with AI_TOOLKIT_LOG_DB=1)", file=sys.stderr)
+        return 1
+    conn = connect(path)
+    where, params = _where(args)
+
+    if args.list:
+        sql = f"SELECT ts, session, tool, duration_ms, file_path FROM calls{where} ORDER BY ts LIMIT ?"
+        for ts, session, tool, duration, file_path in conn.execute(sql, params + [args.limit]):
+            extra = "".join(f" | {v}" for v in (duration, file_path) if v is not None)
+            print(f"{ts} | {session} | {tool}{extra}")
+    elif args.group_by:
+        key = GROUP_KEYS[args.group_by]
+        sql = (f"SELECT {key} AS k, COUNT(*), AVG(duration_ms) FROM calls{where} "
+               f"GROUP BY k ORDER BY COUNT(*) DESC LIMIT ?")
+        for k, count, avg in conn.execute(sql, params + [args.limit]):
+            print(f"{k}\t{count}" + (f"\t{avg:.1f} ms" if avg is not None else ""))
+    else:
+        (count,) = conn.execute(f"SELECT COUNT(*) FROM calls{where}", params).fetchone()
+        print(count)
+    return 0
+
+
+def main():
+    """Entry point for the `query` command."""
+    parser = argparse.ArgumentParser(prog="toollog.py", description="Query the structured tool-use log")
+    sub = parser.add_subparsers(dest="command", required=True)
+    q = sub.add_parser("query", help="Count, group or list tool calls")
+    q.add_argument("--db", help="Store path (default: AI_TOOLKIT_LOG_DB or ~/.claude/tool-use.db)")
+    q.add_argument("--session")
+    q.add_argument("--tool")
+    q.add_argument("--since", help="Inclusive lower bound, e.g. '2026-10-17 10:00'")
+    q.add_argument("--until", help="Inclusive upper bound (prefix), e.g. '2026-10-17 10:59'")
+    q.add_argument("--group-by", choices=sorted(GROUP_KEYS))
+    q.add_argument("--list", action="store_true", help="Print matching calls instead of a count")
+    q.add_argument("--limit", type=int, default=1000)
+    args = parser.parse_args()
+    return query(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,6 +6,11 @@ Dry-run by default. Use --apply to make changes.
 """
 
 import argparse
+import contextlib
+import copy
+import functools
+import hashlib
+import io
 import json
 import logging
 import os
@@ -13,8 +18,18 @@ import re
 import shutil
 import subprocess
 import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 # ---------------------------------------------------------------------------
 # Debug logging — enabled only with --debug, writes to debug.log
 # ---------------------------------------------------------------------------
@@ -29,6 +44,31 @@ def _init_debug_logging():
     log.addHandler(handler)
     log.setLevel(logging.DEBUG)
 
+# ---------------------------------------------------------------------------
+# Timing — opt-in with AI_TOOLKIT_METRICS, same JSON-lines sink as the hooks
+# (summarize with: python3 hooks/metrics.py summary)
+# ---------------------------------------------------------------------------
+
+@contextlib.contextmanager
+def _timed(span: str):
+    """Append a {"hook": "setup", "span": ..., "ms": ...} record for the enclosed block."""
+    value = os.environ.get("AI_TOOLKIT_METRICS", "")
+    if not value or value == "0":
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        path = _resolve_home() / ".claude" / "hook-metrics.jsonl" if value == "1" else Path(os.path.expanduser(value))
+        try:
+            with open(path, "a") as f:
+                f.write(json.dumps({"ts": round(time.time(), 3), "hook": "setup", "span": span, "ms": round(ms, 3)}) + "\n")
+        except OSError:
+            pass
+        log.debug("[TIMING] %s %.1fms", span, ms)
+
 # ---------------------------------------------------------------------------
 # Paths
 # ---------------------------------------------------------------------------
@@ -48,9 +88,17 @@ def _resolve_home() -> Path:
 
 TOOLKIT_DIR = Path(__file__).resolve().parent
 MANIFEST = TOOLKIT_DIR / "environment.md"
-TARGET_DIR = _resolve_home() / ".claude"
+HOME_DIR = _resolve_home()  # the home being synced; --homes switches it (_use_home)
+TARGET_DIR = HOME_DIR / ".claude"
 STATE_FILE = TARGET_DIR / ".ai-toolkit-managed.json"
 
+
+def _expand_home(path: str) -> Path:
+    """expanduser() against the home being synced rather than the invoking user's."""
+    if path == "~" or path.startswith(("~/", "~" + os.sep)):
+        return HOME_DIR / path[2:]
+    return Path(os.path.expanduser(path))
+
 # ---------------------------------------------------------------------------
 # Platform — detect once at startup
 # ---------------------------------------------------------------------------
@@ -58,6 +106,7 @@ STATE_FILE = TARGET_DIR / ".ai-toolkit-managed.json"
 STRATEGY = "symlink"  # or "windows" (junctions + hard links)
 
 
+@functools.lru_cache(maxsize=None)  # once per process, however many homes are synced
 def _detect_strategy():
     global STRATEGY
     test_dir = TOOLKIT_DIR / f".setup-test-{os.getpid()}"
@@ -90,34 +139,197 @@ def _detect_strategy():
         shutil.rmtree(test_dir, ignore_errors=True)
 
 
+# ---------------------------------------------------------------------------
+# Safe writes — temp file + os.replace (readers such as Claude Code never see
+# a torn file), an advisory lock around each --apply run's read-modify-write
+# of the state file and settings.json, and writes deferred to one per file.
+# ---------------------------------------------------------------------------
+
+LOCK_TIMEOUT = 30.0  # seconds; default for --lock-timeout
+
+_PENDING = {}  # path -> text to write, or None to delete
+
+
+def _write_atomic(path: Path, text: str):
+    """Write text to path via a temp file and os.replace, keeping path's permissions."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        if path.exists():
+            shutil.copymode(path, tmp)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _defer_write(path: Path, text: "str | None"):
+    """Queue a write (or, with None, a delete) for _flush_writes."""
+    _PENDING[path] = text
+
+
+def _flush_writes():
+    """Apply queued writes, one atomic replace per file."""
+    pending = dict(_PENDING)
+    _PENDING.clear()
+    for path, text in pending.items():
+        if text is None:
+            path.unlink(missing_ok=True)
+            log.debug("[WRITE] removed %s", path)
+        else:
+            _write_atomic(path, text)
+            log.debug("[WRITE] wrote %s bytes=%d", path, len(text))
+
+
+@contextlib.contextmanager
+def _run_lock(path: Path, timeout: float):
+    """Hold an exclusive advisory lock on path; TimeoutError after `timeout` seconds."""
+    deadline = time.monotonic() + timeout
+    with open(path, "a+") as f:
+        while True:
+            try:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"{path} held by another setup.py for {timeout:.0f}s") from None
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if not fcntl:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
 # ---------------------------------------------------------------------------
 # State file (JSON dict)
+#
+# On disk: {"entries": [{"type", "target", "source"}, ...]} (snapshot entries
+# also carry "files", see below). In memory the
+# entries are indexed — a dict keyed by target plus a source → targets map —
+# so every membership check is O(1). _state_save writes the list form back.
 # ---------------------------------------------------------------------------
 
+def _state_index(raw: dict) -> dict:
+    """Build the in-memory state from the on-disk form (first entry per target wins)."""
+    state = {k: v for k, v in raw.items() if k != "entries"}
+    entries, by_source = {}, {}
+    for e in raw.get("entries", []):
+        if not isinstance(e, dict) or "target" not in e or e["target"] in entries:
+            continue
+        entries[e["target"]] = e
+        by_source.setdefault(e.get("source", ""), set()).add(e["target"])
+    state["entries"] = entries
+    state["_by_source"] = by_source
+    return state
+
+
 def _state_load() -> dict:
     if STATE_FILE.exists():
         try:
-            return json.loads(STATE_FILE.read_text())
+            text = STATE_FILE.read_text()
+            raw = json.loads(text)
+            if isinstance(raw, dict) and isinstance(raw.get("entries", []), list):
+                state = _state_index(raw)
+                state["_text"] = text
+                return state
         except (json.JSONDecodeError, OSError):
             pass
-    return {"entries": []}
+    return _state_index({"entries": []})
 
 
 def _state_save(state: dict):
-    STATE_FILE.write_text(json.dumps(state, indent=2) + "\n")
+    """Queue the state file write — skipped when nothing changed since it was loaded."""
+    out = {"entries": list(state["entries"].values())}
+    out.update((k, v) for k, v in state.items() if k != "entries" and not k.startswith("_"))
+    text = json.dumps(out, indent=2) + "\n"
+    if text != state.get("_text"):
+        _defer_write(STATE_FILE, text)
 
 
 def _state_has(state: dict, target: str) -> bool:
-    return any(e["target"] == target for e in state["entries"])
+    return target in state["entries"]
+
 
+def _state_targets(state: dict, source: str) -> set:
+    """Targets recorded as links to `source`."""
+    return state["_by_source"].get(source, set())
 
-def _state_add(state: dict, link_type: str, target: str, source: str):
+
+def _state_add(state: dict, link_type: str, target: str, source: str, **extra):
     if not _state_has(state, target):
-        state["entries"].append({"type": link_type, "target": target, "source": source})
+        state["entries"][target] = {"type": link_type, "target": target, "source": source, **extra}
+        state["_by_source"].setdefault(source, set()).add(target)
 
 
 def _state_remove(state: dict, target: str):
-    state["entries"] = [e for e in state["entries"] if e["target"] != target]
+    entry = state["entries"].pop(target, None)
+    if entry is not None:
+        _state_targets(state, entry.get("source", "")).discard(target)
+
+
+# ---------------------------------------------------------------------------
+# Sync fingerprint — stored in the state file after a clean --apply. When
+# the manifest, setup.py, settings.json, the skills/hooks target directories
+# and the Files targets are all unchanged, the next run skips parsing and
+# checking and reports "All synced".
+# ---------------------------------------------------------------------------
+
+def _sha256(path: Path) -> "str | None":
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def _mtime(path: Path) -> "int | None":
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _link_sig(path: Path) -> "list | None":
+    """[inode, mtime_ns] of the path itself (not what it links to), or None if missing."""
+    try:
+        st = os.lstat(path)
+        return [st.st_ino, st.st_mtime_ns]
+    except OSError:
+        return None
+
+
+def _fingerprint(options: list, sources, links) -> dict:
+    """Everything an install result depends on, in JSON-comparable form.
+
+    sources: the manifest and its include: fragments. links: Files targets —
+    checked individually, since their parent dirs (e.g. ~/.claude itself)
+    may change for unrelated reasons.
+    """
+    settings = TARGET_DIR / "settings.json"
+    return {
+        "manifest": {p: _sha256(Path(p)) for p in sorted(sources)},
+        "setup": _sha256(Path(__file__)),
+        "settings": [_sha256(settings), _mtime(settings)],
+        "options": options,
+        "dirs": {str(d): _mtime(d) for d in (TARGET_DIR / "skills", TARGET_DIR / "hooks")},
+        "links": {p: _link_sig(Path(p)) for p in sorted({str(t) for t in links})},
+    }
+
+
+def _in_sync(state: dict, options: list) -> bool:
+    """True if nothing has changed since the fingerprint was recorded."""
+    recorded = state.get("fingerprint")
+    if not isinstance(recorded, dict) or not all(isinstance(recorded.get(k), dict) for k in ("manifest", "links")):
+        return False
+    # The recorded file lists are only trusted once every manifest hash matches
+    return _fingerprint(options, recorded["manifest"], recorded["links"]) == recorded
 
 
 # ---------------------------------------------------------------------------
@@ -145,21 +357,23 @@ def _is_link(target: Path) -> bool:
     return target.is_symlink() or _is_junction(target)
 
 
-def create_link(source: Path, target: Path, is_dir: bool, state: dict):
-    """Create a link from target → source, recording it in state."""
+def create_link(source: Path, target: Path, is_dir: bool) -> str:
+    """Create a link from target → source; return its state type.
+
+    Safe to call from worker threads — the caller records it in state.
+    """
     target.parent.mkdir(parents=True, exist_ok=True)
     if STRATEGY == "symlink":
         target.symlink_to(source, target_is_directory=is_dir)
-        _state_add(state, "symlink", str(target), str(source))
-    elif is_dir:
+        return "symlink"
+    if is_dir:
         subprocess.run(
             ["cmd", "/c", "mklink", "/J", str(target), str(source)],
             capture_output=True, check=True,
         )
-        _state_add(state, "junction", str(target), str(source))
-    else:
-        os.link(str(source), str(target))
-        _state_add(state, "hardlink", str(target), str(source))
+        return "junction"
+    os.link(str(source), str(target))
+    return "hardlink"
 
 
 def remove_link(target: Path):
@@ -182,35 +396,212 @@ def remove_link(target: Path):
         target.unlink()
 
 
-def is_managed(target: Path, state: dict) -> bool:
-    """Return True if target is a toolkit-created link or recorded in state."""
-    if _is_link(target):
+# ---------------------------------------------------------------------------
+# Directory scan cache — one os.scandir per directory. DirEntry caches the
+# file type from the directory read, so classifying an entry costs no extra
+# stat/lstat. Used only for planning; cleared once changes are made.
+# ---------------------------------------------------------------------------
+
+_SCANS = {}  # str(dir) -> {name: os.DirEntry}
+
+
+def _scan(directory: "Path | str") -> dict:
+    """Return {name: DirEntry} for a directory ({} if missing or unreadable)."""
+    key = str(directory)
+    entries = _SCANS.get(key)
+    if entries is None:
         try:
-            if str(TOOLKIT_DIR) in str(target.resolve()):
-                return True
+            with os.scandir(directory) as it:
+                entries = {e.name: e for e in it}
         except OSError:
-            pass
+            entries = {}
+        _SCANS[key] = entries
+    return entries
+
+
+def _forget_scans():
+    _SCANS.clear()
+
+
+def _kind(path: Path) -> str:
+    """Classify path from its parent's scan: "link", "dir", "file" or "missing"."""
+    e = _scan(path.parent).get(path.name)
+    if e is None:
+        return "missing"
+    if e.is_symlink():
+        return "link"
+    if e.is_dir(follow_symlinks=False):
+        is_junction = getattr(e, "is_junction", None)  # Python 3.12+
+        if sys.platform == "win32" and (is_junction() if is_junction else _is_junction(path)):
+            return "link"
+        return "dir"
+    return "file"
+
+
+def _source_kind(path: Path) -> str:
+    """Like _kind, but follows symlinks: "dir", "file" or "missing"."""
+    e = _scan(path.parent).get(path.name)
+    try:
+        if e is not None and e.is_dir():
+            return "dir"
+        if e is not None and e.is_file():
+            return "file"
+    except OSError:
+        pass
+    return "missing"
+
+
+def _under(path: str, roots) -> bool:
+    return any(path == str(r) or path.startswith(str(r) + os.sep) for r in roots)
+
+
+def _points_into(link: Path, roots) -> bool:
+    """True if a link resolves into one of the toolkit dirs (readlink first, resolve() as fallback)."""
+    try:
+        if _under(os.readlink(link), roots):
+            return True
+        return _under(str(link.resolve()), roots)
+    except OSError:
+        return False
+
+
+def is_managed(target: Path, state: dict) -> bool:
+    """Return True if target is a link into any toolkit layer or recorded in state."""
+    if _kind(target) == "link" and _points_into(target, LAYERS):
+        return True
     return _state_has(state, str(target))
 
 
 # ---------------------------------------------------------------------------
-# Manifest parser — single pass, also extracts settings.json hook block
+# Manifest model — environment.md plus any `include: <path>` fragments,
+# parsed in one pass per file and cached under ~/.claude (never inside a
+# toolkit checkout, which may belong to someone else). The cache is
+# reused while every file it was built from still has the same hash; a file
+# whose size and mtime are unchanged is trusted without rehashing. hooks/
+# dispatch.py reads the same cache file for its Hooks rows.
 # ---------------------------------------------------------------------------
 
-def parse_manifest() -> tuple[list, list, dict, list]:
-    """Return (skills, hooks, settings_hooks, files).
+_MANIFEST_CACHE_VERSION = 2
+MANIFEST_CACHE_DIR = TARGET_DIR / ".ai-toolkit-manifest-cache"
+
+_INCLUDE_RE = re.compile(r"^include:\s*(\S.*?)\s*$")
+
+# A Hooks table cell with no matcher: "_(none — all tools)_", "—" or empty
+_NO_MATCHER_RE = re.compile(r"^(_\(.*\)_|—|-)?$")
+
+
+class Item:
+    """A Skills or Hooks row."""
+    __slots__ = ("name", "install")
+
+    def __init__(self, name: str, install: bool):
+        self.name = name
+        self.install = install
 
-    skills/hooks: [(name, install_bool), ...]
-    settings_hooks: the parsed JSON "hooks" dict from the ```json block, or {}
-    files: [(source_rel, target_path, install_bool), ...]
+
+class HookItem(Item):
+    """A Hooks row: event as written (helpers say _(helper)_), matcher or None for all tools."""
+    __slots__ = ("event", "matcher")
+
+    def __init__(self, name: str, install: bool, event: str = "", matcher: "str | None" = None):
+        super().__init__(name, install)
+        self.event = event
+        self.matcher = matcher
+
+
+class FileItem:
+    """A Files row: source relative to the toolkit, target path (may start with ~)."""
+    __slots__ = ("source", "target", "install")
+
+    def __init__(self, source: str, target: str, install: bool):
+        self.source = source
+        self.target = target
+        self.install = install
+
+
+class Manifest:
+    """Everything setup.py reads from the manifest, in file order."""
+    __slots__ = ("skills", "hooks", "settings_hooks", "files", "sources", "stats")
+
+    def __init__(self):
+        self.skills = []          # [Item]
+        self.hooks = []           # [HookItem]
+        self.settings_hooks = {}  # event -> [entry] from the ```json blocks
+        self.files = []           # [FileItem]
+        self.sources = {}         # str(path) -> sha256 of every file parsed
+        self.stats = {}           # str(path) -> [size, mtime_ns] when it was hashed
+
+    def to_json(self) -> dict:
+        return {
+            "skills": [[i.name, i.install] for i in self.skills],
+            "hooks": [[i.name, i.install, i.event, i.matcher] for i in self.hooks],
+            "settings_hooks": self.settings_hooks,
+            "files": [[f.source, f.target, f.install] for f in self.files],
+            "sources": self.sources,
+            "stats": self.stats,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Manifest":
+        m = cls()
+        m.skills = [Item(*row) for row in data["skills"]]
+        m.hooks = [HookItem(*row) for row in data["hooks"]]
+        m.settings_hooks = data["settings_hooks"]
+        m.files = [FileItem(*row) for row in data["files"]]
+        m.sources = data["sources"]
+        m.stats = data["stats"]
+        return m
+
+
+def _stat_key(path: Path) -> list:
+    """[size, mtime_ns] — the cheap check that lets a cache hit skip rehashing."""
+    st = path.stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _cells(row: str) -> list:
+    """Split a table row on unescaped pipes: "Write\\|Edit" is one cell."""
+    return [c.strip().replace("\\|", "|") for c in re.split(r"(?<!\\)\|", row.strip("|"))]
+
+
+def _parse_into(manifest: Manifest, path: Path):
+    """Parse one manifest file into `manifest`, following include: lines.
+
+    A file already parsed (diamond or circular include) is skipped.
     """
-    text = MANIFEST.read_text()
-    skills, hooks, files = [], [], []
-    settings_hooks = {}
+    path = path.resolve()
+    if str(path) in manifest.sources:
+        return
+    stat = _stat_key(path)
+    data = path.read_bytes()
+    manifest.sources[str(path)] = hashlib.sha256(data).hexdigest()
+    manifest.stats[str(path)] = stat
 
-    current_table = None
-    for line in text.splitlines():
+    current_table, json_lines, json_done = None, None, False
+    for line in data.decode("utf-8").splitlines():
         s = line.strip()
+        # First ```json block of each file: its "hooks" merge into settings_hooks
+        if json_lines is not None:
+            if not s.startswith("```"):
+                json_lines.append(line)
+                continue
+            try:
+                blob = json.loads("\n".join(json_lines))
+                for event, entries in blob.get("hooks", {}).items():
+                    manifest.settings_hooks.setdefault(event, []).extend(entries)
+            except (json.JSONDecodeError, AttributeError):
+                pass
+            json_lines, json_done = None, True
+            continue
+        if s.startswith("```json") and not json_done:
+            json_lines, current_table = [], None
+            continue
+        m = _INCLUDE_RE.match(s)
+        if m:
+            _parse_into(manifest, path.parent / os.path.expanduser(m.group(1)))
+            current_table = None
+            continue
+
         if s.startswith("| Name") and "Install" in s:
             current_table = "skills"
             continue
@@ -223,248 +614,801 @@ def parse_manifest() -> tuple[list, list, dict, list]:
         if current_table and s.startswith("|---"):
             continue
         if current_table and s.startswith("|"):
-            parts = [p.strip() for p in s.strip("|").split("|")]
+            parts = _cells(s)
             if current_table == "skills":
-                name = parts[0].strip()
-                install = parts[1].strip().lower().startswith("yes")
-                skills.append((name, install))
+                manifest.skills.append(Item(parts[0], parts[1].lower().startswith("yes")))
             elif current_table == "hooks":
-                name = parts[0].strip()
-                install = parts[1].strip().lower().startswith("yes")
-                hooks.append((name, install))
+                event, matcher = (parts + ["", ""])[2:4]
+                manifest.hooks.append(HookItem(parts[0], parts[1].lower().startswith("yes"), event,
+                                               None if _NO_MATCHER_RE.match(matcher) else matcher))
             elif current_table == "files":
-                source_rel = parts[0].strip()
-                target_path = parts[1].strip()
-                install = parts[2].strip().lower().startswith("yes")
-                files.append((source_rel, target_path, install))
+                manifest.files.append(FileItem(parts[0], parts[1], parts[2].lower().startswith("yes")))
         elif current_table and not s.startswith("|"):
             current_table = None
 
-    m = re.search(r"```json\s*\n(.*?)```", text, re.DOTALL)
-    if m:
-        try:
-            blob = json.loads(m.group(1))
-            settings_hooks = blob.get("hooks", {})
-        except json.JSONDecodeError:
-            pass
 
-    return skills, hooks, settings_hooks, files
+def parse_manifest(path: Path = MANIFEST) -> Manifest:
+    """Parse the manifest and its includes (no cache)."""
+    manifest = Manifest()
+    _parse_into(manifest, path)
+    return manifest
+
+
+def _manifest_cache(path: Path) -> Path:
+    """Where the parsed form of one manifest is cached: keyed by its resolved path."""
+    key = hashlib.sha256(str(path.resolve()).encode()).hexdigest()
+    return MANIFEST_CACHE_DIR / f"{key}.json"
+
+
+def load_manifest(path: Path = MANIFEST, save: bool = True) -> Manifest:
+    """Return the manifest from its cache file if no source changed, else parse and cache it.
+
+    save=False (dry runs) reads the cache but never writes it.
+
+    Only sources whose size or mtime moved are rehashed; if they all still
+    match, the cache is rewritten with the new stats and reused.
+    """
+    cache = _manifest_cache(path)
+    manifest = None
+    try:
+        cached = json.loads(cache.read_text())
+        if cached.get("version") == _MANIFEST_CACHE_VERSION:
+            data = cached["manifest"]
+            touched = {p: _stat_key(Path(p)) for p in data["sources"]}
+            touched = {p: st for p, st in touched.items() if data["stats"].get(p) != st}
+            if all(_sha256(Path(p)) == data["sources"][p] for p in touched):
+                log.debug("[MANIFEST] cache hit %s (%d rehashed)", cache, len(touched))
+                manifest = Manifest.from_json(data)
+                if not touched or not save:
+                    return manifest
+                manifest.stats.update(touched)
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    if manifest is None:
+        manifest = parse_manifest(path)
+    if not save:
+        return manifest
+    try:
+        cache.parent.mkdir(exist_ok=True)  # not ~/.claude itself
+        _write_atomic(cache, json.dumps({"version": _MANIFEST_CACHE_VERSION, "manifest": manifest.to_json()}))
+        log.debug("[MANIFEST] cached %s", cache)
+    except OSError:
+        pass  # no ~/.claude yet, or not writable: parse every time
+    return manifest
+
+
+# ---------------------------------------------------------------------------
+# Layers — the toolkit holding setup.py first, then each --layer toolkit on
+# top (e.g. company, team, personal). Later layers override earlier ones by
+# skill name, hook name and Files target. All layers are resolved once into
+# an Index that says which layer wins each target; it drives both install
+# and uninstall, so one run and one state file cover the whole stack.
+# ---------------------------------------------------------------------------
+
+LAYERS = [TOOLKIT_DIR]  # set by main from --layer or the state file
+_MANIFESTS = {}  # layer dir -> Manifest, parsed once per process (shared by --homes)
+
+
+class Resolved:
+    """The winning row for one target."""
+    __slots__ = ("name", "layer", "source", "target", "install")
+
+    def __init__(self, name: str, layer: Path, source: Path, target: Path, install: bool):
+        self.name = name
+        self.layer = layer
+        self.source = source
+        self.target = target
+        self.install = install
+
+
+class Index:
+    """Merged view of every layer; dicts keep first-seen order."""
+    __slots__ = ("skills", "hooks", "files", "settings_hooks", "sources")
+
+    def __init__(self):
+        self.skills = {}          # name -> Resolved
+        self.hooks = {}           # name -> Resolved
+        self.files = {}           # str(target) -> Resolved
+        self.settings_hooks = {}  # event -> [entry]
+        self.sources = {}         # manifest files of every layer -> sha256
+
+
+def _layer_of(source: Path) -> Path:
+    """The (innermost) layer directory containing source."""
+    s = str(source)
+    return max((r for r in LAYERS if s.startswith(str(r) + os.sep)), key=lambda r: len(str(r)), default=TOOLKIT_DIR)
+
+
+def _layer_manifest(layer: Path, save: bool = True) -> Manifest:
+    m = _MANIFESTS.get(layer)
+    if m is None:
+        m = _MANIFESTS[layer] = load_manifest(layer / "environment.md", save)
+    return m
+
+
+def resolve_layers(manifests: list) -> Index:
+    """Merge [(layer_dir, Manifest), ...] in order; later layers win."""
+    index = Index()
+    for layer, m in manifests:
+        for i in m.skills:
+            if i.name in index.skills:
+                log.debug("[LAYER] skill %s: %s overrides %s", i.name, layer, index.skills[i.name].layer)
+            index.skills[i.name] = Resolved(i.name, layer, layer / "skills" / i.name,
+                                            TARGET_DIR / "skills" / i.name, i.install)
+        for i in m.hooks:
+            if i.name in index.hooks:
+                log.debug("[LAYER] hook %s: %s overrides %s", i.name, layer, index.hooks[i.name].layer)
+            index.hooks[i.name] = Resolved(i.name, layer, layer / "hooks" / i.name,
+                                           TARGET_DIR / "hooks" / i.name, i.install)
+        for f in m.files:
+            target = _expand_home(f.target)
+            if str(target) in index.files:
+                log.debug("[LAYER] file %s: %s overrides %s", target, layer, index.files[str(target)].layer)
+            index.files[str(target)] = Resolved(f.source, layer, layer / f.source, target, f.install)
+        index.sources.update(m.sources)
+
+    # Registrations: one entry per command (a later layer's entry replaces an
+    # earlier one), dropped when the winning Hooks row says not to install it
+    for layer, m in manifests:
+        for event, entries in m.settings_hooks.items():
+            by_cmd = index.settings_hooks.setdefault(event, {})
+            for entry in entries:
+                by_cmd[entry["hooks"][0]["command"]] = entry
+    for event, by_cmd in index.settings_hooks.items():
+        kept = []
+        for cmd, entry in by_cmd.items():
+            m = DIRECT_HOOK_RE.match(cmd)
+            hook = index.hooks.get(m.group(2)) if m else None
+            if hook is None or hook.install:
+                kept.append(entry)
+        index.settings_hooks[event] = kept
+    return index
+
+
+def _select_layers(requested: list, forget: bool, state: dict) -> list:
+    """Layer dirs for this run: --layer args, else those remembered in state."""
+    if forget:
+        extra = []
+    elif requested:
+        extra = [Path(os.path.expanduser(d)).resolve() for d in requested]
+    else:
+        extra = [Path(d) for d in state.get("layers", [])]
+    layers = [TOOLKIT_DIR]
+    for d in extra:
+        if d not in layers:
+            layers.append(d)
+    return layers
 
 
 # ---------------------------------------------------------------------------
 # Settings.json merge
 # ---------------------------------------------------------------------------
 
-# Matches only toolkit-managed hook commands (both old bash and new python forms)
-MANAGED_HOOK_RE = re.compile(r"^(bash|python3?) ~/\.claude/hooks/\S+\.(sh|py)$")
+# Matches exactly the hook commands setup.py writes: old bash and direct
+# python registrations "python3 ~/.claude/hooks/<hook>.py", the hookc.py
+# daemon-client form "python3 ~/.claude/hooks/hookc.py <hook>.py", and the
+# dispatcher form "python3 ~/.claude/hooks/dispatch.py <Event>" (possibly
+# through hookc.py). A command with any other arguments is the user's own.
+MANAGED_HOOK_RE = re.compile(r"^(?:bash|python3?) ~/\.claude/hooks/(?:"
+                             r"(?:hookc\.py )?dispatch\.py (?P<event>\w+)"
+                             r"|hookc\.py (?P<wrapped>[^\s/]+\.py)"
+                             r"|(?P<hook>[^\s/]+\.(?:sh|py)))$")
+
+# A direct registration as written in environment.md, with optional event arg
+DIRECT_HOOK_RE = re.compile(r"^(python3?) ~/\.claude/hooks/(\S+\.py)((?: \w+)?)$")
+
+
+def _via_dispatcher(expected_hooks: dict) -> dict:
+    """Replace each event's entries with one dispatch.py entry (it matches tools itself)."""
+    return {
+        event: [{"hooks": [{"type": "command", "command": f"python3 ~/.claude/hooks/dispatch.py {event}"}]}]
+        for event in expected_hooks
+    }
+
+
+def _via_daemon(expected_hooks: dict) -> dict:
+    """Rewrite direct hook commands to run through the hookc.py daemon client."""
+    wrapped = copy.deepcopy(expected_hooks)
+    for entries in wrapped.values():
+        for entry in entries:
+            for h in entry.get("hooks", []):
+                m = DIRECT_HOOK_RE.match(h.get("command", ""))
+                if m and m.group(2) != "hookc.py":
+                    h["command"] = f"{m.group(1)} ~/.claude/hooks/hookc.py {m.group(2)}{m.group(3)}"
+    return wrapped
+
+
+# Hook-command index. Every settings entry is reduced once to a key
+# (event, matcher, canonical commands); install, uninstall and duplicate
+# pruning are then set lookups on those keys. Canonical form collapses
+# whitespace and treats "python" and "python3" alike, so Windows entries
+# (rewritten to "python") match the manifest's "python3" ones.
+
+def _canonical(cmd: str) -> str:
+    return re.sub(r"^python3? ", "python3 ", " ".join(cmd.split()))
+
+
+def _entry_key(event: str, entry: dict) -> tuple:
+    cmds = tuple(_canonical(h.get("command", "")) for h in entry.get("hooks", []) if isinstance(h, dict))
+    return event, entry.get("matcher", ""), cmds
+
+
+@functools.lru_cache(maxsize=None)
+def _is_managed_cmd(cmd: str) -> bool:
+    """True for a toolkit-managed command (memoized: duplicates repeat the same few)."""
+    return MANAGED_HOOK_RE.match(cmd) is not None
+
+
+def _registration(cmd: str) -> "tuple | None":
+    """("hook", name) or ("event", Event) for a managed command, else None."""
+    m = MANAGED_HOOK_RE.match(cmd)
+    if not m:
+        return None
+    return ("event", m.group("event")) if m.group("event") else ("hook", m.group("wrapped") or m.group("hook"))
+
+
+def _registered_pairs(base_hooks: dict) -> set:
+    """(event, matcher, registration) for every hook the manifest registers, plus a
+    dispatcher registration per event — all the forms an expected hook may have had."""
+    pairs = set()
+    for event, entries in base_hooks.items():
+        pairs.add((event, "", ("event", event)))
+        for entry in entries:
+            _, matcher, cmds = _entry_key(event, entry)
+            for c in cmds:
+                reg = _registration(c)
+                if reg is not None:
+                    pairs.add((event, matcher, reg))
+    return pairs
+
+
+def _is_stale(key: tuple, registered: set) -> bool:
+    """True if the entry is another registration form of hooks the manifest registers.
+
+    Used for entries whose key is not expected: this is how switching
+    registration forms (direct, daemon client, dispatcher) replaces the old
+    entry instead of running the hook twice. A toolkit hook the user
+    registered under another event or matcher is theirs, and stays.
+    """
+    event, matcher, cmds = key
+    return bool(cmds) and all((event, matcher, _registration(c)) in registered for c in cmds)
+
+
+def _localize(entry: dict) -> dict:
+    """On Windows, rewrite python3 → python (python3 may not exist)."""
+    if sys.platform != "win32":
+        return entry
+    return dict(entry, hooks=[dict(h, command=h.get("command", "").replace("python3 ", "python "))
+                              for h in entry.get("hooks", [])])
 
 
-def _merge_settings(mode: str, expected_hooks: dict, dry_run: bool):
+def _merge_settings(mode: str, expected_hooks: dict, dry_run: bool, registered: set = frozenset(),
+                    prune: bool = False) -> bool:
+    """Add or remove toolkit hook entries. Returns False if settings.json was missing or unreadable.
+
+    Install also drops repeated toolkit entries; with prune, any entry that
+    repeats an earlier one (same event, matcher and commands) is dropped.
+    """
     settings_file = TARGET_DIR / "settings.json"
     if not settings_file.exists():
         print("  " + ("WARNING: settings.json not found — skipping" if mode == "install"
                        else "No settings.json — nothing to do"))
-        return
+        return False
 
     try:
         settings = json.loads(settings_file.read_text())
     except (json.JSONDecodeError, OSError) as e:
         print(f"  WARNING: could not parse settings.json — {e}")
-        return
+        return False
 
     changed = False
+    current = settings.get("hooks", {})
     if mode == "install":
-        settings.setdefault("hooks", {})
         # Each event (PreToolUse, PostToolUse) maps to a list of entries,
         # where each entry has a "hooks" array of {type, command} objects.
-        for event, entries in expected_hooks.items():
-            settings["hooks"].setdefault(event, [])
-            existing = {h.get("command", "") for e in settings["hooks"][event] for h in e.get("hooks", [])}
-            for entry in entries:
+        merged = {}
+        for event in list(current) + [e for e in expected_hooks if e not in current]:
+            wanted = {_entry_key(event, e): e for e in map(_localize, expected_hooks.get(event, []))}
+            kept, seen, duplicates = [], set(), 0
+            for entry in current.get(event, []):
+                key = _entry_key(event, entry)
+                if key in seen and (prune or all(_is_managed_cmd(c) for c in key[2])):
+                    duplicates += 1
+                elif event in expected_hooks and key not in wanted and _is_stale(key, registered):
+                    changed = True
+                    print(f"  {'[dry-run] would remove stale' if dry_run else 'REMOVED (stale)'}: {event}:{entry['hooks'][0].get('command', '')}")
+                else:
+                    kept.append(entry)
+                    seen.add(key)
+            if duplicates:
+                changed = True
+                print(f"  {'[dry-run] would remove' if dry_run else 'REMOVED'} {duplicates} duplicate(s): {event}")
+            for key, entry in wanted.items():
                 cmd = entry["hooks"][0]["command"]
-                # On Windows, rewrite python3 → python (python3 may not exist)
-                if sys.platform == "win32":
-                    cmd = cmd.replace("python3 ", "python ")
-                    entry = json.loads(json.dumps(entry).replace("python3 ", "python "))
-                if cmd in existing:
+                if key in seen:
                     print(f"  CURRENT: {event}:{cmd}")
                 else:
                     changed = True
-                    if dry_run:
-                        print(f"  [dry-run] would add: {event}:{cmd}")
-                    else:
-                        settings["hooks"][event].append(entry)
-                        print(f"  ADDED: {event}:{cmd}")
+                    kept.append(entry)
+                    seen.add(key)
+                    print(f"  {'[dry-run] would add' if dry_run else 'ADDED'}: {event}:{cmd}")
+            if kept:
+                merged[event] = kept
+        settings["hooks"] = merged
     else:  # uninstall
         if "hooks" not in settings:
             print("  No managed entries found")
-            return
-        for event in list(settings["hooks"]):
+            return True
+        for event in list(current):
             kept = []
-            for entry in settings["hooks"][event]:
-                if any(MANAGED_HOOK_RE.match(h.get("command", "")) for h in entry.get("hooks", [])):
-                    cmd = entry["hooks"][0]["command"]
+            for entry in current[event]:
+                key = _entry_key(event, entry)
+                if any(_is_managed_cmd(c) for c in key[2]):
                     changed = True
-                    print(f"  {'[dry-run] would remove' if dry_run else 'REMOVED'}: {event}:{cmd}")
+                    print(f"  {'[dry-run] would remove' if dry_run else 'REMOVED'}: {event}:{entry['hooks'][0].get('command', '')}")
                 else:
                     kept.append(entry)
-            settings["hooks"][event] = kept
+            current[event] = kept
             if not kept:
-                del settings["hooks"][event]
-        if not settings.get("hooks"):
-            settings.pop("hooks", None)
+                del current[event]
         if not changed:
             print("  No managed entries found")
+    if not settings.get("hooks"):
+        settings.pop("hooks", None)
 
     if changed and not dry_run:
-        settings_file.write_text(json.dumps(settings, indent=2) + "\n")
-        log.debug("[SETTINGS] wrote %s", settings_file)
+        _defer_write(settings_file, json.dumps(settings, indent=2) + "\n")
+        log.debug("[SETTINGS] queued write %s", settings_file)
         print("  settings.json updated")
+    return True
 
 
 # ---------------------------------------------------------------------------
-# Safe link / safe remove
+# Snapshot mode (--mode=snapshot) — for homes on slow network filesystems.
+# Instead of linking into the toolkit, every source file is copied once into
+# a content-addressed store under ~/.claude and the target is built from
+# hard links to the store's blobs (a skill becomes a real directory). The
+# state entry records each file's hash, keyed by source stat, so a later
+# sync re-hashes only touched files and copies only blobs it hasn't seen.
+# Blobs are read-only; a blob no target links to any more (link count 1)
+# is removed after the run.
 # ---------------------------------------------------------------------------
 
-def safe_link(source: Path, target: Path, is_dir: bool, state: dict, dry_run: bool):
-    """Create a link only if target is absent or already managed. Never touches local files."""
-    name = target.name
+MODE = "link"  # or "snapshot"; set by --mode or the state file
+STORE_DIR = TARGET_DIR / ".ai-toolkit-store"
 
-    if _is_link(target):
+
+def _snapshot_files(source: Path, is_dir: bool, known: dict) -> dict:
+    """Return {relpath: [sha256, executable, size, mtime_ns]} for the source.
+
+    A single file uses relpath "". Entries in `known` whose size and mtime
+    still match are reused without re-reading the file.
+    """
+    if is_dir:
+        paths = {}
+        for root, dirs, names in os.walk(source):
+            dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+            for n in sorted(names):
+                full = os.path.join(root, n)
+                paths[os.path.relpath(full, source).replace(os.sep, "/")] = full
+    else:
+        paths = {"": str(source)}
+    files = {}
+    for rel, full in paths.items():
+        st = os.stat(full)
+        prev = known.get(rel)
+        if prev and prev[2:] == [st.st_size, st.st_mtime_ns]:
+            files[rel] = prev
+            continue
+        h = hashlib.sha256()
+        with open(full, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        files[rel] = [h.hexdigest(), bool(st.st_mode & 0o111), st.st_size, st.st_mtime_ns]
+    return files
+
+
+def _blob(full: str, sha: str, executable: bool) -> Path:
+    """Return the store path for a file's content, copying it in if it isn't there yet."""
+    blob = STORE_DIR / sha[:2] / (sha[2:] + (".x" if executable else ""))
+    if not blob.exists():
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        tmp = blob.with_name(f".{blob.name}.{os.getpid()}.{threading.get_ident()}.tmp")
         try:
-            if str(TOOLKIT_DIR) in str(target.resolve()):
-                log.debug("[LINK] current name=%s target=%s", name, target)
-                print(f"  CURRENT: {name}")
-                return
+            shutil.copyfile(full, tmp)
+            os.chmod(tmp, 0o555 if executable else 0o444)
+            os.replace(tmp, blob)
+        finally:
+            tmp.unlink(missing_ok=True)
+    return blob
+
+
+def _place(blob: Path, dst: Path):
+    """Atomically make dst a hard link to blob (a copy across filesystems)."""
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+    try:
+        try:
+            os.link(blob, tmp)
         except OSError:
-            pass
-        if dry_run:
-            log.debug("[LINK] would-relink name=%s", name)
-            print(f"  [dry-run] would re-link: {name}")
-        else:
-            remove_link(target)
-            create_link(source, target, is_dir, state)
-            log.debug("[LINK] relinked name=%s source=%s", name, source)
-            print(f"  RE-LINKED: {name}")
+            shutil.copy2(blob, tmp)
+        os.replace(tmp, dst)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def create_snapshot(source: Path, target: Path, is_dir: bool, files: dict, old: dict) -> str:
+    """Build or update target from the store; only files whose hash changed are touched."""
+    if not is_dir:
+        sha, executable = files[""][:2]
+        target.parent.mkdir(parents=True, exist_ok=True)
+        _place(_blob(str(source), sha, executable), target)
+        return "snapshot"
+    target.mkdir(parents=True, exist_ok=True)
+    for rel in old.keys() - files.keys():
+        (target / rel).unlink(missing_ok=True)
+    for rel, (sha, executable, *_) in files.items():
+        dst = target / rel
+        if old.get(rel, [None])[0] == sha and dst.exists():
+            continue
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        _place(_blob(str(source / rel), sha, executable), dst)
+    return "snapshot"
+
+
+def remove_snapshot(target: Path, files: dict) -> list:
+    """Remove the files a snapshot installed, then directories left empty.
+
+    Anything else under target was added by the user and stays; returns
+    those leftovers (relative paths), empty when target is gone.
+    """
+    if "" in files:
+        target.unlink(missing_ok=True)
+        return []
+    for rel in files:
+        (target / rel).unlink(missing_ok=True)
+    for root, _, _ in os.walk(target, topdown=False):
+        with contextlib.suppress(OSError):
+            os.rmdir(root)  # only succeeds when empty
+    return _files_under(target)
+
+
+def _files_under(target: Path) -> list:
+    """Relative paths of the files under a directory ([] if it's gone)."""
+    return sorted(os.path.relpath(os.path.join(root, n), target).replace(os.sep, "/")
+                  for root, _, names in os.walk(target) for n in names)
+
+
+def plan_snapshot(source: Path, target: Path, is_dir: "bool | None", state: dict) -> tuple:
+    """Return (action, is_dir, files) for one snapshot target without changing anything."""
+    source_kind = _source_kind(source)
+    if is_dir is None:
+        if source_kind == "missing":
+            return MISSING, False, None
+        is_dir = source_kind == "dir"
+    elif source_kind != ("dir" if is_dir else "file"):
+        return MISSING, is_dir, None
+
+    kind = _kind(target)
+    entry = state["entries"].get(str(target))
+    if kind != "link" and kind != "missing" and entry is None:
+        return LOCAL, is_dir, None
+    previous = entry.get("files") if entry and entry.get("type") == "snapshot" else None
+    files = _snapshot_files(source, is_dir, previous or {})
+    if kind == "missing":
+        return CREATE, is_dir, files
+    if previous is None:
+        return RELINK, is_dir, files  # a link (or link-mode entry) becomes a snapshot
+    same = {rel: f[:2] for rel, f in files.items()} == {rel: f[:2] for rel, f in previous.items()}
+    return (CURRENT if same else UPDATE), is_dir, files
+
+
+def _store_gc():
+    """Remove blobs that no target links to any more; drop the store when it's empty."""
+    if not STORE_DIR.is_dir():
         return
+    removed = 0
+    for sub in STORE_DIR.iterdir():
+        if not sub.is_dir():
+            continue
+        for blob in sub.iterdir():
+            try:
+                if blob.stat().st_nlink <= 1:
+                    blob.unlink()
+                    removed += 1
+            except OSError:
+                pass
+        with contextlib.suppress(OSError):
+            sub.rmdir()  # only succeeds when empty
+    with contextlib.suppress(OSError):
+        STORE_DIR.rmdir()
+    log.debug("[STORE] gc removed=%d", removed)
 
+
+# ---------------------------------------------------------------------------
+# Safe link / safe remove — plan, then execute
+#
+# Every item is first classified (stat/resolve only, no changes), then the
+# CREATE/RELINK/REMOVE work runs on a thread pool of JOBS workers. Reports
+# and state updates happen on the main thread in manifest order, so output
+# is deterministic and the state dict is never touched concurrently.
+# ---------------------------------------------------------------------------
+
+CREATE, RELINK, CURRENT, LOCAL, MISSING = "CREATE", "RELINK", "CURRENT", "LOCAL", "MISSING"
+UPDATE = "UPDATE"  # snapshot mode: some files changed
+REMOVE, SKIP, ERROR = "REMOVE", "SKIP", "ERROR"
+WARNING = "WARNING"  # settings.json missing or unreadable
+
+JOBS = 8  # worker threads for filesystem work; set by --jobs
+
+
+def _pool_map(fn, items: list) -> list:
+    """Call fn(*item) for each item on the pool; return [(result, error), ...] in order."""
+    def call(item):
+        try:
+            return fn(*item), None
+        except (OSError, subprocess.CalledProcessError) as e:
+            return None, e
+    if JOBS <= 1 or len(items) <= 1:
+        return [call(item) for item in items]
+    # Hand out chunks rather than single items: per-task overhead dominates cheap calls
+    size = max(1, len(items) // (JOBS * 4))
+    chunks = [items[i:i + size] for i in range(0, len(items), size)]
+    with ThreadPoolExecutor(max_workers=min(JOBS, len(chunks))) as pool:
+        return [r for chunk in pool.map(lambda c: [call(item) for item in c], chunks) for r in chunk]
+
+
+def plan_link(source: Path, target: Path, is_dir: "bool | None", state: dict) -> tuple:
+    """Return (action, is_dir, None) for one link without changing anything.
+
+    is_dir=None takes the kind from the source (Files section).
+    """
+    source_kind = _source_kind(source)
+    if is_dir is None:
+        if source_kind == "missing":
+            return MISSING, False, None
+        is_dir = source_kind == "dir"
+    elif source_kind != ("dir" if is_dir else "file"):
+        return MISSING, is_dir, None
+
+    kind = _kind(target)
+    if kind == "link":
+        # A link into another layer is re-pointed at the layer that now wins
+        return (CURRENT if _points_into(target, [_layer_of(source)]) else RELINK), is_dir, None
+
+    entry = state["entries"].get(str(target))
     # Regular file/dir not in state → LOCAL (not ours, don't touch)
-    if (target.is_dir() if is_dir else target.is_file()) and not _state_has(state, str(target)):
-        kind = "directory" if is_dir else "file"
-        log.debug("[LINK] local name=%s kind=%s (not managed)", name, kind)
-        print(f"  LOCAL: {name} (regular {kind} — not managed)")
-        return
+    if kind == ("dir" if is_dir else "file") and entry is None:
+        return LOCAL, is_dir, None
+    # In state and exists → CURRENT (trust state file), unless it's a snapshot to replace
+    if entry is not None and kind != "missing":
+        return (RELINK if entry.get("type") == "snapshot" else CURRENT), is_dir, None
+    return CREATE, is_dir, None
 
-    # In state and exists → CURRENT (trust state file)
-    if _state_has(state, str(target)) and target.exists():
-        log.debug("[LINK] current name=%s (in state)", name)
-        print(f"  CURRENT: {name}")
-        return
 
-    # Doesn't exist → create
-    if dry_run:
-        log.debug("[LINK] would-create name=%s source=%s", name, source)
-        print(f"  [dry-run] would create: {name} -> {source}")
-    else:
-        create_link(source, target, is_dir, state)
-        log.debug("[LINK] created name=%s source=%s", name, source)
-        print(f"  CREATED: {name}")
+def _apply(action: str, source: Path, target: Path, is_dir: bool, files: "dict | None", entry: "dict | None") -> str:
+    """Execute one planned CREATE/RELINK/UPDATE; return the state type. Runs on the pool.
 
+    Returns LOCAL when a snapshot being replaced holds files the user added:
+    its own files are removed, the rest is left alone.
+    """
+    if action == RELINK:
+        if _remove_managed(target, entry):
+            return LOCAL
+    if files is None:
+        return create_link(source, target, is_dir)
+    old = entry.get("files", {}) if action == UPDATE and entry else {}
+    return create_snapshot(source, target, is_dir, files, old)
 
-def safe_remove(target: Path, state: dict, dry_run: bool) -> bool:
-    """Remove target only if it was created by us. Returns True if removed."""
-    if not is_managed(target, state):
-        log.debug("[LINK] skip-remove name=%s (not managed)", target.name)
-        print(f"  SKIP (not managed): {target.name}")
-        return False
-    if dry_run:
-        log.debug("[LINK] would-remove name=%s", target.name)
-        print(f"  [dry-run] would remove: {target.name}")
-    else:
-        remove_link(target)
-        _state_remove(state, str(target))
-        log.debug("[LINK] removed name=%s", target.name)
-        print(f"  REMOVED: {target.name}")
-    return True
 
+def _remove_managed(target: Path, entry: "dict | None") -> list:
+    """Remove one managed target; returns files left behind (a snapshot's user additions)."""
+    if entry and entry.get("type") == "snapshot" and "files" in entry:
+        return remove_snapshot(target, entry["files"])
+    remove_link(target)
+    return []
 
-# ---------------------------------------------------------------------------
-# Modes
-# ---------------------------------------------------------------------------
 
-def do_install(skills, hooks, expected_hooks, files, state, dry_run):
-    """Link skills, hooks, and files; merge settings.json entries."""
-    print("Skills:")
-    for name, install in skills:
-        if not install:
-            continue
-        src, tgt = TOOLKIT_DIR / "skills" / name, TARGET_DIR / "skills" / name
-        if not src.is_dir():
-            print(f"  WARNING: source not found: {src}")
-            continue
-        safe_link(src, tgt, is_dir=True, state=state, dry_run=dry_run)
-    print()
+def _leftover_text(name: str, leftovers: list) -> str:
+    return f"  LOCAL: {name} (kept {len(leftovers)} file(s) not installed by the toolkit)"
 
-    print("Hooks:")
-    for name, install in hooks:
-        if not install:
-            continue
-        src, tgt = TOOLKIT_DIR / "hooks" / name, TARGET_DIR / "hooks" / name
-        if not src.is_file():
-            print(f"  WARNING: source not found: {src}")
-            continue
-        safe_link(src, tgt, is_dir=False, state=state, dry_run=dry_run)
+
+def _row(action: str, target: Path, source: "Path | None", text: str, **extra) -> dict:
+    """One plan/result row: printed as `text`, emitted as the other fields by --format json."""
+    row = {"action": action, "name": target.name, "target": str(target), "text": text, **extra}
+    if source is not None:
+        row["source"] = str(source)
+    return row
+
+
+def safe_link(items: list, state: dict, dry_run: bool) -> tuple[list, Counter]:
+    """Link [(source, target, is_dir), ...] where target is absent or already managed.
+
+    Never touches local files. Returns (report rows in item order, outcome counts).
+    """
+    # One scandir per source and target directory, then plan from the cache
+    _pool_map(_scan, [(d,) for d in {os.path.dirname(str(p)) for source, target, _ in items
+                                     for p in (source, target)}])
+    plan = plan_snapshot if MODE == "snapshot" else plan_link
+    plans = [p for p, _ in _pool_map(lambda s, t, d: plan(s, t, d, state), items)]
+    # A target listed twice is only linked once
+    seen = set()
+    for i, ((action, is_dir, files), (_, target, _)) in enumerate(zip(plans, items)):
+        if action in (CREATE, RELINK, UPDATE) and target in seen:
+            plans[i] = (CURRENT, is_dir, files)
+        seen.add(target)
+
+    work = [] if dry_run else [
+        (functools.partial(_apply, action, source, target, is_dir, files, state["entries"].get(str(target))),)
+        for (action, is_dir, files), (source, target, _) in zip(plans, items) if action in (CREATE, RELINK, UPDATE)
+    ]
+    _forget_scans()
+    done = iter(_pool_map(lambda fn: fn(), work))
+
+    rows, counts = [], Counter()
+    for (action, is_dir, files), (source, target, _) in zip(plans, items):
+        name = target.name
+        counts[action] += 1
+        if action == MISSING:
+            text = f"  WARNING: source not found: {source}"
+        elif action == CURRENT:
+            log.debug("[LINK] current name=%s target=%s", name, target)
+            text = f"  CURRENT: {name}"
+            entry = state["entries"].get(str(target))
+            if files is not None and entry is not None and not dry_run:
+                entry["files"] = files  # same content, newer stat: skip re-hashing next time
+        elif action == LOCAL:
+            kind = "directory" if is_dir else "file"
+            log.debug("[LINK] local name=%s kind=%s (not managed)", name, kind)
+            text = f"  LOCAL: {name} (regular {kind} — not managed)"
+        elif dry_run:
+            log.debug("[LINK] would-%s name=%s source=%s", action.lower(), name, source)
+            text = (f"  [dry-run] would re-link: {name}" if action == RELINK
+                    else f"  [dry-run] would update: {name}" if action == UPDATE
+                    else f"  [dry-run] would create: {name} -> {source}")
+        else:
+            link_type, error = next(done)
+            if error is not None:
+                counts[action] -= 1
+                counts[ERROR] += 1
+                log.debug("[LINK] failed name=%s error=%s", name, error)
+                rows.append(_row(ERROR, target, source, f"  ERROR: {name} — {error}", error=str(error)))
+                continue
+            _state_remove(state, str(target))
+            if link_type == LOCAL:
+                counts[action] -= 1
+                counts[LOCAL] += 1
+                log.debug("[LINK] local name=%s (user files left in the snapshot)", name)
+                rows.append(_row(LOCAL, target, source, _leftover_text(name, _files_under(target))))
+                continue
+            _state_add(state, link_type, str(target), str(source),
+                       **({"files": files} if files is not None else {}))
+            log.debug("[LINK] %s name=%s source=%s", action.lower(), name, source)
+            text = f"  {'RE-LINKED' if action == RELINK else 'UPDATED' if action == UPDATE else 'CREATED'}: {name}"
+        rows.append(_row(action, target, source, text))
+    return rows, counts
+
+
+def safe_remove(targets: list, state: dict, dry_run: bool) -> tuple[list, Counter]:
+    """Remove each target only if it was created by us.
+
+    Returns (report rows in order, outcome counts).
+    """
+    _pool_map(_scan, [(d,) for d in {os.path.dirname(str(t)) for t in targets}])
+    plans = [plan for plan, _ in _pool_map(lambda t: REMOVE if is_managed(t, state) else SKIP,
+                                            [(t,) for t in targets])]
+    # A target listed twice is only removed once
+    seen = set()
+    for i, target in enumerate(targets):
+        if target in seen:
+            plans[i] = SKIP
+        seen.add(target)
+    work = [] if dry_run else [(t, state["entries"].get(str(t))) for t, action in zip(targets, plans)
+                               if action == REMOVE]
+    _forget_scans()
+    done = iter(_pool_map(_remove_managed, work))
+
+    rows, counts = [], Counter()
+    for target, action in zip(targets, plans):
+        name = target.name
+        counts[action] += 1
+        if action == SKIP:
+            log.debug("[LINK] skip-remove name=%s (not managed)", name)
+            text = f"  SKIP (not managed): {name}"
+        elif dry_run:
+            log.debug("[LINK] would-remove name=%s", name)
+            text = f"  [dry-run] would remove: {name}"
+        else:
+            leftovers, error = next(done)
+            if error is not None:
+                counts[action] -= 1
+                counts[ERROR] += 1
+                log.debug("[LINK] failed-remove name=%s error=%s", name, error)
+                rows.append(_row(ERROR, target, None, f"  ERROR: {name} — {error}", error=str(error)))
+                continue
+            _state_remove(state, str(target))
+            if leftovers:
+                counts[action] -= 1
+                counts[LOCAL] += 1
+                log.debug("[LINK] local name=%s (user files left in the snapshot)", name)
+                rows.append(_row(LOCAL, target, None, _leftover_text(name, leftovers)))
+                continue
+            log.debug("[LINK] removed name=%s", name)
+            text = f"  REMOVED: {name}"
+        rows.append(_row(action, target, None, text))
+    return rows, counts
+
+
+def _print_section(label: str, rows: list, report: dict):
+    """Print a section's rows and add them, tagged with the section, to the report's plan."""
+    print(label)
+    for row in rows:
+        print(row.pop("text"))
+        report["plan"].append({"section": label.rstrip(":").lower(), **row})
     print()
 
+
+def _settings_section(report: dict, fn, *args, **kwargs):
+    """Run a settings.json merge, printing its lines and keeping them for the report."""
     print("Settings.json:")
-    _merge_settings("install", expected_hooks, dry_run)
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        result = fn(*args, **kwargs)
+    print(out.getvalue(), end="")
+    report["settings"] = [line.strip() for line in out.getvalue().splitlines()]
     print()
+    return result
 
-    print("Files:")
-    for source_rel, target_path, install in files:
-        if not install:
-            continue
-        src = TOOLKIT_DIR / source_rel
-        tgt = Path(os.path.expanduser(target_path))
-        if not src.exists():
-            print(f"  WARNING: source not found: {src}")
-            continue
-        is_dir = src.is_dir()
-        safe_link(src, tgt, is_dir=is_dir, state=state, dry_run=dry_run)
-    print()
+
+# ---------------------------------------------------------------------------
+# Modes
+# ---------------------------------------------------------------------------
+
+def do_install(index: Index, expected_hooks, state, dry_run, report: dict, prune: bool = False) -> Counter:
+    """Link skills, hooks, and files; merge settings.json entries. Returns outcome counts."""
+    sections = [
+        [(r.source, r.target, True) for r in index.skills.values() if r.install],
+        [(r.source, r.target, False) for r in index.hooks.values() if r.install],
+        [(r.source, r.target, None) for r in index.files.values() if r.install],
+    ]
+    # One plan/execute pass over all three sections, reported per section below
+    rows, counts = safe_link([item for section in sections for item in section], state, dry_run)
+    n_skills, n_hooks = len(sections[0]), len(sections[1])
+
+    _print_section("Skills:", rows[:n_skills], report)
+    _print_section("Hooks:", rows[n_skills:n_skills + n_hooks], report)
+
+    with _timed("settings"):
+        if not _settings_section(report, _merge_settings, "install", expected_hooks, dry_run,
+                                 registered=_registered_pairs(index.settings_hooks), prune=prune):
+            counts[WARNING] += 1
+
+    _print_section("Files:", rows[n_skills + n_hooks:], report)
+    return counts
 
 
 def _iter_managed(subdir: str):
-    """Yield entry paths in a target subdirectory."""
+    """Yield entry paths in a target subdirectory (scanned once, sorted by name)."""
     d = TARGET_DIR / subdir
-    if not d.is_dir():
-        return
-    for entry in sorted(d.iterdir()):
-        yield entry
+    for name in sorted(_scan(d)):
+        yield d / name
 
 
-def do_uninstall(state, dry_run, expected_hooks, files):
-    """Remove all toolkit-managed links and settings.json entries."""
-    for label, subdir in [("Skills:", "skills"), ("Hooks:", "hooks")]:
-        print(label)
-        for entry in _iter_managed(subdir):
-            safe_remove(entry, state, dry_run)
-        print()
+def do_uninstall(index: Index, expected_hooks, state, dry_run, report: dict) -> Counter:
+    """Remove all toolkit-managed links and settings.json entries. Returns outcome counts."""
+    sections = [list(_iter_managed("skills")), list(_iter_managed("hooks")),
+                [r.target for r in index.files.values()]]
+    rows, counts = safe_remove([t for section in sections for t in section], state, dry_run)
+    n_skills, n_hooks = len(sections[0]), len(sections[1])
 
-    print("Settings.json:")
-    _merge_settings("uninstall", expected_hooks, dry_run)
-    print()
+    _print_section("Skills:", rows[:n_skills], report)
+    _print_section("Hooks:", rows[n_skills:n_skills + n_hooks], report)
 
-    print("Files:")
-    for source_rel, target_path, install in files:
-        tgt = Path(os.path.expanduser(target_path))
-        safe_remove(tgt, state, dry_run)
-    print()
+    _settings_section(report, _merge_settings, "uninstall", expected_hooks, dry_run)
+
+    _print_section("Files:", rows[n_skills + n_hooks:], report)
 
-    if not state["entries"] and not dry_run:
-        STATE_FILE.unlink(missing_ok=True)
     if not dry_run:
         print(f"Uninstall complete. Source repo at {TOOLKIT_DIR} still exists.")
+    return counts
 
 
 # ---------------------------------------------------------------------------
@@ -473,57 +1417,223 @@ def do_uninstall(state, dry_run, expected_hooks, files):
 
 def main():
     """Parse CLI args and run install or uninstall."""
-    parser = argparse.ArgumentParser(description="AI Toolkit setup")
+    global JOBS
+    parser = argparse.ArgumentParser(description="AI Toolkit setup", fromfile_prefix_chars="@")
     parser.add_argument("--uninstall", action="store_true")
     parser.add_argument("--apply", action="store_true", help="Make changes (default is dry-run)")
     parser.add_argument("--debug", action="store_true", help="Write debug.log with diagnostic trace")
+    parser.add_argument("--hook-daemon", action="store_true",
+                        help="Register hooks through the hookc.py client (one warm interpreter)")
+    parser.add_argument("--dispatch", action="store_true",
+                        help="Register one dispatch.py entry per event instead of one per hook")
+    parser.add_argument("--jobs", type=int, default=JOBS,
+                        help=f"Worker threads for link operations (default {JOBS}, 1 = serial)")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-check everything even if nothing changed since the last --apply")
+    parser.add_argument("--layer", action="append", default=[], metavar="DIR",
+                        help="Stack another toolkit on top; repeatable, later layers win (remembered after --apply)")
+    parser.add_argument("--no-layers", action="store_true", help="Forget remembered --layer toolkits")
+    parser.add_argument("--prune-duplicates", action="store_true",
+                        help="Also drop repeated settings.json hook entries that aren't the toolkit's")
+    parser.add_argument("--mode", choices=("link", "snapshot"),
+                        help="link (default) or snapshot: hard-linked copies from a store under ~/.claude, "
+                             "for slow network home directories (remembered after --apply)")
+    parser.add_argument("--lock-timeout", type=float, default=LOCK_TIMEOUT, metavar="SECS",
+                        help=f"Wait this long for another --apply to finish (default {LOCK_TIMEOUT:.0f})")
+    parser.add_argument("--format", choices=("text", "json"), default="text",
+                        help="json: print the plan and counts as one JSON document instead of text")
+    parser.add_argument("--homes", nargs="+", default=[], metavar="HOME",
+                        help="Sync these home directories (their .claude) in one run instead of $HOME; "
+                             "@FILE reads them one per line")
     args = parser.parse_args()
 
     if args.debug:
         _init_debug_logging()
 
     dry_run = not args.apply
+    JOBS = max(1, args.jobs)
+    as_json = args.format == "json"
 
-    log.debug("[INIT] toolkit=%s target=%s strategy=%s mode=%s",
-              TOOLKIT_DIR, TARGET_DIR, STRATEGY, "uninstall" if args.uninstall else ("apply" if args.apply else "dry-run"))
+    log.debug("[INIT] toolkit=%s homes=%d strategy=%s mode=%s", TOOLKIT_DIR, len(args.homes) or 1, STRATEGY,
+              "uninstall" if args.uninstall else ("apply" if args.apply else "dry-run"))
 
-    print(f"\nAI Toolkit Setup ({'dry run' if dry_run else 'apply'})")
-    print("=" * 40)
+    with contextlib.redirect_stdout(io.StringIO()) if as_json else contextlib.nullcontext():
+        print(f"\nAI Toolkit Setup ({'dry run' if dry_run else 'apply'})")
+        print("=" * 40)
 
     if not MANIFEST.exists():
         log.debug("[ERR] manifest not found: %s", MANIFEST)
-        print(f"ERROR: Manifest not found: {MANIFEST}")
+        if as_json:
+            print(json.dumps({"error": f"Manifest not found: {MANIFEST}"}, indent=2))
+        else:
+            print(f"ERROR: Manifest not found: {MANIFEST}")
+        sys.exit(1)
+
+    # Homes are synced one after another (state, settings.json and the lock
+    # are per home); manifests and the link strategy are loaded once and
+    # shared, and each home's link work runs on the --jobs pool
+    reports, failed = [], 0
+    for home in [Path(os.path.expanduser(h)).resolve() for h in args.homes] or [HOME_DIR]:
+        _use_home(home)
+        report = {"home": str(home), "dry_run": dry_run, "uninstall": args.uninstall, "plan": []}
+        with contextlib.redirect_stdout(io.StringIO()) if as_json else contextlib.nullcontext():
+            if args.homes:
+                print(f"\n=== {home} ===\n")
+            report["failed"] = _sync_home(args, dry_run, report)
+        failed += report["failed"]
+        reports.append(report)
+
+    log.debug("[DONE] finished failed=%d", failed)
+    if as_json:
+        print(json.dumps({"homes": reports, "failed": failed} if args.homes else reports[0], indent=2))
+        sys.exit(1 if failed else 0)
+    if failed:
+        print(f"Done with {failed} error(s).")
         sys.exit(1)
+    print("Done.")
 
-    if not TARGET_DIR.is_dir() and not dry_run:
-        TARGET_DIR.mkdir(parents=True, exist_ok=True)
 
-    _detect_strategy()
-    log.debug("[INIT] strategy=%s platform=%s", STRATEGY, sys.platform)
+def _use_home(home: Path):
+    """Point every per-home path at `home` (for --homes)."""
+    global HOME_DIR, TARGET_DIR, STATE_FILE, STORE_DIR, MANIFEST_CACHE_DIR
+    HOME_DIR = home
+    TARGET_DIR = home / ".claude"
+    STATE_FILE = TARGET_DIR / ".ai-toolkit-managed.json"
+    STORE_DIR = TARGET_DIR / ".ai-toolkit-store"
+    MANIFEST_CACHE_DIR = TARGET_DIR / ".ai-toolkit-manifest-cache"
+    _forget_scans()
+    _PENDING.clear()
+
+
+def _sync_home(args, dry_run: bool, report: dict) -> int:
+    """Lock the current home and run once. Returns the number of failures."""
+    try:
+        if not dry_run:
+            TARGET_DIR.mkdir(parents=True, exist_ok=True)
+        # One --apply at a time: the state file and settings.json are read,
+        # modified and written back under this lock
+        with _run_lock(TARGET_DIR / ".ai-toolkit.lock", args.lock_timeout) if not dry_run else contextlib.nullcontext():
+            return run(args, dry_run, report)
+    except TimeoutError as e:
+        log.debug("[ERR] lock timeout: %s", e)
+        report["error"] = f"another setup.py --apply is running ({e})"
+        print(f"ERROR: {report['error']}")
+    except OSError as e:
+        log.debug("[ERR] home unusable: %s", e)
+        report["error"] = f"{TARGET_DIR}: {e}"
+        print(f"ERROR: {report['error']}")
+    except SystemExit:
+        pass  # run() has printed and recorded the reason
+    if args.homes or args.format == "json":
+        return 1
+    sys.exit(1)
+
+
+def run(args, dry_run: bool, report: dict) -> int:
+    """Install or uninstall once arguments are parsed. Returns the number of failures."""
+    global LAYERS, MODE
+    with _timed("state-load"):
+        state = _state_load()
+    log.debug("[STATE] loaded entries=%d", len(state["entries"]))
+
+    LAYERS = _select_layers(args.layer, args.no_layers, state)
+    for layer in LAYERS[1:]:
+        if not (layer / "environment.md").is_file():
+            log.debug("[ERR] layer manifest not found: %s", layer)
+            report["error"] = f"Manifest not found: {layer / 'environment.md'}"
+            print(f"ERROR: {report['error']}")
+            sys.exit(1)
+    if len(LAYERS) > 1:
+        state["layers"] = [str(d) for d in LAYERS[1:]]
+    else:
+        state.pop("layers", None)
+    MODE = args.mode or state.get("mode", "link")
+    if MODE == "snapshot" and sys.platform == "win32":
+        print("Note: --mode snapshot needs POSIX file modes (read-only store blobs can't be replaced "
+              "or removed on Windows); using links.\n")
+        MODE = "link"
+    if MODE == "snapshot":
+        state["mode"] = MODE
+    else:
+        state.pop("mode", None)
+    options = sorted(opt for opt in ("dispatch", "hook_daemon") if getattr(args, opt))
+    options += [f"layer:{d}" for d in LAYERS[1:]] + [f"mode:{MODE}"]
+    report.update(mode=MODE, layers=[str(d) for d in LAYERS], synced=False)
+
+    if not args.uninstall and not args.force and not args.prune_duplicates and _in_sync(state, options):
+        log.debug("[SYNC] fingerprint unchanged — skipping")
+        print("All synced (nothing changed since the last --apply; --force re-checks).")
+        report.update(synced=True, counts={})
+        return 0
+    state.pop("fingerprint", None)
+
+    if MODE == "snapshot":
+        print(f"Note: Snapshot mode — copies from {STORE_DIR} instead of links.\n")
+    else:
+        _detect_strategy()
+    log.debug("[INIT] strategy=%s mode=%s platform=%s", STRATEGY, MODE, sys.platform)
     if STRATEGY == "windows":
         print("Note: Using junctions + hard links (symlinks not available).\n")
 
-    skills, hooks, expected_hooks, files = parse_manifest()
-    log.debug("[MANIFEST] skills=%d hooks=%d settings_hook_events=%d files=%d",
-              len(skills), len(hooks), len(expected_hooks), len(files))
-    state = _state_load()
-    log.debug("[STATE] loaded entries=%d", len(state.get("entries", [])))
+    with _timed("manifest"):
+        try:
+            index = resolve_layers([(layer, _layer_manifest(layer, not dry_run)) for layer in LAYERS])
+        except (OSError, UnicodeDecodeError) as e:
+            log.debug("[ERR] manifest unreadable: %s", e)
+            report["error"] = f"Could not read manifest: {e}"
+            print(f"ERROR: {report['error']}")
+            sys.exit(1)
+    expected_hooks = index.settings_hooks
+    log.debug("[MANIFEST] layers=%d skills=%d hooks=%d settings_hook_events=%d files=%d", len(LAYERS),
+              len(index.skills), len(index.hooks), len(expected_hooks), len(index.files))
+    if len(LAYERS) > 1:
+        print("Layers (later wins):")
+        for layer in LAYERS:
+            won = [sum(r.layer == layer for r in d.values()) for d in (index.skills, index.hooks, index.files)]
+            print(f"  {layer} — {won[0]} skills, {won[1]} hooks, {won[2]} files")
+        print()
+    if args.dispatch and (STRATEGY == "windows" or MODE == "snapshot"):
+        print("Note: --dispatch needs symlinks to find environment.md; registering hooks individually.\n")
+    elif args.dispatch:
+        expected_hooks = _via_dispatcher(expected_hooks)
+        log.debug("[MANIFEST] hook commands routed through dispatch.py")
+    if args.hook_daemon and sys.platform == "win32":
+        print("Note: --hook-daemon needs Unix sockets; registering hooks directly.\n")
+    elif args.hook_daemon:
+        expected_hooks = _via_daemon(expected_hooks)
+        log.debug("[MANIFEST] hook commands routed through hookc.py")
+
+    with _timed("uninstall" if args.uninstall else "install"):
+        if args.uninstall:
+            counts = do_uninstall(index, expected_hooks, state, dry_run, report)
+        else:
+            counts = do_install(index, expected_hooks, state, dry_run, report, prune=args.prune_duplicates)
+    failed = counts[ERROR]
+    report["counts"] = {action.lower(): n for action, n in sorted(counts.items()) if n}
 
+    if dry_run:
+        return failed
+    with _timed("store-gc"):
+        _store_gc()
     if args.uninstall:
-        do_uninstall(state, dry_run, expected_hooks, files)
-    else:
-        do_install(skills, hooks, expected_hooks, files, state, dry_run)
-
-    if not dry_run:
+        shutil.rmtree(MANIFEST_CACHE_DIR, ignore_errors=True)
+    with _timed("state-save"):
+        _flush_writes()  # settings.json first: the fingerprint hashes it
+        # Only a clean install may be skipped next time: LOCAL items and
+        # warnings should keep being reported. Snapshots always re-check,
+        # since the fingerprint doesn't cover edits to source files.
+        if (not args.uninstall and MODE != "snapshot"
+                and not any(counts[k] for k in (LOCAL, MISSING, ERROR, WARNING))):
+            state["fingerprint"] = _fingerprint(options, index.sources,
+                                                [r.target for r in index.files.values() if r.install])
         if state["entries"]:
             _state_save(state)
             log.debug("[STATE] saved entries=%d", len(state["entries"]))
         elif STATE_FILE.exists():
-            STATE_FILE.unlink()
+            _defer_write(STATE_FILE, None)
             log.debug("[STATE] removed empty state file")
-
-    log.debug("[DONE] finished")
-    print("Done.")
+        _flush_writes()
+    return failed
 
 
 if __name__ == "__main__":
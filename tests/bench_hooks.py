@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for hooks and setup.py, with regression thresholds.
+
+Measures, per hook script and realistic payload:
+  cold    — wall time of one `python hooks/<hook>.py` subprocess (median of runs)
+  import  — total top-level import time from `python -X importtime`
+  steady  — per-call time of the hook's run() in a warm process (as under hookd.py)
+plus setup.py dry-run time against a generated manifest with thousands of entries.
+
+Results are compared to tests/bench_baseline.json. Millisecond results
+(interpreter startup and imports) are scaled by a calibration run
+(`python -c pass`) so baselines from a faster or slower machine still
+compare fairly; steady µs results are in-process work that startup time
+says nothing about, so they are compared as recorded. Exits 1 if any
+result regresses beyond --threshold percent.
+
+Run: python tests/bench_hooks.py            compare against the baseline
+     python tests/bench_hooks.py --update   record a new baseline
+Not collected by the unittest/pytest run (file name doesn't start with test_).
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+TOOLKIT_DIR = Path(__file__).resolve().parent.parent
+HOOKS_DIR = TOOLKIT_DIR / "hooks"
+BASELINE = Path(__file__).resolve().parent / "bench_baseline.json"
+PYTHON = sys.executable
+
+# Differences below these are noise, whatever the percentage (a process
+# start wobbles by a few ms, which is 25% of a sub-20 ms measurement)
+NOISE_FLOOR = {"ms": 3.0, "us": 5.0}
+
+LONG_PATH = "/" + "deeply/nested/dir/" * 200 + "module.py"
+HUGE_COMMAND = "git commit -m '" + "x" * 1_000_000 + "' && echo done"
+
+# (hook, tool, payload name, payload)
+CASES = [
+    ("protect-files.py", "Write", "normal", {"file_path": "/app/src/main.py"}),
+    ("protect-files.py", "Edit", "long-path", {"file_path": LONG_PATH}),
+    ("pre-commit.py", "Bash", "short", {"command": "git status"}),
+    ("pre-commit.py", "Bash", "huge-command", {"command": HUGE_COMMAND}),
+    ("auto-format.py", "Write", "no-formatter", {"file_path": "<tmp>/notes.xyz"}),
+    ("log-tool-use.py", "Read", "append", {}),
+    ("dispatch.py", "Write", "pre-write", {"file_path": "/app/src/main.py"}),
+]
+
+# Per-hook argv (dispatch.py needs the event)
+ARGS = {"dispatch.py": ["PreToolUse"]}
+
+
+def _payload(payload: dict, tmp: Path) -> dict:
+    return {k: v.replace("<tmp>", str(tmp)) if isinstance(v, str) else v for k, v in payload.items()}
+
+
+def _env(tmp: Path, tool: str) -> dict:
+    env = os.environ.copy()
+    env.update(HOME=str(tmp), USERPROFILE=str(tmp), CLAUDE_TOOL_NAME=tool,
+               CLAUDE_SESSION_ID="bench", AI_TOOLKIT_METRICS="", AI_TOOLKIT_HOOKD="0")
+    return env
+
+
+def _median_ms(fn, runs: int) -> float:
+    """Median of `runs` timings — one lucky or unlucky run can't move it."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def bench_calibration(runs: int) -> float:
+    """Bare interpreter startup, used to scale baselines across machines."""
+    return _median_ms(lambda: subprocess.run([PYTHON, "-c", "pass"], capture_output=True), runs)
+
+
+def bench_cold(hook: str, tool: str, payload: dict, tmp: Path, runs: int) -> float:
+    stdin, env = json.dumps(payload), _env(tmp, tool)
+    cmd = [PYTHON, str(HOOKS_DIR / hook), *ARGS.get(hook, [])]
+    return _median_ms(lambda: subprocess.run(cmd, input=stdin, capture_output=True, text=True, env=env), runs)
+
+
+def bench_import(hook: str, tmp: Path, runs: int) -> float:
+    """Sum of top-level cumulative import times (µs → ms), median of runs."""
+    totals = []
+    for _ in range(runs):
+        r = subprocess.run([PYTHON, "-X", "importtime", str(HOOKS_DIR / hook), *ARGS.get(hook, [])],
+                           input="{}", capture_output=True, text=True, env=_env(tmp, ""))
+        total = 0
+        for line in r.stderr.splitlines():
+            m = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)\S", line)
+            if m and not m.group(2):  # top-level imports only (no indent)
+                total += int(m.group(1))
+        totals.append(total / 1000)
+    return statistics.median(totals)
+
+
+def bench_steady(hook: str, tool: str, payload: dict, tmp: Path, iterations: int) -> float:
+    """Per-call µs of run() in this process, after one warm-up call."""
+    import hooklib
+    os.environ.update(_env(tmp, tool))
+    if hook == "dispatch.py":
+        import dispatch
+        call = lambda: dispatch.dispatch(ARGS[hook][0], tool, payload)  # noqa: E731
+    else:
+        run = hooklib.load_hook(hook).run
+        call = lambda: run(tool, payload)  # noqa: E731
+    call()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        call()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench_many_files(tmp: Path, count: int) -> float:
+    """Per-call µs of protect-files over many distinct paths (no repeated-input caching)."""
+    import hooklib
+    run = hooklib.load_hook("protect-files.py").run
+    paths = [f"/repo/pkg{i % 97}/sub{i % 13}/file_{i}.py" for i in range(count)]
+    start = time.perf_counter()
+    for p in paths:
+        run("Write", {"file_path": p})
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def make_large_toolkit(root: Path, entries: int) -> Path:
+    """Generate a toolkit whose manifest lists `entries` skills plus hooks and files."""
+    toolkit = root / "toolkit"
+    (toolkit / "skills").mkdir(parents=True)
+    (toolkit / "hooks").mkdir()
+    (toolkit / "files").mkdir()
+    shutil.copy(str(TOOLKIT_DIR / "setup.py"), str(toolkit / "setup.py"))
+    n_hooks = n_files = max(1, entries // 4)
+    lines = ["# Environment Manifest", "## Skills", "| Name | Install |", "|------|---------|"]
+    for i in range(entries):
+        (toolkit / "skills" / f"skill-{i}").mkdir()
+        (toolkit / "skills" / f"skill-{i}" / "SKILL.md").write_text("x")
+        lines.append(f"| skill-{i} | yes |")
+    lines += ["## Hooks", "| File | Install | Event | Matcher |", "|------|---------|-------|---------|"]
+    hook_entries = []
+    for i in range(n_hooks):
+        (toolkit / "hooks" / f"hook-{i}.py").write_text("import sys; sys.exit(0)\n")
+        lines.append(f"| hook-{i}.py | yes | PostToolUse | _(none)_ |")
+        hook_entries.append({"hooks": [{"type": "command", "command": f"python3 ~/.claude/hooks/hook-{i}.py"}]})
+    lines += ["## Settings.json Hook Registrations", "```json",
+              json.dumps({"hooks": {"PostToolUse": hook_entries}}), "```"]
+    lines += ["## Files", "| Source | Target | Install |", "|--------|--------|---------|"]
+    for i in range(n_files):
+        (toolkit / "files" / f"f-{i}.md").write_text("x")
+        lines.append(f"| files/f-{i}.md | ~/linked/f-{i}.md | yes |")
+    (toolkit / "environment.md").write_text("\n".join(lines) + "\n")
+    return toolkit
+
+
+def bench_setup(tmp: Path, entries: int, runs: int) -> float:
+    toolkit = make_large_toolkit(tmp, entries)
+    home = tmp / "home"
+    (home / ".claude" / "skills").mkdir(parents=True)
+    (home / ".claude" / "hooks").mkdir()
+    (home / ".claude" / "settings.json").write_text("{}")
+    env = _env(home, "")
+    cmd = [PYTHON, str(toolkit / "setup.py")]
+    return _median_ms(lambda: subprocess.run(cmd, capture_output=True, text=True, env=env), runs)
+
+
+def run_all(args) -> dict:
+    sys.path.insert(0, str(HOOKS_DIR))
+    results = {"calibration_ms": bench_calibration(args.runs)}
+    with tempfile.TemporaryDirectory() as t:
+        tmp = Path(t)
+        (tmp / ".claude").mkdir()
+        (tmp / "notes.xyz").write_text("x")
+        # pre-commit.py runs git diff --cached on commits: give it an empty
+        # repo rather than whatever checkout the bench was started from
+        repo = tmp / "repo"
+        subprocess.run(["git", "init", "-q", str(repo)], check=True)
+        saved_env, saved_cwd = dict(os.environ), os.getcwd()
+        os.chdir(repo)
+        try:
+            for hook in sorted({c[0] for c in CASES}):
+                results[f"import/{hook}/ms"] = bench_import(hook, tmp, args.runs)
+            for hook, tool, name, payload in CASES:
+                payload = _payload(payload, tmp)
+                results[f"cold/{hook}/{name}/ms"] = bench_cold(hook, tool, payload, tmp, args.runs)
+                results[f"steady/{hook}/{name}/us"] = bench_steady(hook, tool, payload, tmp, args.iterations)
+            results["steady/protect-files.py/many-files/us"] = bench_many_files(tmp, args.iterations)
+        finally:
+            os.chdir(saved_cwd)
+            os.environ.clear()
+            os.environ.update(saved_env)
+    with tempfile.TemporaryDirectory() as t:
+        results[f"setup/dry-run/{args.entries}-entries/ms"] = bench_setup(Path(t), args.entries, max(1, args.runs // 3))
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Return [(key, baseline_scaled, now), ...] for results beyond the threshold.
+
+    Only /ms results are scaled by the calibration run.
+    """
+    scale = results["calibration_ms"] / baseline.get("calibration_ms", results["calibration_ms"])
+    regressions = []
+    for key, base in baseline.items():
+        if key == "calibration_ms" or key not in results:
+            continue
+        unit = key.rsplit("/", 1)[-1]
+        expected, now = base * (scale if unit == "ms" else 1), results[key]
+        floor = NOISE_FLOOR.get(unit, 0)
+        if now > expected * (1 + threshold / 100) and now - expected > floor:
+            regressions.append((key, expected, now))
+    return regressions
+
+
+def main():
+    """Run the benchmarks, then compare or update the baseline."""
+    parser = argparse.ArgumentParser(description="Hook and setup.py benchmarks")
+    parser.add_argument("--update", action="store_true", help="Write results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=float(os.environ.get("BENCH_THRESHOLD", "25")),
+                        help="Allowed regression in percent (default 25, env BENCH_THRESHOLD)")
+    parser.add_argument("--runs", type=int, default=15, help="Subprocess runs per measurement")
+    parser.add_argument("--iterations", type=int, default=2000, help="In-process calls per steady measurement")
+    parser.add_argument("--entries", type=int, default=2000, help="Skills in the generated setup.py manifest")
+    parser.add_argument("--output", help="Also write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run_all(args)
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    for key, value in results.items():
+        base = baseline.get(key)
+        delta = f"  (baseline {base:.1f})" if base is not None else ""
+        print(f"{key:<52} {value:>10.1f}{delta}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+
+    if args.update or not baseline:
+        BASELINE.write_text(json.dumps({k: round(v, 2) for k, v in results.items()}, indent=2) + "\n")
+        print(f"\nBaseline written to {BASELINE}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nREGRESSIONS (> {args.threshold:.0f}% over baseline):")
+        for key, expected, now in regressions:
+            print(f"  {key}: {now:.1f} vs {expected:.1f} (+{(now / expected - 1) * 100:.0f}%)")
+        return 1
+    print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,31 +6,49 @@ environment variables and stdin, then checks exit code and output.
 Run: python tests/test_hooks.py
 """
 
+import contextlib
+import gzip
 import json
 import os
+import shutil
 import subprocess
 import sys
 import tempfile
+import time
 import unittest
 from pathlib import Path
+from unittest import mock
 
 HOOKS_DIR = Path(__file__).resolve().parent.parent / "hooks"
 PYTHON = sys.executable
 
+try:
+    import black  # noqa: F401
+    import tomllib  # noqa: F401
+    HAS_BLACK = True
+except ImportError:
+    HAS_BLACK = False
+
 
 def run_hook(hook_name: str, tool_name: str, stdin_data: dict,
-             env_extra: "dict | None" = None) -> subprocess.CompletedProcess:
-    """Run a hook script with the given tool name and stdin JSON."""
-    env = os.environ.copy()
-    env["CLAUDE_TOOL_NAME"] = tool_name
-    env["CLAUDE_SESSION_ID"] = "test-session"
-    if env_extra:
-        env.update(env_extra)
-    return subprocess.run(
-        [PYTHON, str(HOOKS_DIR / hook_name)],
-        input=json.dumps(stdin_data),
-        capture_output=True, text=True, env=env,
-    )
+             env_extra: "dict | None" = None, args: tuple = (), cwd=None) -> subprocess.CompletedProcess:
+    """Run a hook script with the given tool name and stdin JSON.
+
+    HOME is a fresh temp dir unless env_extra sets one, so the developer's
+    own ~/.claude (rules, caches, queues) can't change the result.
+    """
+    with tempfile.TemporaryDirectory() as home:
+        env = os.environ.copy()
+        env.update(HOME=home, USERPROFILE=home, AI_TOOLKIT_PROTECT_RULES="")
+        env["CLAUDE_TOOL_NAME"] = tool_name
+        env["CLAUDE_SESSION_ID"] = "test-session"
+        if env_extra:
+            env.update(env_extra)
+        return subprocess.run(
+            [PYTHON, str(HOOKS_DIR / hook_name), *args],
+            input=json.dumps(stdin_data),
+            capture_output=True, text=True, env=env, cwd=cwd,
+        )
 
 
 # ---- protect-files.py ----
@@ -63,29 +81,188 @@ class TestProtectFiles(unittest.TestCase):
         r = run_hook("protect-files.py", "Bash", {"file_path": "/app/.env"})
         self.assertEqual(r.returncode, 0)
 
+    def test_custom_rule_file_compiled_and_cached(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            (Path(tmp) / ".claude").mkdir()
+            rules = Path(tmp) / "team.rules"
+            rules.write_text("dir .aws AWS config\nprefix ~/.ssh/ SSH file\n"
+                             "path */deploy/*.tfvars terraform variables\nname id_*[!b] private key\n"
+                             "bogus line\n")
+            env = {"HOME": tmp, "AI_TOOLKIT_PROTECT_RULES": str(rules)}
+            cases = {"/repo/.aws/config": "AWS config", f"{tmp}/.ssh/known_hosts": "SSH file",
+                     "/repo/deploy/prod.tfvars": "terraform variables", "/repo/id_rsa": "private key",
+                     "/repo/credentials.yaml": "credentials file"}
+            warnings = ""
+            for path, label in cases.items():
+                r = run_hook("protect-files.py", "Write", {"file_path": path}, env)
+                self.assertEqual(r.returncode, 2, path)
+                self.assertIn(f"Cannot write to {label}", r.stdout)
+                warnings += r.stderr
+            self.assertEqual(warnings.count("ignored rule: bogus line"), 1)  # compiled once, then cached
+            for path in ("/repo/id_rsa.pub", "/repo/deploy/readme.md", "/repo/src/aws.py"):
+                self.assertEqual(run_hook("protect-files.py", "Edit", {"file_path": path}, env).returncode, 0, path)
+
+            cache = Path(tmp) / ".claude" / "protect-files.cache.json"
+            key = json.loads(cache.read_text())["key"]
+            rules.write_text("name *.secret\n")
+            r = run_hook("protect-files.py", "Write", {"file_path": "/repo/db.secret"}, env)
+            self.assertIn("Cannot write to protected file: db.secret", r.stdout)
+            self.assertNotEqual(json.loads(cache.read_text())["key"], key)
+
+            for rule, label in (("name * everything", "everything"), ("prefix / root", "root")):
+                rules.write_text(rule + "\n")
+                r = run_hook("protect-files.py", "Write", {"file_path": "/repo/notes.txt"}, env)
+                self.assertIn(f"Cannot write to {label}: notes.txt", r.stdout)
+
 
 # ---- pre-commit.py ----
 
 class TestPreCommit(unittest.TestCase):
 
+    def setUp(self):
+        # Commands without -C run here: git commit scans this (empty) repo's
+        # index, not the checkout the tests were started from
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.repo = tmp.name
+        subprocess.run(["git", "init", "-q", self.repo], check=True)
+
+    def bash(self, command: str, env_extra: "dict | None" = None) -> subprocess.CompletedProcess:
+        return run_hook("pre-commit.py", "Bash", {"command": command}, env_extra, cwd=self.repo)
+
     def test_blocks_git_push(self):
-        r = run_hook("pre-commit.py", "Bash", {"command": "git push origin main"})
+        r = self.bash("git push origin main")
         self.assertEqual(r.returncode, 2)
         self.assertIn("preflight", r.stderr.lower())
 
     def test_blocks_no_verify(self):
-        r = run_hook("pre-commit.py", "Bash", {"command": "git commit --no-verify -m 'skip'"})
+        r = self.bash("git commit --no-verify -m 'skip'")
         self.assertEqual(r.returncode, 2)
         self.assertIn("--no-verify", r.stderr)
 
     def test_allows_git_status(self):
-        r = run_hook("pre-commit.py", "Bash", {"command": "git status"})
+        r = self.bash("git status")
         self.assertEqual(r.returncode, 0)
 
     def test_ignores_non_bash_tool(self):
         r = run_hook("pre-commit.py", "Write", {"command": "git push"})
         self.assertEqual(r.returncode, 0)
 
+    def test_parses_compound_commands(self):
+        blocked = ["git -C repo push origin", "cd repo && git push", "(git fetch; git push)",
+                   "echo \"$(git push)\"", "bash -c 'git push -f'", "git commit -n -m fix",
+                   "git commit -nm fix", "git commit --no-ver -m fix", "git -c alias.ship=push ship",
+                   "echo origin | xargs git push", "xargs -n 1 -I{} git push {}", "watch git push",
+                   "watch -n 5 'git push'", "find . -name x -exec git push \\;",
+                   "find . -execdir true {} + -ok git push ';'", "xargs git commit --no-verify -m x",
+                   "watch -n1 git commit -n -m x", "find . -exec git commit --no-verify -m x {} +"]
+        allowed = ["echo \"git push\"", "git log | grep push", "git commit -m '-n && git push'",
+                   "git commit -m \"$(cat <<'EOF'\nFix\n\ngit push later\nEOF\n)\"", "# git push",
+                   "git commit -uno -m fix", "git commit -Snkey -m fix",
+                   "find . -name push -exec grep git {} ;", "xargs echo git push"]
+        for command in blocked:
+            self.assertEqual(self.bash(command).returncode, 2, command)
+        for command in allowed:
+            self.assertEqual(self.bash(command).returncode, 0, command)
+
+    def test_push_allowed_after_preflight_record(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            repo, env = Path(tmp) / "repo", {"HOME": tmp}
+            git = ["git", "-C", str(repo), "-c", "user.name=t", "-c", "user.email=t@t"]
+            subprocess.run(["git", "init", "-q", str(repo)], check=True)
+            subprocess.run(git + ["commit", "-q", "--allow-empty", "-m", "one"], check=True)
+            push = {"command": f"git -C {repo} push origin HEAD"}
+
+            def record(result):
+                return subprocess.run([PYTHON, str(HOOKS_DIR / "preflight.py"), "record", "--result", result,
+                                       "-C", str(repo)], env={**os.environ, **env}, capture_output=True, text=True)
+
+            self.assertIn("no /preflight result", run_hook("pre-commit.py", "Bash", push, env).stderr)
+            self.assertEqual(record("WARN").returncode, 0)
+            self.assertEqual(run_hook("pre-commit.py", "Bash", push, env).returncode, 0)
+
+            subprocess.run(git + ["commit", "-q", "--allow-empty", "-m", "two"], check=True)
+            r = run_hook("pre-commit.py", "Bash", push, env)
+            self.assertEqual(r.returncode, 2)
+            self.assertIn("HEAD has changed", r.stderr)
+
+            record("FAIL")
+            self.assertIn("was FAIL", run_hook("pre-commit.py", "Bash", push, env).stderr)
+
+            marker = repo / ".git" / "ai-toolkit-preflight.json"
+            record("PASS")
+            marker.write_text(marker.read_text().replace('"PASS"', '"WARN"'))
+            self.assertIn("not valid", run_hook("pre-commit.py", "Bash", push, env).stderr)
+
+    def test_blocks_staged_secrets(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            repo = Path(tmp) / "repo"
+            git = ["git", "-C", str(repo), "-c", "user.name=t", "-c", "user.email=t@t"]
+            subprocess.run(["git", "init", "-q", str(repo)], check=True)
+            leak = "TOK" + "EN = 'abc123'\n"  # split so this file doesn't trip the scanner
+            (repo / "app.py").write_text(leak)
+            subprocess.run(git + ["add", "app.py"], check=True)
+            subprocess.run(git + ["commit", "-q", "-m", "one"], check=True)
+            commit = {"command": f"git -C {repo} commit -m two"}
+
+            (repo / "app.py").write_text(leak + "x = 1\n")  # the committed line isn't re-reported
+            subprocess.run(git + ["add", "app.py"], check=True)
+            self.assertEqual(run_hook("pre-commit.py", "Bash", commit).returncode, 0)
+
+            (repo / "app.py").write_text(leak + "x = 1\n" + "PASS" + "WORD = 'hunter2'\n")
+            self.assertEqual(run_hook("pre-commit.py", "Bash", commit).returncode, 0)  # not staged
+            r = run_hook("pre-commit.py", "Bash", {"command": f"git -C {repo} commit -am two"})
+            self.assertEqual(r.returncode, 2)
+            self.assertIn("app.py:3 (password)", r.stderr)
+            self.assertNotIn("hunter2", r.stderr)
+
+            subprocess.run(git + ["add", "app.py"], check=True)
+            r = run_hook("pre-commit.py", "Bash", commit)
+            self.assertEqual(r.returncode, 2)
+            self.assertIn("Staged secrets", r.stderr)
+
+            subprocess.run(git + ["reset", "-q"], check=True)
+            (repo / ".env").write_text("X=1\n")
+            subprocess.run(git + ["add", "-f", ".env"], check=True)
+            r = run_hook("pre-commit.py", "Bash", commit)
+            self.assertEqual(r.returncode, 2)
+            self.assertIn(".env (environment file)", r.stderr)
+
+    def test_blocks_secrets_added_by_the_same_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            repo = Path(tmp) / "repo"
+            git = ["git", "-C", str(repo), "-c", "user.name=t", "-c", "user.email=t@t"]
+            subprocess.run(["git", "init", "-q", str(repo)], check=True)
+            (repo / "app.py").write_text("x = 1\n")
+            subprocess.run(git + ["add", "app.py"], check=True)
+            subprocess.run(git + ["commit", "-q", "-m", "one"], check=True)
+            leak = "SEC" + "RET = 'abc123'\n"  # split so this file doesn't trip the scanner
+
+            (repo / "new.py").write_text(leak)
+            (repo / "notes.txt").write_text("y\n")
+            for command in (f"git -C {repo} add new.py && git -C {repo} commit -m x",
+                            f"git -C {repo} add . && git -C {repo} commit -m x"):
+                r = run_hook("pre-commit.py", "Bash", {"command": command})
+                self.assertEqual(r.returncode, 2, command)
+                self.assertIn("new.py:1 (secret)", r.stderr)
+            r = run_hook("pre-commit.py", "Bash", {"command": f"git -C {repo} add notes.txt && git -C {repo} commit -m x"})
+            self.assertEqual(r.returncode, 0)  # new.py isn't part of this commit
+            (repo / "new.py").unlink()
+
+            (repo / "app.py").write_text("x = 1\n" + leak)  # tracked, not staged
+            for command in (f"git -C {repo} commit app.py -m x", f"git -C {repo} commit -i -m x -- app.py"):
+                r = run_hook("pre-commit.py", "Bash", {"command": command})
+                self.assertEqual(r.returncode, 2, command)
+                self.assertIn("app.py:2 (secret)", r.stderr)
+            self.assertEqual(run_hook("pre-commit.py", "Bash", {"command": f"git -C {repo} commit -m x"}).returncode, 0)
+
+    def test_expands_git_config_alias(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            subprocess.run(["git", "init", "-q", tmp], check=True)
+            subprocess.run(["git", "-C", tmp, "config", "alias.ship", "push origin HEAD"], check=True)
+            r = run_hook("pre-commit.py", "Bash", {"command": f"git -C {tmp} ship"})
+            self.assertEqual(r.returncode, 2)
+
 
 # ---- log-tool-use.py ----
 
@@ -111,6 +288,60 @@ class TestLogToolUse(unittest.TestCase):
             self.assertIn("Read", content)
             self.assertIn("|", content)
 
+    def test_rotates_into_gzip_segments(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            claude = Path(tmp) / ".claude"
+            claude.mkdir()
+            log_file = claude / "tool-use.log"
+            log_file.write_text("old line\n" * 20)
+            (claude / "tool-use.log.1.gz").write_bytes(gzip.compress(b"older\n"))
+            env = {"HOME": tmp, "USERPROFILE": tmp,
+                   "AI_TOOLKIT_LOG_MAX_BYTES": "100", "AI_TOOLKIT_LOG_SEGMENTS": "2"}
+            run_hook("log-tool-use.py", "Read", {}, env)
+            self.assertNotIn("old line", log_file.read_text())
+            self.assertIn("Read", log_file.read_text())
+            self.assertIn(b"old line", gzip.decompress((claude / "tool-use.log.1.gz").read_bytes()))
+            self.assertEqual(gzip.decompress((claude / "tool-use.log.2.gz").read_bytes()), b"older\n")
+            self.assertFalse((claude / "tool-use.log.3.gz").exists())
+
+    def test_structured_store_and_query(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            (Path(tmp) / ".claude").mkdir()
+            env = {"HOME": tmp, "USERPROFILE": tmp, "AI_TOOLKIT_LOG_DB": "1"}
+            run_hook("log-tool-use.py", "Edit", {"file_path": "/app/a.py", "duration_ms": 12}, env)
+            run_hook("log-tool-use.py", "Bash", {"command": "ls"}, env)
+            run_hook("log-tool-use.py", "Bash", {"command": "pwd"}, env)
+
+            r = run_hook("toollog.py", "", {}, env, args=("query", "--session", "test-session", "--tool", "Bash"))
+            self.assertEqual(r.stdout.strip(), "2")
+            r = run_hook("toollog.py", "", {}, env, args=("query", "--group-by", "tool"))
+            self.assertEqual(r.stdout.splitlines()[0].split("\t")[:2], ["Bash", "2"])
+            r = run_hook("toollog.py", "", {}, env, args=("query", "--list", "--tool", "Edit"))
+            self.assertIn("/app/a.py", r.stdout)
+
+            # Set but empty means off — no store, not a file named "None" in the cwd
+            subprocess.run([PYTHON, str(HOOKS_DIR / "log-tool-use.py")], input="{}", text=True, cwd=tmp,
+                           env={**os.environ, **env, "AI_TOOLKIT_LOG_DB": "", "CLAUDE_TOOL_NAME": "Read"})
+            self.assertEqual(sorted(p.name for p in Path(tmp).iterdir()), [".claude"])
+
+    def test_batch_mode_flushes_in_long_lived_process(self):
+        sys.path.insert(0, str(HOOKS_DIR))
+        import hooklib
+        with tempfile.TemporaryDirectory() as tmp:
+            (Path(tmp) / ".claude").mkdir()
+            env = dict(os.environ, HOME=tmp, AI_TOOLKIT_LOG_BATCH="1",
+                       AI_TOOLKIT_LOG_FLUSH_SECS="60", CLAUDE_TOOL_NAME="Grep")
+            hooklib.LONG_LIVED = True
+            try:
+                for _ in range(3):
+                    hooklib.run_inline("log-tool-use.py", "{}", env)
+                log_file = Path(tmp) / ".claude" / "tool-use.log"
+                self.assertFalse(log_file.exists(), "batched lines written through")
+                hooklib.load_hook("log-tool-use.py")._batch.flush()
+                self.assertEqual(log_file.read_text().count("Grep"), 3)
+            finally:
+                hooklib.LONG_LIVED = False
+
 
 # ---- auto-format.py ----
 
@@ -130,6 +361,366 @@ class TestAutoFormat(unittest.TestCase):
         r = run_hook("auto-format.py", "Bash", {"file_path": "/app/main.py"})
         self.assertEqual(r.returncode, 0)
 
+    def _format_warm(self, project: Path, source: str) -> str:
+        """Format project/mod.py in-process as hookd.py would, with no formatter on PATH."""
+        sys.path.insert(0, str(HOOKS_DIR))
+        import hooklib
+        target = project / "mod.py"
+        target.write_text(source)
+        (project / ".claude").mkdir(exist_ok=True)
+        env = dict(os.environ, PATH="", HOME=str(project), CLAUDE_TOOL_NAME="Write", AI_TOOLKIT_BLACKD_URL="")
+        hooklib.LONG_LIVED = True
+        try:
+            hooklib.run_inline("auto-format.py", json.dumps({"file_path": str(target)}), env)
+        finally:
+            hooklib.LONG_LIVED = False
+        return target.read_text()
+
+    @unittest.skipIf(sys.platform == "win32", "fake formatter is a shell script")
+    def test_cache_skips_already_formatted_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            (tmp / ".claude").mkdir()
+            (tmp / "bin").mkdir()
+            fake = tmp / "bin" / "gofmt"
+            fake.write_text(f"#!/bin/sh\necho run >> {tmp / 'runs'}\n")
+            fake.chmod(0o755)
+            src = tmp / "main.go"
+            src.write_text("package main\n")
+            env = {"HOME": str(tmp), "USERPROFILE": str(tmp), "PATH": str(tmp / "bin")}
+
+            for _ in range(3):
+                run_hook("auto-format.py", "Edit", {"file_path": str(src)}, env)
+            self.assertEqual((tmp / "runs").read_text().count("run"), 1)
+
+            src.write_text("package main\n\nfunc main() {}\n")
+            run_hook("auto-format.py", "Edit", {"file_path": str(src)}, env)
+            self.assertEqual((tmp / "runs").read_text().count("run"), 2)
+
+            discovery = json.loads((tmp / ".claude" / "formatter-discovery.json").read_text())
+            self.assertEqual(discovery["tools"]["gofmt"], str(fake))
+
+    @unittest.skipIf(sys.platform == "win32", "fake formatter is a shell script")
+    def test_prefers_project_local_formatter(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            (tmp / ".claude").mkdir()
+            (tmp / "repo" / ".git").mkdir(parents=True)
+            for where, label in ((tmp / "bin", "global"), (tmp / "repo" / "node_modules" / ".bin", "local")):
+                where.mkdir(parents=True)
+                fake = where / "prettier"
+                fake.write_text(f'#!/bin/sh\necho "{label} $1" >> {tmp / "runs"}\n')
+                fake.chmod(0o755)
+            src = tmp / "repo" / "src" / "app.js"
+            src.parent.mkdir()
+            src.write_text("let x = 1\n")
+            env = {"HOME": str(tmp), "USERPROFILE": str(tmp), "PATH": str(tmp / "bin")}
+
+            run_hook("auto-format.py", "Write", {"file_path": str(src)}, env)
+            runs = (tmp / "runs").read_text().splitlines()
+            self.assertIn("local --write", runs)
+            self.assertNotIn("global --write", runs)
+
+    @unittest.skipIf(sys.platform == "win32", "async mode needs fcntl")
+    def test_async_queue_coalesces_and_flushes_before_commit(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            (tmp / ".claude").mkdir()
+            (tmp / "bin").mkdir()
+            fake = tmp / "bin" / "gofmt"
+            fake.write_text(f'#!/bin/sh\nshift\necho "$@" >> {tmp / "runs"}\n')
+            fake.chmod(0o755)
+            env = {"HOME": str(tmp), "USERPROFILE": str(tmp), "PATH": str(tmp / "bin"),
+                   "AI_TOOLKIT_FORMAT_ASYNC": "1", "AI_TOOLKIT_FORMAT_QUIET": "30"}
+            files = [tmp / f"{n}.go" for n in ("a", "b", "c")]
+            for f in files:
+                f.write_text(f"package {f.stem}\n")
+            for f in files + files[:1]:
+                r = run_hook("auto-format.py", "Edit", {"file_path": str(f)}, env)
+                self.assertEqual(r.returncode, 0)
+            self.assertFalse((tmp / "runs").exists(), "formatted inline in async mode")
+
+            run_hook("pre-commit.py", "Bash", {"command": "git commit -m wip"}, env)
+            self.assertEqual((tmp / "runs").read_text().splitlines(), [" ".join(str(f) for f in files)])
+
+            # Join the detached worker: it exits once its queue directory is gone
+            import fcntl
+            qdir = tmp / ".claude" / "format-queue"
+            with open(qdir / "worker.lock", "a") as lock:
+                shutil.rmtree(qdir)
+                deadline = time.monotonic() + 10
+                while True:
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except OSError:
+                        self.assertLess(time.monotonic(), deadline, "format worker still running")
+                        time.sleep(0.1)
+
+    @unittest.skipUnless(HAS_BLACK, "black and tomllib not importable")
+    def test_warm_black_api_honours_config(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            (Path(tmp) / ".git").mkdir()
+            (Path(tmp) / "pyproject.toml").write_text("[tool.black]\nskip-string-normalization = true\n")
+            self.assertEqual(self._format_warm(Path(tmp), "x=['a',  'b']\n"), "x = ['a', 'b']\n")
+
+    @unittest.skipUnless(HAS_BLACK, "black and tomllib not importable")
+    def test_warm_black_skips_unsupported_config(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            (Path(tmp) / ".git").mkdir()
+            (Path(tmp) / "pyproject.toml").write_text('[tool.black]\nforce-exclude = "mod"\n')
+            self.assertEqual(self._format_warm(Path(tmp), "x=1\n"), "x=1\n")
+
+
+# ---- metrics.py ----
+
+class TestMetrics(unittest.TestCase):
+
+    def test_spans_recorded_and_summarized(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            sink = str(Path(tmp) / "metrics.jsonl")
+            env = {"AI_TOOLKIT_METRICS": sink}
+            for _ in range(3):
+                run_hook("protect-files.py", "Write", {"file_path": "/app/main.py"}, env)
+            r = run_hook("metrics.py", "", {}, env, args=("summary",))
+            self.assertEqual(r.returncode, 0)
+            rows = [line.split() for line in r.stdout.splitlines()[1:]]
+            spans = {(row[0], row[1]): row[3] for row in rows}
+            self.assertEqual(spans[("protect-files", "parse")], "3")
+            self.assertEqual(spans[("protect-files", "rules")], "3")
+
+    def test_disabled_by_default(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {"HOME": tmp, "USERPROFILE": tmp, "AI_TOOLKIT_METRICS": ""}
+            (Path(tmp) / ".claude").mkdir()
+            run_hook("protect-files.py", "Write", {"file_path": "/app/main.py"}, env)
+            self.assertFalse((Path(tmp) / ".claude" / "hook-metrics.jsonl").exists())
+
+
+# ---- secretscan.py ----
+
+class TestSecretScan(unittest.TestCase):
+
+    def _scan(self, root: Path, home: str) -> tuple:
+        r = subprocess.run([PYTHON, str(HOOKS_DIR / "secretscan.py"), str(root)],
+                           capture_output=True, text=True, env={**os.environ, "HOME": home})
+        return r.returncode, json.loads(r.stdout)
+
+    def test_finds_secrets_incrementally(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            repo = Path(tmp) / "repo"
+            subprocess.run(["git", "init", "-q", str(repo)], check=True)
+            leak = "API_" + "KEY = 'abc123'\n"  # split so this file doesn't trip the scanner
+            (repo / "app.py").write_text("import os\n" + leak)
+            (repo / "clean.py").write_text("x = 1\n")
+            (repo / "blob.bin").write_bytes(b"\0" + leak.encode())
+            (repo / ".gitignore").write_text("ignored.py\n")
+            (repo / "ignored.py").write_text(leak)
+
+            code, result = self._scan(repo, tmp)
+            self.assertEqual(code, 1)
+            self.assertEqual(result["result"], "FAIL")
+            self.assertEqual([(f["path"], f["line"], f["pattern"]) for f in result["findings"]],
+                             [("app.py", 2, "api-key")])
+            self.assertEqual(result["skipped"], 1)  # the binary; ignored.py isn't even listed
+
+            _, result = self._scan(repo, tmp)
+            self.assertEqual((result["scanned"], result["cached"], result["skipped"]), (0, 3, 1))
+            self.assertEqual(len(result["findings"]), 1)  # cached findings are still reported
+
+            (repo / "app.py").write_text("import os\n")
+            code, result = self._scan(repo, tmp)
+            self.assertEqual((code, result["result"], result["scanned"]), (0, "PASS", 1))
+
+            (repo / ".env").write_text("X=1\n")
+            subprocess.run(["git", "-C", str(repo), "add", "-f", ".env"], check=True)
+            code, result = self._scan(repo, tmp)
+            self.assertEqual((code, result["staged_env"]), (1, [".env"]))
+
+
+# ---- hookc.py / hookd.py ----
+
+class TestHookDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        (Path(self.tmp) / ".claude").mkdir()
+        self.env = {"HOME": self.tmp, "USERPROFILE": self.tmp}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_client_falls_back_to_subprocess(self):
+        env = dict(self.env, AI_TOOLKIT_HOOKD="0")
+        r = run_hook("hookc.py", "Write", {"file_path": "/app/.env"}, env, args=("protect-files.py",))
+        self.assertEqual(r.returncode, 2)
+        self.assertIn("BLOCKED", r.stdout)
+
+    def start_daemon(self, **env_extra) -> subprocess.Popen:
+        env = os.environ.copy()
+        env.update(self.env, AI_TOOLKIT_HOOKD_IDLE="10", **env_extra)
+        daemon = subprocess.Popen([PYTHON, str(HOOKS_DIR / "hookd.py"), "serve"], env=env)
+        sock = Path(self.tmp) / ".claude" / "hookd.sock"
+        for _ in range(100):
+            if sock.exists():
+                break
+            time.sleep(0.05)
+        if not sock.exists():
+            daemon.terminate()
+            daemon.wait()
+            self.fail("daemon socket not created")
+        return daemon
+
+    @unittest.skipIf(sys.platform == "win32", "hookd needs Unix sockets")
+    def test_daemon_serves_same_result(self):
+        daemon = self.start_daemon()
+        try:
+            r = run_hook("hookc.py", "Bash", {"command": "git push origin main"}, self.env,
+                         args=("pre-commit.py",))
+            self.assertEqual(r.returncode, 2)
+            self.assertIn("preflight", r.stderr.lower())
+            r = run_hook("hookc.py", "Bash", {"command": "git status"}, self.env,
+                         args=("pre-commit.py",))
+            self.assertEqual(r.returncode, 0)
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+    @unittest.skipIf(sys.platform == "win32", "hookd needs Unix sockets")
+    def test_slow_hook_does_not_block_other_calls(self):
+        tmp = Path(self.tmp)
+        (tmp / "bin").mkdir()
+        fake = tmp / "bin" / "gofmt"
+        fake.write_text("#!/bin/sh\n/bin/sleep 3\n")
+        fake.chmod(0o755)
+        (tmp / "main.go").write_text("package main\n")
+        daemon = self.start_daemon(AI_TOOLKIT_HOOKD_WORKERS="2")
+        try:
+            env = dict(self.env, PATH=str(tmp / "bin"))
+            slow = subprocess.Popen([PYTHON, str(HOOKS_DIR / "hookc.py"), "auto-format.py"],
+                                    stdin=subprocess.PIPE, env={**os.environ, **env, "CLAUDE_TOOL_NAME": "Edit"})
+            slow.stdin.write(json.dumps({"file_path": str(tmp / "main.go")}).encode())
+            slow.stdin.close()
+            time.sleep(0.5)  # the formatter is running in one worker
+            start = time.monotonic()
+            r = run_hook("hookc.py", "Bash", {"command": "git push"}, self.env, args=("pre-commit.py",))
+            self.assertEqual(r.returncode, 2)
+            self.assertLess(time.monotonic() - start, 2)
+            self.assertIsNone(slow.poll())
+            slow.wait(timeout=30)
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+    @unittest.skipIf(sys.platform == "win32", "hookd needs Unix sockets")
+    def test_daemon_restarts_when_any_hook_changes(self):
+        daemon = self.start_daemon()
+        helper = HOOKS_DIR / "shellcmd.py"
+        st = helper.stat()
+        try:
+            os.utime(helper, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+            r = run_hook("hookc.py", "Bash", {"command": "git status"}, self.env, args=("pre-commit.py",))
+            self.assertEqual(r.returncode, 0)
+            self.assertEqual(daemon.wait(timeout=10), 0)
+            self.assertFalse((Path(self.tmp) / ".claude" / "hookd.sock").exists())
+        finally:
+            os.utime(helper, ns=(st.st_atime_ns, st.st_mtime_ns))
+            if daemon.poll() is None:
+                daemon.terminate()
+                daemon.wait()
+
+    @unittest.skipIf(sys.platform == "win32", "hookd needs Unix sockets")
+    def test_client_does_not_rerun_hook_after_lost_reply(self):
+        import socket
+        import threading
+        sock = Path(self.tmp) / ".claude" / "hookd.sock"
+        srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        srv.bind(str(sock))
+        srv.listen(1)
+
+        def drop_reply():  # a daemon that reads the request, then dies
+            conn, _ = srv.accept()
+            while conn.recv(65536):
+                pass
+            conn.close()
+        t = threading.Thread(target=drop_reply)
+        t.start()
+        try:
+            r = run_hook("hookc.py", "Read", {}, self.env, args=("log-tool-use.py",))
+        finally:
+            t.join()
+            srv.close()
+        self.assertEqual(r.returncode, 1)
+        self.assertIn("no reply from hookd.py", r.stderr)
+        self.assertFalse((Path(self.tmp) / ".claude" / "tool-use.log").exists())  # not run a second time
+
+
+# ---- dispatch.py ----
+
+class TestDispatch(unittest.TestCase):
+
+    def test_blocks_protected_write(self):
+        r = run_hook("dispatch.py", "Write", {"file_path": "/app/.env"}, args=("PreToolUse",))
+        self.assertEqual(r.returncode, 2)
+        self.assertIn("BLOCKED", r.stdout)
+
+    def test_blocks_git_push(self):
+        r = run_hook("dispatch.py", "Bash", {"command": "git push"}, args=("PreToolUse",))
+        self.assertEqual(r.returncode, 2)
+        self.assertIn("preflight", r.stderr.lower())
+
+    def test_allows_safe_call(self):
+        r = run_hook("dispatch.py", "Bash", {"command": "git status"}, args=("PreToolUse",))
+        self.assertEqual(r.returncode, 0)
+
+    def test_post_tool_use_runs_unmatched_hooks(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            (Path(tmp) / ".claude").mkdir()
+            r = run_hook("dispatch.py", "Read", {}, {"HOME": tmp, "USERPROFILE": tmp},
+                         args=("PostToolUse",))
+            self.assertEqual(r.returncode, 0)
+            content = (Path(tmp) / ".claude" / "tool-use.log").read_text()
+            self.assertIn("Read", content)
+
+    @staticmethod
+    def temp_home(dispatch, home: str):
+        """HOME (and the setup.py dispatch loads on a cache miss) pointed at home."""
+        stack = contextlib.ExitStack()
+        stack.enter_context(mock.patch.dict(os.environ, {"HOME": home}))
+        stack.enter_context(mock.patch.object(dispatch, "_SETUP", []))
+        return stack
+
+    def test_hook_table_follows_includes(self):
+        sys.path.insert(0, str(HOOKS_DIR))
+        import dispatch
+        with tempfile.TemporaryDirectory() as tmp:
+            header = "| File | Install | Event | Matcher |\n|---|---|---|---|\n"
+            (Path(tmp) / "team.md").write_text(header + "| team.py | yes | PreToolUse | Bash |\n"
+                                               "include: environment.md\n")
+            (Path(tmp) / "environment.md").write_text(header + "| base.py | yes | PreToolUse | — |\n\n"
+                                                      "include: team.md\n")
+            with self.temp_home(dispatch, tmp):
+                rows = dispatch.hook_table(Path(tmp) / "environment.md")
+        self.assertEqual(rows, [("base.py", "PreToolUse", None), ("team.py", "PreToolUse", "Bash")])
+
+    def test_hook_table_uses_setup_cache(self):
+        sys.path.insert(0, str(HOOKS_DIR))
+        import dispatch
+        with tempfile.TemporaryDirectory() as tmp:
+            header = "| File | Install | Event | Matcher |\n|---|---|---|---|\n"
+            team, manifest = Path(tmp) / "team.md", Path(tmp) / "environment.md"
+            team.write_text(header + "| team.py | yes | PreToolUse | Write\\|Edit |\n")
+            manifest.write_text("include: team.md\n")
+            (Path(tmp) / ".claude").mkdir()
+            with self.temp_home(dispatch, tmp):
+                self.assertEqual(dispatch.hook_table(manifest), [("team.py", "PreToolUse", "Write|Edit")])
+                self.assertTrue(dispatch._cache_file(manifest).is_file())
+                self.assertIsNotNone(dispatch._cached_rows(manifest))
+                # Editing an included fragment invalidates the cache
+                team.write_text(header + "| team.py | no | PreToolUse | Bash |\n")
+                self.assertIsNone(dispatch._cached_rows(manifest))
+                self.assertEqual(dispatch.hook_table(manifest), [])
+
 
 if __name__ == "__main__":
     unittest.main()
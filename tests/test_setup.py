@@ -194,6 +194,22 @@ class TestSetup(unittest.TestCase):
         self.assertIn("python3 /my/custom/hook.py", commands)
         self.assertNotIn("python3 ~/.claude/hooks/test-hook.py", commands)
 
+    # -- Test 5b: hook commands with their own arguments are the user's --
+
+    def test_uninstall_keeps_toolkit_hook_with_arguments(self):
+        settings = self.home_path("settings.json")
+        own = "python3 ~/.claude/hooks/test-hook.py verbose"
+        settings.write_text(json.dumps({"hooks": {"PostToolUse": [
+            {"hooks": [{"type": "command", "command": own}]},
+        ]}}))
+
+        run_setup(self.toolkit, self.tmp, "--apply", "--hook-daemon")
+        run_setup(self.toolkit, self.tmp, "--uninstall", "--apply")
+
+        d = json.loads(settings.read_text())
+        commands = [h["command"] for e in d["hooks"]["PostToolUse"] for h in e["hooks"]]
+        self.assertEqual(commands, [own])
+
     # -- Test 6: Non-managed files are never removed --
 
     def test_guard_refuses_non_managed(self):
@@ -330,6 +346,317 @@ class TestSetup(unittest.TestCase):
         self.assertFalse(target.is_symlink(), "Local file was replaced with symlink")
         self.assertEqual(target.read_text(), "local version")
 
+    # -- Test 13: --hook-daemon replaces direct registrations --
+
+    def test_hook_daemon_replaces_direct_entries(self):
+        """Switching to --hook-daemon swaps the entry instead of duplicating it."""
+        run_setup(self.toolkit, self.tmp, "--apply")
+        run_setup(self.toolkit, self.tmp, "--apply", "--hook-daemon")
+
+        settings = json.loads(self.home_path("settings.json").read_text())
+        commands = [h["command"] for e in settings["hooks"]["PostToolUse"] for h in e["hooks"]]
+        self.assertEqual(commands, ["python3 ~/.claude/hooks/hookc.py test-hook.py"])
+
+        run_setup(self.toolkit, self.tmp, "--uninstall", "--apply")
+        settings = json.loads(self.home_path("settings.json").read_text())
+        self.assertNotIn("hooks", settings)
+
+    # -- Test 13b: the user's own registrations of toolkit hooks aren't stale --
+
+    def test_extra_registrations_of_toolkit_hooks_survive(self):
+        settings = self.home_path("settings.json")
+        extra = [("PreToolUse", {"hooks": [{"type": "command", "command": "python3 ~/.claude/hooks/test-hook.py"}]}),
+                 ("PostToolUse", {"matcher": "Bash",
+                                  "hooks": [{"type": "command", "command": "python3 ~/.claude/hooks/test-hook.py"}]})]
+        settings.write_text(json.dumps({"hooks": {event: [entry] for event, entry in extra}}))
+
+        run_setup(self.toolkit, self.tmp, "--apply")
+        run_setup(self.toolkit, self.tmp, "--apply", "--hook-daemon")
+
+        d = json.loads(settings.read_text())
+        self.assertEqual(d["hooks"]["PreToolUse"], [extra[0][1]])
+        self.assertIn(extra[1][1], d["hooks"]["PostToolUse"])
+        commands = [h["command"] for e in d["hooks"]["PostToolUse"] if "matcher" not in e for h in e["hooks"]]
+        self.assertEqual(commands, ["python3 ~/.claude/hooks/hookc.py test-hook.py"])
+
+    # -- Test 14: --dispatch registers one entry per event --
+
+    def test_dispatch_registers_one_entry_per_event(self):
+        run_setup(self.toolkit, self.tmp, "--apply")
+        run_setup(self.toolkit, self.tmp, "--apply", "--dispatch", "--hook-daemon")
+
+        settings = json.loads(self.home_path("settings.json").read_text())
+        commands = [h["command"] for e in settings["hooks"]["PostToolUse"] for h in e["hooks"]]
+        self.assertEqual(commands, ["python3 ~/.claude/hooks/hookc.py dispatch.py PostToolUse"])
+
+    # -- Test 15: State file keeps its list format and drops duplicate targets --
+
+    def test_state_file_format_and_dedup(self):
+        run_setup(self.toolkit, self.tmp, "--apply")
+        state_file = self.home_path(".ai-toolkit-managed.json")
+        state = json.loads(state_file.read_text())
+        self.assertIsInstance(state["entries"], list)
+        self.assertEqual(len(state["entries"]), 2)
+
+        # A hand-edited file with a repeated entry is read back deduplicated
+        state["entries"].append(dict(state["entries"][0]))
+        state_file.write_text(json.dumps(state))
+        run_setup(self.toolkit, self.tmp, "--apply", "--force")
+        state = json.loads(state_file.read_text())
+        targets = [e["target"] for e in state["entries"]]
+        self.assertEqual(len(targets), 2)
+        self.assertEqual(len(set(targets)), 2)
+
+    # -- Test 16: Parallel linking keeps manifest order and records every link --
+
+    def test_parallel_link_order(self):
+        names = [f"skill-{i:02d}" for i in range(40)]
+        for name in names:
+            (self.toolkit / "skills" / name).mkdir()
+            (self.toolkit / "skills" / name / "SKILL.md").write_text("x")
+        manifest = self.toolkit / "environment.md"
+        rows = "".join(f"| {name} | yes |\n" for name in reversed(names))
+        manifest.write_text(manifest.read_text().replace("| test-skill | yes |\n", rows))
+
+        r = run_setup(self.toolkit, self.tmp, "--apply", "--jobs", "8")
+        self.assertEqual(r.returncode, 0, r.stdout + r.stderr)
+        created = [line.split(": ", 1)[1] for line in r.stdout.splitlines() if line.startswith("  CREATED: skill-")]
+        self.assertEqual(created, list(reversed(names)))
+        state = json.loads(self.home_path(".ai-toolkit-managed.json").read_text())
+        self.assertEqual(len(state["entries"]), len(names) + 1)
+
+        r = run_setup(self.toolkit, self.tmp, "--uninstall", "--apply", "--jobs", "8")
+        self.assertEqual(r.returncode, 0, r.stdout + r.stderr)
+        self.assertEqual(list(self.home_path("skills").iterdir()), [])
+        self.assertFalse(self.home_path(".ai-toolkit-managed.json").exists())
+
+    # -- Test 17: Unchanged fingerprint short-circuits; changes and --force don't --
+
+    def test_fingerprint_skips_unchanged(self):
+        run_setup(self.toolkit, self.tmp, "--apply")
+        r = run_setup(self.toolkit, self.tmp)
+        self.assertIn("All synced", r.stdout)
+        self.assertNotIn("Skills:", r.stdout)
+
+        r = run_setup(self.toolkit, self.tmp, "--force")
+        self.assertIn("CURRENT: test-skill", r.stdout)
+
+        # A removed link changes the skills dir mtime
+        os.unlink(self.home_path("skills", "test-skill"))
+        r = run_setup(self.toolkit, self.tmp)
+        self.assertIn("would create: test-skill", r.stdout)
+
+        # An edited settings.json is re-checked
+        run_setup(self.toolkit, self.tmp, "--apply")
+        self.home_path("settings.json").write_text('{"permissions":{"allow":[]}}')
+        r = run_setup(self.toolkit, self.tmp)
+        self.assertIn("would add", r.stdout)
+
+    # -- Test 18: LOCAL items are reported on every run, never fingerprinted --
+
+    def test_fingerprint_not_recorded_with_local_items(self):
+        self.home_path("skills", "test-skill").mkdir()
+        run_setup(self.toolkit, self.tmp, "--apply")
+        r = run_setup(self.toolkit, self.tmp)
+        self.assertIn("LOCAL: test-skill", r.stdout)
+
+    # -- Test 19: include: fragments are merged; the parsed manifest is cached --
+
+    def test_manifest_include_and_cache(self):
+        (self.toolkit / "skills" / "team-skill").mkdir()
+        (self.toolkit / "skills" / "team-skill" / "SKILL.md").write_text("team")
+        (self.toolkit / "team.md").write_text(
+            "## Skills\n| Name | Install |\n|------|---------|\n| team-skill | yes |\n")
+        manifest = self.toolkit / "environment.md"
+        manifest.write_text(manifest.read_text() + "\ninclude: team.md\n")
+
+        r = run_setup(self.toolkit, self.tmp)
+        self.assertIn("would create: team-skill", r.stdout)
+        self.assertFalse(self.home_path(".ai-toolkit-manifest-cache").exists())  # dry runs write nothing
+        run_setup(self.toolkit, self.tmp, "--apply")
+        self.assertEqual([p.name for p in self.toolkit.glob(".*.json")], [])  # the toolkit stays clean
+        caches = list(self.home_path(".ai-toolkit-manifest-cache").glob("*.json"))
+        self.assertEqual(len(caches), 1)
+        sources = json.loads(caches[0].read_text())["manifest"]["sources"]
+        self.assertEqual(len(sources), 2)
+
+        # Editing a fragment invalidates the cache
+        (self.toolkit / "skills" / "team-two").mkdir()
+        (self.toolkit / "skills" / "team-two" / "SKILL.md").write_text("two")
+        with open(self.toolkit / "team.md", "a") as f:
+            f.write("| team-two | yes |\n")
+        r = run_setup(self.toolkit, self.tmp)
+        self.assertIn("would create: team-two", r.stdout)
+
+        run_setup(self.toolkit, self.tmp, "--apply", "--uninstall")
+        self.assertFalse(self.home_path(".ai-toolkit-manifest-cache").exists())
+
+    # -- Test 20: Layers override by name, are remembered, and uninstall together --
+
+    def test_layers_override_and_uninstall(self):
+        personal = self.tmp / "personal"
+        (personal / "skills" / "test-skill").mkdir(parents=True)
+        (personal / "skills" / "test-skill" / "SKILL.md").write_text("personal version")
+        (personal / "skills" / "own-skill").mkdir()
+        (personal / "skills" / "own-skill" / "SKILL.md").write_text("own")
+        (personal / "environment.md").write_text(
+            "## Skills\n| Name | Install |\n|------|---------|\n| test-skill | yes |\n| own-skill | yes |\n")
+
+        r = run_setup(self.toolkit, self.tmp, "--apply", "--layer", str(personal))
+        self.assertEqual(r.returncode, 0, r.stdout + r.stderr)
+        self.assertEqual(self.home_path("skills", "test-skill", "SKILL.md").read_text(), "personal version")
+        self.assertTrue(self.home_path("skills", "own-skill").is_dir())
+        self.assertTrue(self.home_path("hooks", "test-hook.py").exists())
+
+        # Remembered: a plain run keeps the personal override
+        r = run_setup(self.toolkit, self.tmp, "--force")
+        self.assertIn("CURRENT: test-skill", r.stdout)
+        self.assertNotIn("re-link", r.stdout)
+
+        # Dropping the layer points the skill back at the base toolkit
+        r = run_setup(self.toolkit, self.tmp, "--apply", "--no-layers")
+        self.assertIn("RE-LINKED: test-skill", r.stdout)
+        self.assertEqual(self.home_path("skills", "test-skill", "SKILL.md").read_text(), "test skill content")
+
+        run_setup(self.toolkit, self.tmp, "--apply", "--layer", str(personal))
+        run_setup(self.toolkit, self.tmp, "--uninstall", "--apply")
+        self.assertEqual(list(self.home_path("skills").iterdir()), [])
+
+    # -- Test 21: Concurrent applies leave valid files; a held lock times out --
+
+    def test_concurrent_apply_and_lock_timeout(self):
+        env = dict(os.environ, HOME=str(self.tmp), USERPROFILE=str(self.tmp))
+        procs = [subprocess.Popen([PYTHON, str(self.toolkit / "setup.py"), "--apply", "--force"],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+                 for _ in range(4)]
+        self.assertEqual([p.wait() for p in procs], [0] * 4)
+        settings = json.loads(self.home_path("settings.json").read_text())
+        self.assertEqual(len(settings["hooks"]["PostToolUse"]), 1)
+        state = json.loads(self.home_path(".ai-toolkit-managed.json").read_text())
+        self.assertEqual(len(state["entries"]), 2)
+        self.assertEqual([p.name for p in self.home_path().iterdir() if p.name.endswith(".tmp")], [])
+
+        if sys.platform == "win32":
+            return
+        import fcntl
+        with open(self.home_path(".ai-toolkit.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            r = run_setup(self.toolkit, self.tmp, "--apply", "--force", "--lock-timeout", "0.2")
+        self.assertEqual(r.returncode, 1)
+        self.assertIn("another setup.py --apply is running", r.stdout)
+
+    # -- Test 22: Duplicate entries are compacted; --prune-duplicates covers custom ones --
+
+    def test_duplicate_hook_entries_compacted(self):
+        managed = {"hooks": [{"type": "command", "command": "python3 ~/.claude/hooks/test-hook.py"}]}
+        custom = {"matcher": "Bash", "hooks": [{"type": "command", "command": "python3 /my/hook.py"}]}
+        settings = self.home_path("settings.json")
+        settings.write_text(json.dumps({"hooks": {"PostToolUse": [managed] * 300 + [custom] * 2}}))
+
+        r = run_setup(self.toolkit, self.tmp, "--apply")
+        self.assertIn("REMOVED 299 duplicate(s): PostToolUse", r.stdout)
+        entries = json.loads(settings.read_text())["hooks"]["PostToolUse"]
+        self.assertEqual(entries, [managed, custom, custom])
+
+        run_setup(self.toolkit, self.tmp, "--apply", "--prune-duplicates")
+        entries = json.loads(settings.read_text())["hooks"]["PostToolUse"]
+        self.assertEqual(entries, [managed, custom])
+
+    # -- Test 23: Snapshot mode copies from a store and updates only what changed --
+
+    @unittest.skipIf(sys.platform == "win32", "hard link counts")
+    def test_snapshot_mode(self):
+        r = run_setup(self.toolkit, self.tmp, "--apply", "--mode", "snapshot")
+        self.assertEqual(r.returncode, 0, r.stdout + r.stderr)
+        skill_md = self.home_path("skills", "test-skill", "SKILL.md")
+        self.assertFalse(self.home_path("skills", "test-skill").is_symlink())
+        self.assertEqual(skill_md.read_text(), "test skill content")
+        self.assertEqual(skill_md.stat().st_nlink, 2)  # the target plus its store blob
+        state = json.loads(self.home_path(".ai-toolkit-managed.json").read_text())
+        self.assertEqual(state["mode"], "snapshot")
+
+        # Remembered: a plain --apply stays in snapshot mode, only the edit is copied
+        (self.toolkit / "skills" / "test-skill" / "SKILL.md").write_text("edited")
+        r = run_setup(self.toolkit, self.tmp, "--apply")
+        self.assertIn("UPDATED: test-skill", r.stdout)
+        self.assertIn("CURRENT: test-hook.py", r.stdout)
+        self.assertEqual(skill_md.read_text(), "edited")
+        blobs = [p for p in self.home_path(".ai-toolkit-store").rglob("*") if p.is_file()]
+        self.assertEqual(len(blobs), 2)  # the old SKILL.md blob was collected
+
+        # Back to links, then uninstall leaves no store behind
+        r = run_setup(self.toolkit, self.tmp, "--apply", "--mode", "link")
+        self.assertIn("RE-LINKED: test-skill", r.stdout)
+        self.assertTrue(self.home_path("skills", "test-skill").is_symlink())
+        self.assertFalse(self.home_path(".ai-toolkit-store").exists())
+        run_setup(self.toolkit, self.tmp, "--apply", "--mode", "snapshot")
+        run_setup(self.toolkit, self.tmp, "--apply", "--uninstall")
+        self.assertFalse(self.home_path("skills", "test-skill").exists())
+        self.assertFalse(self.home_path(".ai-toolkit-store").exists())
+
+    # -- Test 23b: leaving snapshot mode keeps files the user added to a snapshot --
+
+    @unittest.skipIf(sys.platform == "win32", "snapshot mode is POSIX-only")
+    def test_snapshot_removal_keeps_user_files(self):
+        skill = self.home_path("skills", "test-skill")
+        for leave in (("--apply", "--mode", "link"), ("--apply", "--uninstall")):
+            run_setup(self.toolkit, self.tmp, "--apply", "--mode", "snapshot")
+            (skill / "notes").mkdir()
+            (skill / "notes" / "mine.md").write_text("my notes")
+
+            r = run_setup(self.toolkit, self.tmp, *leave)
+            self.assertIn("LOCAL: test-skill (kept 1 file(s)", r.stdout, leave)
+            self.assertFalse(skill.is_symlink())
+            self.assertEqual(sorted(p.name for p in skill.rglob("*")), ["mine.md", "notes"])
+            shutil.rmtree(skill)
+
+    # -- Test 23c: switching --mode on an already synced home isn't skipped --
+
+    @unittest.skipIf(sys.platform == "win32", "snapshot mode is POSIX-only")
+    def test_mode_switch_on_synced_home(self):
+        skill = self.home_path("skills", "test-skill")
+        state_file = self.home_path(".ai-toolkit-managed.json")
+        run_setup(self.toolkit, self.tmp, "--apply")
+        self.assertIn("All synced", run_setup(self.toolkit, self.tmp, "--apply").stdout)
+
+        r = run_setup(self.toolkit, self.tmp, "--apply", "--mode", "snapshot")
+        self.assertNotIn("All synced", r.stdout)
+        self.assertFalse(skill.is_symlink())
+        self.assertEqual(json.loads(state_file.read_text())["mode"], "snapshot")
+
+        r = run_setup(self.toolkit, self.tmp, "--apply", "--mode", "link")
+        self.assertIn("RE-LINKED: test-skill", r.stdout)
+        self.assertTrue(skill.is_symlink())
+        self.assertNotIn("mode", json.loads(state_file.read_text()))
+        self.assertIn("All synced", run_setup(self.toolkit, self.tmp, "--apply").stdout)
+
+    # -- Test 24: --format json reports the plan; --homes syncs several homes --
+
+    def test_json_plan_and_multiple_homes(self):
+        r = run_setup(self.toolkit, self.tmp, "--format", "json")
+        report = json.loads(r.stdout)
+        self.assertEqual(report["counts"], {"create": 2})
+        self.assertEqual([(p["section"], p["action"], p["name"]) for p in report["plan"]],
+                         [("skills", "CREATE", "test-skill"), ("hooks", "CREATE", "test-hook.py")])
+        self.assertIn("[dry-run] would add: PostToolUse:python3 ~/.claude/hooks/test-hook.py", report["settings"])
+
+        homes = [self.tmp / "vm1", self.tmp / "vm2"]
+        for home in homes:
+            make_home(home)
+        r = run_setup(self.toolkit, self.tmp, "--apply", "--format", "json", "--homes", *map(str, homes))
+        self.assertEqual(r.returncode, 0, r.stdout + r.stderr)
+        result = json.loads(r.stdout)
+        self.assertEqual([h["home"] for h in result["homes"]], [str(h.resolve()) for h in homes])
+        for home in homes:
+            self.assertTrue((home / ".claude" / "skills" / "test-skill").is_symlink())
+            self.assertIn("test-hook.py", (home / ".claude" / "settings.json").read_text())
+        self.assertFalse(self.home_path("skills", "test-skill").exists())  # $HOME untouched
+
+        r = run_setup(self.toolkit, self.tmp, "--format", "json", "--homes", *map(str, homes), "--layer", "/nonexistent")
+        self.assertEqual(r.returncode, 1)
+        self.assertEqual(json.loads(r.stdout)["failed"], 2)
+        self.assertIn("Manifest not found", json.loads(r.stdout)["homes"][0]["error"])
+
 
 if __name__ == "__main__":
     unittest.main()